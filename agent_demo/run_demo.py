@@ -1,6 +1,8 @@
 import asyncio
+import math
 import os
 import random
+import time
 from datetime import datetime
 
 import httpx
@@ -9,6 +11,11 @@ from loguru import logger
 CP_URL = os.getenv("CP_URL", "http://localhost:8080")
 SERVICE = os.getenv("SERVICE", "checkout")
 ENV = os.getenv("ENV", "prod")
+# raw: one POST /signal per request; aggregate: one POST /summaries per metric period
+AGENT_MODE = os.getenv("AGENT_MODE", "raw")
+REQUEST_RATE = float(os.getenv("REQUEST_RATE", "50"))  # simulated requests/s in aggregate mode
+RELATIVE_ACCURACY = 0.01
+_LOG_GAMMA = math.log((1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY))
 
 
 async def send_signal(client: httpx.AsyncClient, latency_ms: float, error: bool):
@@ -27,6 +34,60 @@ async def send_signal(client: httpx.AsyncClient, latency_ms: float, error: bool)
     return resp.json()
 
 
+class IntervalSummary:
+    """Local counts and latency histogram for one flush interval.
+
+    Buckets match the control plane's latency sketch, so the server merges
+    them without re-bucketing.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.zero_count = 0
+        self.bins = {}
+
+    def add(self, latency_ms: float, error: bool):
+        self.count += 1
+        if error:
+            self.errors += 1
+        if latency_ms <= 1e-9:
+            self.zero_count += 1
+        else:
+            i = math.ceil(math.log(latency_ms) / _LOG_GAMMA)
+            self.bins[i] = self.bins.get(i, 0) + 1
+
+    def payload(self):
+        return {
+            "service": SERVICE,
+            "environment": ENV,
+            "count": self.count,
+            "errors": self.errors,
+            "latency": {
+                "relative_accuracy": RELATIVE_ACCURACY,
+                "zero_count": self.zero_count,
+                "bins": self.bins,
+            },
+        }
+
+
+async def send_summary(client: httpx.AsyncClient, summary: IntervalSummary):
+    resp = await client.post(f"{CP_URL}/summaries", json=[summary.payload()], timeout=5.0)
+    resp.raise_for_status()
+    return resp.json()["configs"][SERVICE][ENV]
+
+
+def simulate_request():
+    # Simulate latency and random errors, with occasional spikes
+    base = random.gauss(150, 30)
+    spike = 0.0
+    if random.random() < 0.1:
+        spike = random.uniform(200, 500)
+    latency = max(1.0, base + spike)
+    error = random.random() < (0.01 + (0.1 if spike > 0 else 0))
+    return latency, error
+
+
 async def get_config(client: httpx.AsyncClient):
     resp = await client.get(f"{CP_URL}/config/{SERVICE}/{ENV}", timeout=5.0)
     resp.raise_for_status()
@@ -44,15 +105,20 @@ async def main():
         period_s = int(cfg.get("metric_period_s", 60))
 
         while True:
-            # Simulate latency and random errors, with occasional spikes
-            base = random.gauss(150, 30)
-            spike = 0.0
-            if random.random() < 0.1:
-                spike = random.uniform(200, 500)
-            latency = max(1.0, base + spike)
-            error = random.random() < (0.01 + (0.1 if spike > 0 else 0))
-
-            cfg = await send_signal(client, latency, error)
+            if AGENT_MODE == "aggregate":
+                # Aggregate locally and flush once per metric period
+                summary = IntervalSummary()
+                deadline = time.monotonic() + period_s
+                while time.monotonic() < deadline:
+                    for _ in range(max(1, int(REQUEST_RATE / 10))):
+                        latency, error = simulate_request()
+                        summary.add(latency, error)
+                    await asyncio.sleep(0.1)
+                cfg = await send_summary(client, summary)
+                logger.info("Flushed {} requests ({} errors)", summary.count, summary.errors)
+            else:
+                latency, error = simulate_request()
+                cfg = await send_signal(client, latency, error)
 
             # Adapt local settings on response
             if cfg["log_level"] != log_level:
@@ -75,7 +141,8 @@ async def main():
                     cfg,
                 )
 
-            await asyncio.sleep(max(1, min(period_s, 10)))
+            if AGENT_MODE != "aggregate":
+                await asyncio.sleep(max(1, min(period_s, 10)))
 
 
 if __name__ == "__main__":
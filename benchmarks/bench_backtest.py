@@ -0,0 +1,67 @@
+"""Benchmark: backtest replay speed against real time.
+
+Records ``minutes`` of signals over ``keys`` keys (10 rps each, with an
+error burst on every tenth key) into a write-ahead log, then replays it
+through the default policy and a candidate with a lower error threshold:
+
+- ``serial``: both policies in this process, one after the other
+- ``pool``: both policies split into ``shards`` key shards on a process pool
+  (only faster with more than one core)
+
+    python benchmarks/bench_backtest.py [minutes] [keys] [shards]
+"""
+import sys
+import tempfile
+import time
+
+from control_plane import main
+from control_plane.backtest import backtest, replay
+from control_plane.models import SignalRecord
+from control_plane.persist import WriteAheadLog
+
+
+def record(directory: str, minutes: int, keys: int) -> int:
+    wal = WriteAheadLog(directory, fsync="never")
+    n = 0
+    for second in range(minutes * 60):
+        for k in range(keys):
+            burst = k % 10 == 0 and second % 600 < 60
+            ts = second * 1000
+            wal.append_signals(
+                (f"svc-{k}", "prod"),
+                [SignalRecord(f"svc-{k}", "prod", ts + i * 100, float(20 + i * 7 + k % 50), burst and i < 2, None)
+                 for i in range(10)],
+            )
+            n += 10
+    wal.close()
+    return n
+
+
+def main_(minutes: int, keys: int, shards: int) -> None:
+    candidate = main.POLICY.model_copy(deep=True)
+    candidate.id = "candidate"
+    candidate.rules[0].conditions[0].value = 0.01
+    policies = [main.POLICY, candidate]
+    with tempfile.TemporaryDirectory() as d:
+        start = time.perf_counter()
+        n = record(d, minutes, keys)
+        print(f"{n} signals over {keys} keys, {minutes} min recorded in {time.perf_counter() - start:.2f}s")
+        for mode in ("serial", "pool"):
+            start = time.perf_counter()
+            if mode == "serial":
+                reports = [replay([d], p) for p in policies]
+            else:
+                reports = backtest([d], policies, shards=shards)
+            elapsed = time.perf_counter() - start
+            simulated = reports[0].simulated_s * len(policies)
+            print(f"{mode:>7}: {elapsed:6.2f}s for {len(policies)} policies, {simulated / elapsed:8.0f}x real time")
+            for r in reports:
+                print(f"         {r.policy_id}: {r.rule_hits}, flips {r.rule_flips}, {r.traces:.0f} traces")
+
+
+if __name__ == "__main__":
+    main_(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 30,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 4,
+    )
@@ -0,0 +1,82 @@
+"""Benchmark: config poll throughput for a fleet of polling agents.
+
+Every agent polls ``GET /config/{service}/{environment}`` once per round.
+Three variants are timed in-process through the ASGI app:
+
+- ``model``: the previous handler, returning ``evaluate()`` through
+  ``response_model`` (registered here on a scratch route)
+- ``bytes``: the real handler without ``If-None-Match``, serving cached bytes
+- ``etag``: the real handler with the agent's last ETag, answered with 304
+
+The engine runs on a ManualClock so decisions stay fresh within a round.
+
+    python benchmarks/bench_config_poll.py [agents] [rounds]
+"""
+import asyncio
+import sys
+import time
+
+from control_plane import main
+from control_plane.clock import ManualClock
+from control_plane.models import EffectiveConfig
+
+
+@main.app.get("/bench/config/{service}/{environment}", response_model=EffectiveConfig)
+async def _model_config(service: str, environment: str):
+    return main.evaluate(service, environment)
+
+
+async def _get(path: str, etag=None):
+    # Minimal ASGI call, so the numbers are the app's cost rather than a client's
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": headers, "client": ("bench", 0), "server": ("bench", 80),
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await main.app(scope, receive, send)
+    start = sent[0]
+    return start["status"], dict(start["headers"]).get(b"etag", b"").decode()
+
+
+async def _round(paths, etags=None) -> float:
+    start = time.perf_counter()
+    for i, path in enumerate(paths):
+        await _get(path, etags[i] if etags else None)
+    return time.perf_counter() - start
+
+
+async def run(agents: int, rounds: int) -> None:
+    main.CLOCK = ManualClock(start_ms=1_000_000)
+    keys = [(f"svc-{i}", ("prod", "staging")[i % 2]) for i in range(agents)]
+    paths = [f"/config/{s}/{e}" for s, e in keys]
+    etags = [(await _get(p))[1] for p in paths]
+
+    print(f"{agents} agents, {rounds} rounds")
+    for name, args in (
+        ("model", ([f"/bench{p}" for p in paths],)),
+        ("bytes", (paths,)),
+        ("etag", (paths, etags)),
+    ):
+        elapsed = 0.0
+        for _ in range(rounds):
+            elapsed += await _round(*args)
+        print(f"  {name:5s}: {agents * rounds / elapsed:9.0f} polls/s")
+    print(f"  304s: {main.STATS['config_not_modified']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        run(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 10_000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 3,
+        )
+    )
@@ -0,0 +1,66 @@
+"""Benchmark: per-key evaluation vs. the vectorized fleet evaluator.
+
+Loads random aggregates for N (service, env) keys and times recomputing every
+key's decision under a generated policy, one key at a time through
+``CompiledPolicy.decide`` and in one pass through ``FleetEvaluator``. The fleet
+time includes ``load``, which reads one aggregates dict per key and window
+like the policy upsert does.
+
+    python benchmarks/bench_fleet.py [keys] [rules]
+"""
+import random
+import sys
+import time
+
+from control_plane.fleet import FleetEvaluator
+from control_plane.models import Action, Condition, Policy, Rule
+from control_plane.plan import compile_policy
+
+
+def main() -> None:
+    n_keys = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_rules = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rng = random.Random(3)
+    services = [f"svc-{i}" for i in range(n_keys // 2)]
+
+    rules = [
+        Rule(
+            id=f"r{i}",
+            service=rng.choice(services) if i % 2 else None,
+            environment=rng.choice(("prod", "staging", None)),
+            priority=rng.randint(0, 100),
+            conditions=[
+                Condition(kind="error_rate", op=">", value=rng.random() / 10, window_s=60),
+                Condition(kind="metric", op=">=", key="latency_p95_ms", value=rng.randint(100, 800)),
+            ][: rng.randint(0, 2)],
+            actions=Action(log_level=rng.choice(("DEBUG", "WARN", None)), trace_sample_rate=rng.random()),
+        )
+        for i in range(n_rules)
+    ]
+    plan = compile_policy(Policy(id="bench", rules=rules), 1, 300)
+
+    fleet = FleetEvaluator()
+    values = {}
+    for svc in services:
+        for env in ("prod", "staging"):
+            fleet.key_id((svc, env))
+            values[(svc, env)] = {"error_rate": rng.random() / 5, "latency_p95_ms": rng.uniform(50, 1000)}
+
+    start = time.perf_counter()
+    for key, v in values.items():
+        plan.decide(*key, lambda ref: v[ref.name])
+    per_key = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fleet.load(plan.refs, lambda key, window_s: values[key])
+    load = time.perf_counter() - start
+    result = fleet.evaluate(plan)
+    print(f"{len(values)} keys, {len(plan.rules)} rules")
+    print(f"  per-key decide: {per_key * 1000:9.1f} ms")
+    print(f"  fleet load:     {load * 1000:9.1f} ms")
+    print(f"  fleet evaluate: {result.elapsed_ms:9.1f} ms ({len(result.changed)} changed)")
+    print(f"  fleet total:    {load * 1000 + result.elapsed_ms:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Memory benchmark: bytes per retained signal in the window.
+
+Compares a deque of pydantic ``Signal`` objects (the original window
+representation) with the column-oriented ``SignalWindow`` plus its interned
+attrs, with and without a per-signal ``{"host": ...}`` attrs mapping.
+
+    python benchmarks/bench_memory.py [signals]
+"""
+import sys
+import tracemalloc
+from collections import deque
+from datetime import datetime, timedelta
+
+from control_plane.intern import AttrTable
+from control_plane.models import Signal
+from control_plane.window import SignalWindow
+
+HOSTS = [f"host-{i:03d}" for i in range(50)]
+
+
+def _measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    t0 = datetime(2024, 1, 1)
+
+    def attrs(i, with_attrs):
+        # Parsed JSON gives every signal its own dict and strings
+        return {"host": "".join(HOSTS[i % len(HOSTS)])} if with_attrs else {}
+
+    for with_attrs in (False, True):
+        def pydantic_deque():
+            buf = deque()
+            for i in range(n):
+                buf.append(
+                    Signal(
+                        service="svc",
+                        environment="prod",
+                        ts=t0 + timedelta(milliseconds=i),
+                        latency_ms=100.0 + i % 50,
+                        error=i % 10 == 0,
+                        attrs=attrs(i, with_attrs),
+                    )
+                )
+            return buf
+
+        def columns():
+            buf, table = SignalWindow(), AttrTable()
+            for i in range(n):
+                buf.append(i, 100.0 + i % 50, i % 10 == 0, table.encode(attrs(i, with_attrs)))
+            return buf, table
+
+        label = "with attrs" if with_attrs else "no attrs"
+        for name, build in (("pydantic deque", pydantic_deque), ("SignalWindow", columns)):
+            size = _measure(build)
+            print(f"{label:>10} {name:>15}: {size / n:8.1f} bytes/signal")
+
+
+if __name__ == "__main__":
+    main()
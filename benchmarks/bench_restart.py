@@ -0,0 +1,113 @@
+"""Benchmark: restart-to-ready time with a warm data directory.
+
+A child process ingests ``signals`` signals over ``keys`` keys with
+``CP_DATA_DIR`` set, then exits one of two ways:
+
+- ``log``: it dies without the shutdown snapshot, so the restart replays
+  the whole write-ahead log
+- ``snapshot``: it shuts down gracefully, so the restart maps the final
+  snapshot and replays nothing
+
+A second child then starts the app and reports the time from process start
+to the end of startup (split into import and restore), and how many
+signals it holds.
+
+    python benchmarks/bench_restart.py [signals] [keys]
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+START = time.perf_counter()
+
+
+def fill(signals: int, keys: int, crash: bool) -> None:
+    from control_plane import main
+    from control_plane.models import SignalRecord
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            batch = 1_000
+            for n in range(0, signals, batch):
+                now = main.CLOCK.now_ms()
+                main._ingest(
+                    SignalRecord(
+                        f"svc-{i % keys}", "prod", now, float(i % 500), i % 50 == 0,
+                        {"pod": f"p{i % 8}"} if i % 10 == 0 else None,
+                    )
+                    for i in range(n, n + batch)
+                )
+            if crash:
+                main.WAL.flush(sync=True)
+                print(json.dumps({"wal_bytes": main.WAL.stats()["wal_bytes"]}), flush=True)
+                os._exit(0)
+
+    asyncio.run(scenario())
+
+
+def restart() -> None:
+    from control_plane import main
+
+    imported = time.perf_counter()
+    restored = {}
+
+    async def scenario():
+        async with main.lifespan(main.app):
+            restored["ready"] = time.perf_counter()
+            restored["signals"] = sum(len(w) for w in main.SIGNALS.values())
+
+    restore = main.restore
+
+    def timed(directory):
+        out = restore(directory)
+        restored.update(out)
+        return out
+
+    main.restore = timed
+    asyncio.run(scenario())
+    print(json.dumps({
+        "import_s": imported - START,
+        "restore_s": restored["ready"] - imported,
+        "total_s": restored["ready"] - START,
+        "signals": restored["signals"],
+        "replayed_signals": restored["replayed_signals"],
+        "snapshot_keys": restored["snapshot_keys"],
+    }))
+
+
+def _child(*args: str, data_dir: str) -> dict:
+    env = {**os.environ, "CP_DATA_DIR": data_dir, "CP_SNAPSHOT_INTERVAL_S": "0", "PYTHONPATH": os.getcwd()}
+    out = subprocess.run([sys.executable, __file__, *args], env=env, check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1]) if out.stdout.strip() else {}
+
+
+def main(signals: int, keys: int) -> None:
+    print(f"{signals} signals over {keys} keys")
+    for mode in ("log", "snapshot"):
+        with tempfile.TemporaryDirectory() as data_dir:
+            start = time.perf_counter()
+            _child("--fill", str(signals), str(keys), str(mode == "log"), data_dir=data_dir)
+            fill_s = time.perf_counter() - start
+            size = sum(os.path.getsize(os.path.join(data_dir, n)) for n in os.listdir(data_dir))
+            r = _child("--restart", data_dir=data_dir)
+            print(
+                f"{mode:>8}: fill {fill_s:6.2f}s, {size / 1e6:6.1f} MB on disk, "
+                f"ready in {r['total_s']:.2f}s (import {r['import_s']:.2f}s + restore {r['restore_s']:.2f}s), "
+                f"{r['signals']} signals back, {r['replayed_signals']} replayed"
+            )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--fill"]:
+        fill(int(sys.argv[2]), int(sys.argv[3]), sys.argv[4] == "True")
+    elif sys.argv[1:2] == ["--restart"]:
+        restart()
+    else:
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 200,
+        )
@@ -0,0 +1,63 @@
+"""Micro-benchmark: list-comprehension pruning vs. SignalWindow.
+
+Simulates a steady stream of signals for one hot key with a synthetic clock
+and measures the per-ingest cost of append + prune for both strategies.
+
+    python benchmarks/bench_window.py [rate_per_s] [window_s] [seconds]
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from control_plane.models import Signal
+from control_plane.window import SignalWindow
+
+
+def _signals(rate: int, seconds: int) -> List[Signal]:
+    t0 = datetime(2024, 1, 1)
+    step = timedelta(seconds=1.0 / rate)
+    return [
+        Signal(service="svc", environment="prod", ts=t0 + step * i, latency_ms=100.0, error=False)
+        for i in range(rate * seconds)
+    ]
+
+
+def bench_list(signals: List[Signal], window: timedelta) -> float:
+    # Mirrors the original `_prune`: rebuild the whole list on every ingest.
+    buf: List[Signal] = []
+    start = time.perf_counter()
+    for s in signals:
+        buf.append(s)
+        cutoff = s.ts - window
+        buf = [x for x in buf if x.ts >= cutoff]
+    return time.perf_counter() - start
+
+
+def bench_window(signals: List[Signal], window: timedelta) -> float:
+    buf = SignalWindow()
+    span = int(window.total_seconds() * 1000)
+    rows = [(int(s.ts.timestamp() * 1000), s.latency_ms, s.error) for s in signals]
+    start = time.perf_counter()
+    for ts, latency_ms, error in rows:
+        buf.append(ts, latency_ms, error)
+        buf.prune(ts - span)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    rate = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    window_s = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    seconds = int(sys.argv[3]) if len(sys.argv) > 3 else 30
+    signals = _signals(rate, seconds)
+    window = timedelta(seconds=window_s)
+    retained = rate * window_s
+
+    print(f"{len(signals)} signals, ~{retained} retained per key")
+    for name, fn in (("list", bench_list), ("window", bench_window)):
+        elapsed = fn(signals, window)
+        print(f"{name:>8}: {elapsed:8.3f}s total  {elapsed / len(signals) * 1e6:10.2f} us/ingest")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from control_plane.models import LatencyHistogram
+from control_plane.sketch import LatencySketch, Sketch, new_sketch
+
+# (resolution_s, span_s): 1s buckets for the last minute plus 10s and 60s
+# buckets for the last five minutes (WINDOW_MAX).
+LEVELS: Tuple[Tuple[int, int], ...] = ((1, 60), (10, 300), (60, 300))
+
+
+class Bucket:
+    """Count, error count and latency sketch for one time slice of a key."""
+
+    __slots__ = ("start", "count", "errors", "latency")
+
+    def __init__(self, start: int, exact: bool = False, relative_accuracy: Optional[float] = None) -> None:
+        self.start = start
+        self.count = 0
+        self.errors = 0
+        self.latency: Sketch = (
+            LatencySketch(relative_accuracy) if relative_accuracy is not None and not exact else new_sketch(exact)
+        )
+
+    def add(self, latency_ms: Optional[float], error: Optional[bool]) -> None:
+        self.count += 1
+        if error:
+            self.errors += 1
+        if latency_ms is not None:
+            self.latency.add(latency_ms)
+
+    def add_summary(self, count: int, errors: int, latency: Optional[LatencyHistogram]) -> None:
+        self.count += count
+        self.errors += errors
+        if latency is not None:
+            self.latency.add_bins(latency.relative_accuracy, latency.zero_count, latency.bins)
+
+    def merge(self, other: "Bucket") -> None:
+        self.count += other.count
+        self.errors += other.errors
+        self.latency.merge(other.latency)
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / max(1, self.count)
+
+
+class _Level:
+    __slots__ = ("res", "span", "slots")
+
+    def __init__(self, res: int, span: int) -> None:
+        self.res = res
+        self.span = span
+        self.slots: List[Optional[Bucket]] = [None] * (span // res + 1)
+
+    def retained(self, start: int, now_s: int) -> bool:
+        # A bucket is still in the ring until its slot is reused.
+        return start > now_s - now_s % self.res - len(self.slots) * self.res
+
+    def get(self, start: int) -> Optional[Bucket]:
+        b = self.slots[(start // self.res) % len(self.slots)]
+        return b if b is not None and b.start == start else None
+
+
+class WindowAggregates:
+    """Multi-resolution time-bucketed aggregates for one (service, env) key.
+
+    Every signal is added to the current bucket of each level, and a rolling
+    window is answered by merging a handful of buckets: the fine levels cover
+    the ragged edges and the coarse levels cover the middle. Window edges
+    older than a level's span fall back to the next coarser resolution, so a
+    window may overshoot by less than one coarse bucket.
+    """
+
+    __slots__ = ("exact", "levels", "generation")
+
+    def __init__(self, exact: bool = False, levels: Tuple[Tuple[int, int], ...] = LEVELS) -> None:
+        self.exact = exact
+        self.levels = [_Level(res, span) for res, span in levels]
+        # Bumped on every add so callers can tell the buckets changed
+        self.generation = 0
+
+    def _current(self, ts_ms: int) -> Iterator[Bucket]:
+        # The bucket containing ts_ms at every level, started afresh if stale
+        self.generation += 1
+        sec = ts_ms // 1000
+        for level in self.levels:
+            start = sec - sec % level.res
+            i = (start // level.res) % len(level.slots)
+            b = level.slots[i]
+            if b is None or b.start != start:
+                b = level.slots[i] = Bucket(start, self.exact)
+            yield b
+
+    def add(self, ts_ms: int, latency_ms: Optional[float], error: Optional[bool]) -> None:
+        for b in self._current(ts_ms):
+            b.add(latency_ms, error)
+
+    def add_many(self, signals: Iterable[Tuple[int, Optional[float], Optional[bool]]]) -> None:
+        for ts_ms, latency_ms, error in signals:
+            self.add(ts_ms, latency_ms, error)
+
+    def add_summary(
+        self, ts_ms: int, count: int, errors: int, latency: Optional[LatencyHistogram] = None
+    ) -> None:
+        """Merge a pre-aggregated interval reported by an agent.
+
+        The whole interval is attributed to the buckets containing ``ts_ms``.
+        """
+        for b in self._current(ts_ms):
+            b.add_summary(count, errors, latency)
+
+    def buckets(self) -> Iterator[Tuple[int, Bucket]]:
+        """(level resolution, bucket) for every bucket held in the rings."""
+        for level in self.levels:
+            for b in level.slots:
+                if b is not None:
+                    yield level.res, b
+
+    def restore(self, res: int, bucket: Bucket) -> bool:
+        """Put a bucket from ``buckets`` back into the level of resolution ``res``."""
+        for level in self.levels:
+            if level.res == res:
+                level.slots[(bucket.start // res) % len(level.slots)] = bucket
+                self.generation += 1
+                return True
+        return False
+
+    def select(self, now_ms: int, window_s: int, copy_live: bool = False) -> Tuple[int, List[Bucket]]:
+        """Start of the window and the buckets that cover it.
+
+        With ``copy_live`` the buckets still receiving signals are copied, so
+        the result can be merged off the event loop while ingest continues;
+        older buckets are never written again.
+        """
+        now_s = now_ms // 1000
+        lo, cover = cover_window(self.levels, now_s, window_s)
+        picked: List[Bucket] = []
+        for level, start in cover:
+            b = level.get(start)
+            if b is not None:
+                if copy_live and start + level.res > now_s:
+                    live, b = b, Bucket(start, self.exact)
+                    b.merge(live)
+                picked.append(b)
+        return lo, picked
+
+    def query(self, now_ms: int, window_s: int) -> Bucket:
+        """Merged aggregates over the ``window_s`` seconds ending at ``now_ms``."""
+        lo, picked = self.select(now_ms, window_s)
+        return merge_buckets(lo, picked, self.exact)
+
+
+def cover_window(levels: Sequence[_Level], now_s: int, window_s: int) -> Tuple[int, List[Tuple[_Level, int]]]:
+    """Start of the window ending at ``now_s`` and the (level, bucket start) pairs covering it."""
+    hi = now_s + 1
+    lo = hi - window_s
+    cover: List[Tuple[_Level, int]] = []
+    t = hi
+    while t > lo:
+        # Largest aligned bucket that ends at t and fits inside the window
+        for level in reversed(levels):
+            start = t - level.res
+            if t % level.res == 0 and start >= lo and level.retained(start, now_s):
+                break
+        else:
+            # Fine buckets have expired: take the finest one still covering t - 1
+            for level in levels:
+                start = (t - 1) - (t - 1) % level.res
+                if level.retained(start, now_s):
+                    break
+            else:
+                break
+        cover.append((level, start))
+        t = start
+    return lo, cover
+
+
+def merge_buckets(start: int, buckets: List[Bucket], exact: bool = False) -> Bucket:
+    # Sketches are merged at the accuracy of the inputs
+    accuracy = getattr(buckets[0].latency, "relative_accuracy", None) if buckets else None
+    out = Bucket(start, exact, accuracy)
+    for b in buckets:
+        out.merge(b)
+    return out
+
+
+def merge_cost(buckets: Iterable[Bucket]) -> int:
+    """Entries merging ``buckets`` walks: sketch bins, or every value in exact mode."""
+    return sum(len(b.latency.bins) if isinstance(b.latency, LatencySketch) else b.latency.count for b in buckets)
+
+
+def summarize(b: Bucket) -> Dict[str, float]:
+    """The aggregates rule conditions read (plan.AGGREGATE_NAMES) from a merged bucket."""
+    return {"latency_p95_ms": float(b.latency.quantile(0.95)), "error_rate": b.error_rate}
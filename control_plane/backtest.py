@@ -0,0 +1,282 @@
+"""Policy backtests: replay a recorded signal log through candidate policies.
+
+The log is the write-ahead log of a control plane run with ``CP_DATA_DIR``
+(plus ``CP_WAL_ARCHIVE_DIR`` to keep the segments snapshots cover):
+
+    python -m control_plane.backtest --log archive/ --log data/ candidate.json current.json
+
+Each policy file holds a policy, or ``{"policy": ...}`` as posted to
+``/policy``.
+"""
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from control_plane.aggregates import WindowAggregates, summarize
+from control_plane.clock import ManualClock
+from control_plane.models import EffectiveConfig, Policy
+from control_plane.persist import REC_SIGNALS, REC_SUMMARY, decode_signals, decode_summary, read_log
+from control_plane.plan import AggregateRef, compile_policy
+
+Key = Tuple[str, str]
+
+# Rough log lines emitted per request at each level, for the volume estimate
+LOG_LINES_PER_REQUEST: Dict[str, float] = {"DEBUG": 10.0, "INFO": 1.0, "WARN": 0.2, "ERROR": 0.05}
+
+
+class BacktestReport(NamedTuple):
+    policy_id: str
+    keys: int
+    signals: int
+    evaluations: int  # keys evaluated per step, summed over steps
+    rule_hits: Dict[str, int]  # evaluations in which each rule matched
+    rule_flips: Dict[str, int]  # times each rule started or stopped matching for a key
+    config_flips: int  # times a key's effective config changed
+    traces: float  # signals times the trace sample rate in effect
+    log_lines: float  # signals times LOG_LINES_PER_REQUEST of the level in effect
+    metric_points: float  # metric flushes per key at the period in effect
+    simulated_s: float
+    elapsed_s: float
+
+    @property
+    def speedup(self) -> float:
+        return self.simulated_s / self.elapsed_s if self.elapsed_s else 0.0
+
+
+class _KeyState:
+    __slots__ = ("agg", "last_ms", "pending", "bands", "matched", "config")
+
+    def __init__(self) -> None:
+        self.agg = WindowAggregates()
+        self.last_ms = 0
+        self.pending = 0  # signals since the last step
+        self.bands: Optional[Tuple[int, ...]] = None
+        self.matched = 0
+        self.config: Optional[EffectiveConfig] = None
+
+
+def _in_shard(key: Key, shard: Tuple[int, int]) -> bool:
+    return shard[1] == 1 or zlib.crc32(f"{key[0]}\0{key[1]}".encode()) % shard[1] == shard[0]
+
+
+def replay(
+    logs: Sequence[str],
+    policy: Policy,
+    step_s: int = 1,
+    max_window_s: int = 300,
+    shard: Tuple[int, int] = (0, 1),
+) -> BacktestReport:
+    """Replay the log directories ``logs`` (oldest first) through ``policy``.
+
+    Signals and summaries go into per-key time buckets as they did on the
+    live engine, and every ``step_s`` of simulated time each key with
+    signals in the last ``max_window_s`` is evaluated with the compiled
+    plan, the way the watch refresher re-evaluates keys. Only keys in
+    ``shard`` (index, count) are replayed, so one policy can be split
+    across processes.
+    """
+    started = time.perf_counter()
+    plan = compile_policy(policy, 1, max_window_s)
+    clock = ManualClock()
+    step_ms = step_s * 1000
+    keys: Dict[Key, _KeyState] = {}
+    hits: Dict[Tuple[Key, int], int] = {}  # (key, matched bitmap) -> steps
+    rule_flips: Dict[str, int] = {}
+    totals = {"signals": 0, "evaluations": 0, "config_flips": 0, "traces": 0.0, "log_lines": 0.0, "metric_points": 0.0}
+    first_ms: Optional[int] = None
+    next_ms = 0
+    base_offset: Optional[int] = None
+
+    def step(now_ms: int) -> None:
+        clock.set(now_ms)
+        active_after = now_ms - max_window_s * 1000
+        for key, st in keys.items():
+            if st.last_ms < active_after:
+                continue
+            service, env = key
+            windows: Dict[int, Dict[str, float]] = {}
+
+            def value(ref: AggregateRef) -> float:
+                a = windows.get(ref.window_s)
+                if a is None:
+                    a = windows[ref.window_s] = summarize(st.agg.query(clock.now_ms(), ref.window_s))
+                return a[ref.name]
+
+            bands = plan.bands(service, env, value)
+            matched = st.matched if bands == st.bands else plan.matched(service, env, value)
+            if st.config is None or matched != st.matched:
+                config = plan.apply(service, env, matched)
+                if st.config is not None:
+                    candidates = plan.scopes.candidates(service, env)
+                    for i, rule in enumerate(candidates):
+                        if (matched ^ st.matched) >> i & 1:
+                            rule_flips[rule.id] = rule_flips.get(rule.id, 0) + 1
+                    if config != st.config:
+                        totals["config_flips"] += 1
+            else:
+                config = st.config
+            # Signals since the last step arrived under the config then in effect
+            in_effect = st.config or config
+            totals["traces"] += st.pending * in_effect.trace_sample_rate
+            totals["log_lines"] += st.pending * LOG_LINES_PER_REQUEST.get(in_effect.log_level, 1.0)
+            totals["metric_points"] += step_s / in_effect.metric_period_s
+            st.pending = 0
+            st.bands, st.matched, st.config = bands, matched, config
+            hits[(key, matched)] = hits.get((key, matched), 0) + 1
+            totals["evaluations"] += 1
+
+    def advance(ts_ms: int) -> None:
+        nonlocal first_ms, next_ms
+        if first_ms is None:
+            first_ms = ts_ms
+            next_ms = ts_ms - ts_ms % step_ms + step_ms
+        while ts_ms >= next_ms:
+            step(next_ms)
+            next_ms += step_ms
+
+    for log in logs:
+        for rec in read_log(log):
+            if base_offset is None:
+                base_offset = rec.wall_offset_ms
+            shift_ms = rec.wall_offset_ms - base_offset
+            if rec.rtype == REC_SIGNALS:
+                key, signals = decode_signals(rec.payload, shift_ms)
+                if not _in_shard(key, shard):
+                    continue
+                st = keys.get(key)
+                if st is None:
+                    st = keys[key] = _KeyState()
+                for s in signals:
+                    if first_ms is None or s.ts_ms >= next_ms:
+                        advance(s.ts_ms)
+                    st.agg.add(s.ts_ms, s.latency_ms, s.error)
+                st.last_ms = max(st.last_ms, signals[-1].ts_ms)
+                st.pending += len(signals)
+                totals["signals"] += len(signals)
+            elif rec.rtype == REC_SUMMARY:
+                ts_ms, sm = decode_summary(rec.payload, shift_ms)
+                key = (sm.service, sm.environment)
+                if not _in_shard(key, shard):
+                    continue
+                advance(ts_ms)
+                st = keys.get(key)
+                if st is None:
+                    st = keys[key] = _KeyState()
+                st.agg.add_summary(ts_ms, sm.count, min(sm.errors, sm.count), sm.latency)
+                st.last_ms = max(st.last_ms, ts_ms)
+                st.pending += sm.count
+                totals["signals"] += sm.count
+    if first_ms is not None:
+        # Close the step holding the last signal
+        step(next_ms)
+
+    rule_hits = {rule.id: 0 for rule in plan.rules}
+    for (key, matched), n in hits.items():
+        for i, rule in enumerate(plan.scopes.candidates(*key)):
+            if matched >> i & 1:
+                rule_hits[rule.id] += n
+    return BacktestReport(
+        policy_id=policy.id,
+        keys=len(keys),
+        rule_hits=rule_hits,
+        rule_flips={rule.id: rule_flips.get(rule.id, 0) for rule in plan.rules},
+        simulated_s=(next_ms - first_ms) / 1000 if first_ms is not None else 0.0,
+        elapsed_s=time.perf_counter() - started,
+        **totals,
+    )
+
+
+def merge_reports(reports: Sequence[BacktestReport]) -> BacktestReport:
+    """Combine the reports of one policy's shards."""
+    first = reports[0]
+
+    def total(field: str):
+        return sum(getattr(r, field) for r in reports)
+
+    def by_rule(field: str) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for r in reports:
+            for rule_id, n in getattr(r, field).items():
+                out[rule_id] = out.get(rule_id, 0) + n
+        return out
+
+    return first._replace(
+        keys=total("keys"),
+        signals=total("signals"),
+        evaluations=total("evaluations"),
+        rule_hits=by_rule("rule_hits"),
+        rule_flips=by_rule("rule_flips"),
+        config_flips=total("config_flips"),
+        traces=total("traces"),
+        log_lines=total("log_lines"),
+        metric_points=total("metric_points"),
+        simulated_s=max(r.simulated_s for r in reports),
+        elapsed_s=max(r.elapsed_s for r in reports),
+    )
+
+
+def backtest(
+    logs: Sequence[str],
+    policies: Sequence[Policy],
+    step_s: int = 1,
+    shards: int = 1,
+    workers: Optional[int] = None,
+) -> List[BacktestReport]:
+    """Replay ``logs`` through every policy, in parallel on a process pool.
+
+    Each policy is split into ``shards`` key shards, and every (policy,
+    shard) pair is one task. Workers are spawned rather than forked so the
+    pool is safe to start from a process running other threads.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        futures = [
+            [pool.submit(replay, logs, policy, step_s, 300, (i, shards)) for i in range(shards)]
+            for policy in policies
+        ]
+        return [merge_reports([f.result() for f in fs]) for fs in futures]
+
+
+def _load_policy(path: str) -> Policy:
+    with open(path) as f:
+        data = json.load(f)
+    return Policy.model_validate(data.get("policy", data))
+
+
+def _format(r: BacktestReport) -> str:
+    lines = [
+        f"policy {r.policy_id}: {r.keys} keys, {r.signals} signals, "
+        f"{r.simulated_s:.0f}s simulated in {r.elapsed_s:.2f}s ({r.speedup:.0f}x real time)",
+        f"  config flips: {r.config_flips}",
+        f"  telemetry: {r.traces:.0f} traces, {r.log_lines:.0f} log lines, {r.metric_points:.0f} metric flushes",
+    ]
+    for rule_id, n in r.rule_hits.items():
+        share = n / r.evaluations if r.evaluations else 0.0
+        lines.append(f"  {rule_id}: matched {n} evaluations ({share:.1%}), flipped {r.rule_flips[rule_id]} times")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("policies", nargs="+", help="policy JSON files")
+    parser.add_argument("--log", action="append", required=True, help="log directory, oldest first; repeatable")
+    parser.add_argument("--step-s", type=int, default=1, help="simulated seconds between evaluations")
+    parser.add_argument("--shards", type=int, default=1, help="key shards per policy")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--json", action="store_true", help="print reports as JSON")
+    args = parser.parse_args(argv)
+    reports = backtest(args.log, [_load_policy(p) for p in args.policies], args.step_s, args.shards, args.workers)
+    if args.json:
+        json.dump([r._asdict() for r in reports], sys.stdout, indent=2)
+        print()
+    else:
+        print("\n\n".join(_format(r) for r in reports))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Protocol
+
+
+class Clock(Protocol):
+    """Millisecond clock the engine reads; wall time only at the API edge."""
+
+    def now_ms(self) -> int: ...
+
+    def to_wall(self, ms: int) -> datetime: ...
+
+    @property
+    def wall_offset_ms(self) -> int: ...
+
+    def rebase(self, wall_offset_ms: int) -> None: ...
+
+
+class MonotonicClock:
+    """Integer-millisecond monotonic clock with an optional coarse cache.
+
+    While ``run`` is ticking on the event loop, ``now_ms`` returns a cached
+    reading refreshed every ``resolution_ms``; otherwise it reads
+    ``time.monotonic_ns`` directly. Wall-clock conversion uses the offset
+    captured at construction, so it is immune to later clock steps.
+    ``rebase`` shifts the readings so they continue the time base of an
+    earlier process (see persist.py).
+    """
+
+    def __init__(self, resolution_ms: int = 5) -> None:
+        self.resolution_ms = resolution_ms
+        self._cached: Optional[int] = None
+        self._shift_ms = 0
+        self._wall_offset_ms = time.time_ns() // 1_000_000 - time.monotonic_ns() // 1_000_000
+
+    def now_ms(self) -> int:
+        cached = self._cached
+        return cached if cached is not None else time.monotonic_ns() // 1_000_000 + self._shift_ms
+
+    @property
+    def wall_offset_ms(self) -> int:
+        return self._wall_offset_ms
+
+    def rebase(self, wall_offset_ms: int) -> None:
+        """Keep wall time, but read engine ms as ``wall - wall_offset_ms``."""
+        self._shift_ms += self._wall_offset_ms - wall_offset_ms
+        self._wall_offset_ms = wall_offset_ms
+        if self._cached is not None:
+            self._cached = time.monotonic_ns() // 1_000_000 + self._shift_ms
+
+    def to_wall(self, ms: int) -> datetime:
+        return datetime(1970, 1, 1) + timedelta(milliseconds=ms + self._wall_offset_ms)
+
+    async def run(self) -> None:
+        interval = self.resolution_ms / 1000
+        try:
+            while True:
+                self._cached = time.monotonic_ns() // 1_000_000 + self._shift_ms
+                await asyncio.sleep(interval)
+        finally:
+            self._cached = None
+
+
+class ManualClock:
+    """Deterministic clock for tests, benchmarks and replays."""
+
+    def __init__(self, start_ms: int = 0, wall_epoch_ms: int = 1_700_000_000_000) -> None:
+        self._now = start_ms
+        self._wall_offset_ms = wall_epoch_ms - start_ms
+
+    def now_ms(self) -> int:
+        return self._now
+
+    def advance(self, ms: int) -> int:
+        self._now += ms
+        return self._now
+
+    def set(self, ms: int) -> None:
+        self._now = ms
+
+    @property
+    def wall_offset_ms(self) -> int:
+        return self._wall_offset_ms
+
+    def rebase(self, wall_offset_ms: int) -> None:
+        self._now += self._wall_offset_ms - wall_offset_ms
+        self._wall_offset_ms = wall_offset_ms
+
+    def to_wall(self, ms: int) -> datetime:
+        return datetime(1970, 1, 1) + timedelta(milliseconds=ms + self._wall_offset_ms)
@@ -0,0 +1,147 @@
+import hashlib
+import logging
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str]
+
+# Set on requests one node forwards to another so they are never forwarded again
+FORWARDED_HEADER = "x-cp-forwarded"
+# How requests for keys owned by another node are handled
+ROUTING_MODES = ("forward", "redirect")
+
+
+def _hash(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring of node ids with ``vnodes`` points per node.
+
+    A key is owned by the first point clockwise from its hash, so adding or
+    removing a node only moves the keys between that node's points and
+    their predecessors (about 1/N of them).
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = 64) -> None:
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self._nodes: set = set()
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self._nodes)
+
+    def _rebuild(self) -> None:
+        points = sorted((_hash(f"{node}#{v}"), node) for node in self._nodes for v in range(self.vnodes))
+        self._points = [p for p, _ in points]
+        self._owners = [n for _, n in points]
+
+    def add(self, node: str) -> None:
+        if node not in self._nodes:
+            self._nodes.add(node)
+            self._rebuild()
+
+    def remove(self, node: str) -> None:
+        if node in self._nodes:
+            self._nodes.discard(node)
+            self._rebuild()
+
+    def owner(self, key: Key) -> Optional[str]:
+        if not self._points:
+            return None
+        i = bisect_right(self._points, _hash(f"{key[0]}\0{key[1]}"))
+        return self._owners[i % len(self._owners)]
+
+
+class Cluster:
+    """This node's view of the cluster and the HTTP client used to reach peers.
+
+    Node ids are base URLs (``http://127.0.0.1:8001``). In ``forward`` mode a
+    request for another node's key is proxied to the owner; in ``redirect``
+    mode the client gets a 307 to the owner's URL.
+    """
+
+    def __init__(
+        self,
+        self_url: str,
+        nodes: Iterable[str] = (),
+        mode: str = "forward",
+        vnodes: int = 64,
+        timeout_s: float = 5.0,
+    ) -> None:
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"unknown cluster routing mode {mode!r}")
+        self.self_url = self_url.rstrip("/")
+        self.mode = mode
+        self.timeout_s = timeout_s
+        self.ring = HashRing({self.self_url, *(n.rstrip("/") for n in nodes if n)}, vnodes)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.forwarded = 0
+        self.redirected = 0
+
+    def start(self) -> None:
+        self._client = httpx.AsyncClient(timeout=self.timeout_s)
+
+    async def stop(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def owner(self, key: Key) -> str:
+        return self.ring.owner(key) or self.self_url
+
+    def is_local(self, key: Key) -> bool:
+        return self.owner(key) == self.self_url
+
+    def set_nodes(self, nodes: Iterable[str]) -> bool:
+        """Replace the membership; returns whether it changed.
+
+        A membership without this node means it was removed: it then owns
+        no keys and routes every request to the remaining nodes.
+        """
+        wanted = {n.rstrip("/") for n in nodes if n} or {self.self_url}
+        current = set(self.ring.nodes)
+        for node in current - wanted:
+            self.ring.remove(node)
+        for node in wanted - current:
+            self.ring.add(node)
+        return wanted != current
+
+    async def forward(
+        self, owner: str, method: str, path: str, query: str, headers: Mapping[str, str], body: bytes
+    ) -> httpx.Response:
+        if self._client is None:
+            raise RuntimeError("cluster client is not running")
+        self.forwarded += 1
+        url = f"{owner}{path}" + (f"?{query}" if query else "")
+        keep = {k: v for k, v in headers.items() if k in ("content-type", "accept", "if-none-match")}
+        return await self._client.request(method, url, headers={**keep, FORWARDED_HEADER: "1"}, content=body)
+
+    async def broadcast(self, path: str, payload: dict, nodes: Iterable[str]) -> Dict[str, bool]:
+        """POST ``payload`` to every node but this one; best effort."""
+        results = {}
+        for node in nodes:
+            if node == self.self_url:
+                continue
+            try:
+                resp = await self._client.post(f"{node}{path}", json=payload, headers={FORWARDED_HEADER: "1"})
+                results[node] = resp.is_success
+            except httpx.HTTPError as e:
+                logger.warning("failed to reach %s: %s", node, e)
+                results[node] = False
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "cluster_nodes": len(self.ring.nodes),
+            "cluster_forwarded": self.forwarded,
+            "cluster_redirected": self.redirected,
+        }
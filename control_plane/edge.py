@@ -0,0 +1,247 @@
+"""Edge aggregator: absorbs raw signal traffic and forwards per-key summaries upstream.
+
+Run one per cluster in front of the control plane (or in front of another
+edge, for more tiers):
+
+    CP_UPSTREAM=http://control-plane:8080 uvicorn control_plane.edge:app --port 8081
+
+Agents talk to it as they would to the control plane. Every
+``CP_EDGE_FLUSH_S`` seconds the buffered summaries go to the upstream's
+``POST /summaries``, and the configs it answers with are what ``/signal``
+and ``/config`` return until the next flush. Keys that are only polled
+are fetched from the upstream at most once per flush interval. A clustered
+upstream routes each summary to its key's owner; summaries it reports as
+``unavailable`` stay buffered for the next flush.
+"""
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+
+from control_plane.models import (
+    EffectiveConfig,
+    LatencyHistogram,
+    SignalBatchResult,
+    SignalIn,
+    SummaryIn,
+    json_safe_errors,
+)
+from control_plane.sketch import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str]
+
+
+class _Acc:
+    __slots__ = ("count", "errors", "latency")
+
+    def __init__(self, relative_accuracy: float) -> None:
+        self.count = 0
+        self.errors = 0
+        self.latency = LatencySketch(relative_accuracy)
+
+
+class EdgeBuffer:
+    """Per-key counts, error counts and latency sketches since the last drain.
+
+    Raw signals and summaries from lower tiers fold into the same state, and
+    folding only adds counts and sketch bins, so the result does not depend
+    on how the input was grouped or ordered across tiers.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        self.relative_accuracy = relative_accuracy
+        self._keys: Dict[Key, _Acc] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _acc(self, key: Key) -> _Acc:
+        acc = self._keys.get(key)
+        if acc is None:
+            acc = self._keys[key] = _Acc(self.relative_accuracy)
+        return acc
+
+    def add_signal(self, sig: SignalIn) -> None:
+        acc = self._acc((sig.service, sig.environment))
+        acc.count += 1
+        if sig.error:
+            acc.errors += 1
+        if sig.latency_ms is not None:
+            acc.latency.add(sig.latency_ms)
+
+    def add_summary(self, sm: SummaryIn) -> None:
+        acc = self._acc((sm.service, sm.environment))
+        acc.count += sm.count
+        acc.errors += min(sm.errors, sm.count)
+        if sm.latency is not None:
+            acc.latency.add_bins(sm.latency.relative_accuracy, sm.latency.zero_count, sm.latency.bins)
+
+    def drain(self) -> List[SummaryIn]:
+        keys, self._keys = self._keys, {}
+        return [
+            SummaryIn(
+                service=service,
+                environment=env,
+                count=acc.count,
+                errors=acc.errors,
+                latency=LatencyHistogram(
+                    relative_accuracy=acc.latency.relative_accuracy,
+                    zero_count=acc.latency.zero_count,
+                    bins=dict(acc.latency.bins),
+                )
+                if acc.latency.count
+                else None,
+            )
+            for (service, env), acc in keys.items()
+        ]
+
+
+def merge_summaries(summaries: Iterable[SummaryIn], relative_accuracy: float = 0.01) -> List[SummaryIn]:
+    """Fold summaries into one per key; associative and commutative."""
+    buf = EdgeBuffer(relative_accuracy)
+    for sm in summaries:
+        buf.add_summary(sm)
+    return buf.drain()
+
+
+# --- App
+
+UPSTREAM = os.getenv("CP_UPSTREAM", "http://localhost:8080").rstrip("/")
+FLUSH_S = float(os.getenv("CP_EDGE_FLUSH_S", "1.0"))
+
+BUFFER = EdgeBuffer()
+# Last config the upstream returned per key, with when it arrived (monotonic s)
+CONFIGS: Dict[Key, Tuple[float, EffectiveConfig]] = {}
+STATS: Dict[str, int] = {"edge_signals": 0, "edge_summaries_in": 0, "edge_flushes": 0, "edge_flush_failures": 0}
+
+
+async def flush(client: httpx.AsyncClient) -> int:
+    """Send the buffered summaries upstream; returns how many were sent."""
+    batch = BUFFER.drain()
+    if not batch:
+        return 0
+    try:
+        resp = await client.post(
+            f"{UPSTREAM}/summaries",
+            content=b"[" + b",".join(sm.model_dump_json().encode() for sm in batch) + b"]",
+            headers={"content-type": "application/json"},
+        )
+        resp.raise_for_status()
+    except httpx.HTTPError as e:
+        # Fold the batch back in so the next flush carries it
+        for sm in batch:
+            BUFFER.add_summary(sm)
+        STATS["edge_flush_failures"] += 1
+        logger.warning("failed to flush %d summaries to %s: %s", len(batch), UPSTREAM, e)
+        return 0
+    result = SignalBatchResult.model_validate_json(resp.content)
+    now = time.monotonic()
+    for service, envs in result.configs.items():
+        for env, cfg in envs.items():
+            CONFIGS[(service, env)] = (now, cfg)
+    # Their owner was unreachable and nothing was applied, so they go again
+    kept = [sm for sm in batch if sm.environment in result.unavailable.get(sm.service, ())]
+    for sm in kept:
+        BUFFER.add_summary(sm)
+    if kept:
+        STATS["edge_flush_failures"] += 1
+        logger.warning("%d summaries kept for the next flush; their owners are unreachable", len(kept))
+    STATS["edge_flushes"] += 1
+    return len(batch) - len(kept)
+
+
+async def _flush_loop(client: httpx.AsyncClient) -> None:
+    while True:
+        await asyncio.sleep(FLUSH_S)
+        await flush(client)
+
+
+CLIENT: Optional[httpx.AsyncClient] = None
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    global CLIENT
+    CLIENT = httpx.AsyncClient(timeout=10.0)
+    flusher = asyncio.create_task(_flush_loop(CLIENT))
+    yield
+    flusher.cancel()
+    await flush(CLIENT)
+    await CLIENT.aclose()
+
+
+app = FastAPI(title="Adaptive Observability Edge Aggregator", version="0.1.0", lifespan=lifespan)
+
+
+@app.exception_handler(RequestValidationError)
+async def _validation_error(request: Request, exc: RequestValidationError):
+    return await request_validation_exception_handler(
+        request, RequestValidationError(json_safe_errors(exc.errors()), body=exc.body)
+    )
+
+
+def _config(service: str, environment: str) -> EffectiveConfig:
+    # Defaults until the upstream has answered for the key
+    hit = CONFIGS.get((service, environment))
+    return hit[1] if hit is not None else EffectiveConfig(service=service, environment=environment)
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"ok": True, "upstream": UPSTREAM}
+
+
+@app.get("/stats")
+async def stats():
+    return {**STATS, "edge_buffered_keys": len(BUFFER), "edge_configs": len(CONFIGS)}
+
+
+@app.post("/signal", response_model=EffectiveConfig)
+async def ingest_signal(sig: SignalIn):
+    BUFFER.add_signal(sig)
+    STATS["edge_signals"] += 1
+    return _config(sig.service, sig.environment)
+
+
+@app.post("/signals", response_model=SignalBatchResult)
+async def ingest_signals(sigs: List[SignalIn]):
+    result = SignalBatchResult(accepted=len(sigs))
+    for sig in sigs:
+        BUFFER.add_signal(sig)
+        result.configs.setdefault(sig.service, {})[sig.environment] = _config(sig.service, sig.environment)
+    STATS["edge_signals"] += len(sigs)
+    return result
+
+
+@app.post("/summaries", response_model=SignalBatchResult)
+async def ingest_summaries(summaries: List[SummaryIn]):
+    # From a lower tier of edges, or from agents in aggregate mode
+    result = SignalBatchResult(accepted=len(summaries))
+    for sm in summaries:
+        BUFFER.add_summary(sm)
+        result.configs.setdefault(sm.service, {})[sm.environment] = _config(sm.service, sm.environment)
+    STATS["edge_summaries_in"] += len(summaries)
+    return result
+
+
+@app.get("/config/{service}/{environment}", response_model=EffectiveConfig)
+async def get_config(service: str, environment: str):
+    hit = CONFIGS.get((service, environment))
+    if CLIENT is not None and (hit is None or time.monotonic() - hit[0] > FLUSH_S):
+        try:
+            resp = await CLIENT.get(f"{UPSTREAM}/config/{quote(service, safe='')}/{quote(environment, safe='')}")
+            resp.raise_for_status()
+            CONFIGS[(service, environment)] = (time.monotonic(), EffectiveConfig.model_validate_json(resp.content))
+        except httpx.HTTPError as e:
+            logger.warning("failed to fetch config for %s/%s from %s: %s", service, environment, UPSTREAM, e)
+    return _config(service, environment)
@@ -0,0 +1,221 @@
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from control_plane.plan import DEFAULT_ACTIONS, AggregateRef, CompiledPolicy
+
+Key = Tuple[str, str]
+
+
+def _mask(ids: Iterable[int], n: int) -> int:
+    bits = bytearray((n + 7) // 8)
+    for i in ids:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _iter_bits(mask: int) -> Iterator[int]:
+    s = bin(mask)[:1:-1]  # least significant bit first
+    i = s.find("1")
+    while i >= 0:
+        yield i
+        i = s.find("1", i + 1)
+
+
+class FleetResult(NamedTuple):
+    version: int  # plan version the decision table was computed for
+    keys: int
+    changed: List[Key]
+    elapsed_ms: float
+
+
+class FleetEvaluator:
+    """Decision table for every known (service, env) key, computed in one pass.
+
+    Keys get dense ids, and each aggregate a plan reads is kept in an
+    ``array('d')`` column indexed by key id. A rule is evaluated for all keys
+    at once as an integer bitmask: each column is sorted once, every
+    threshold becomes a bisect into it, and condition, scope and rule masks
+    are combined with big-integer AND/OR. Actions are then resolved per field
+    by walking rules from last to first, so each key is written at most once
+    per field.
+    """
+
+    def __init__(self) -> None:
+        self.keys: List[Key] = []
+        self._ids: Dict[Key, int] = {}
+        self.columns: Dict[AggregateRef, array] = {}
+        self._levels: List[str] = []
+        self._level_codes: Dict[str, int] = {}
+        self.log_level = array("H")
+        self.trace_sample_rate = array("d")
+        self.metric_period_s = array("l")
+        self.version = 0
+
+    def key_id(self, key: Key) -> int:
+        i = self._ids.get(key)
+        if i is None:
+            i = self._ids[key] = len(self.keys)
+            self.keys.append(key)
+        return i
+
+    def drop(self, keys: Iterable[Key]) -> int:
+        """Forget ``keys``; the remaining keys keep their decisions under new ids."""
+        gone = {key for key in keys if key in self._ids}
+        if not gone:
+            return 0
+        keep = [i for i, key in enumerate(self.keys) if key not in gone]
+        self.keys = [self.keys[i] for i in keep]
+        self._ids = {key: i for i, key in enumerate(self.keys)}
+        # Keys added since the last load/evaluate have no entries yet
+        self.columns = {
+            ref: array("d", (col[i] for i in keep if i < len(col))) for ref, col in self.columns.items()
+        }
+        decided = len(self.log_level)
+        self.log_level = array("H", (self.log_level[i] for i in keep if i < decided))
+        self.trace_sample_rate = array("d", (self.trace_sample_rate[i] for i in keep if i < decided))
+        self.metric_period_s = array("l", (self.metric_period_s[i] for i in keep if i < decided))
+        return len(gone)
+
+    def load(self, refs: Iterable[AggregateRef], aggregates: Callable[[Key, int], Dict[str, float]]) -> None:
+        """Fill one column per ref; ``aggregates`` is called once per key and window."""
+        by_window: Dict[int, List[AggregateRef]] = {}
+        for ref in refs:
+            by_window.setdefault(ref.window_s, []).append(ref)
+        n = len(self.keys)
+        columns = {ref: array("d", bytes(8 * n)) for refs_ in by_window.values() for ref in refs_}
+        for window_s, window_refs in by_window.items():
+            for i, key in enumerate(self.keys):
+                values = aggregates(key, window_s)
+                for ref in window_refs:
+                    columns[ref][i] = values[ref.name]
+        self.columns = columns
+
+    def config(self, key: Key) -> Optional[Tuple[str, float, int]]:
+        i = self._ids.get(key)
+        if i is None or i >= len(self.log_level):
+            return None
+        return self._levels[self.log_level[i]], self.trace_sample_rate[i], self.metric_period_s[i]
+
+    def _level_code(self, level: str) -> int:
+        c = self._level_codes.get(level)
+        if c is None:
+            c = self._level_codes[level] = len(self._levels)
+            self._levels.append(level)
+        return c
+
+    def _condition_masks(self, plan: CompiledPolicy, n: int) -> Dict[Tuple[AggregateRef, float], Tuple[int, int]]:
+        # (ref, threshold) -> (mask of keys with value < t, mask with value <= t)
+        out = {}
+        for ref, thresholds in plan.thresholds.items():
+            col = self.columns[ref]
+            order = sorted(range(n), key=col.__getitem__)
+            ordered = [col[i] for i in order]
+            cuts = [(bisect_left(ordered, t), bisect_right(ordered, t)) for t in thresholds]
+            # Thresholds are sorted, so the prefix masks can be built incrementally
+            bits = bytearray((n + 7) // 8)
+            prefix: Dict[int, int] = {}
+            done = 0
+            for cut in sorted({c for pair in cuts for c in pair}):
+                for i in order[done:cut]:
+                    bits[i >> 3] |= 1 << (i & 7)
+                done = cut
+                prefix[cut] = int.from_bytes(bits, "little")
+            for t, (lt, le) in zip(thresholds, cuts):
+                out[(ref, t)] = (prefix[lt], prefix[le])
+        return out
+
+    def evaluate(
+        self, plan: CompiledPolicy, baseline: Optional[Callable[[Key], Optional[Tuple[str, float, int]]]] = None
+    ) -> FleetResult:
+        """Recompute every key's decision under ``plan`` from the loaded columns.
+
+        Keys are reported changed against ``baseline(key)``, the
+        ``(log_level, trace_sample_rate, metric_period_s)`` the key is
+        currently served with, or against the previous table when no
+        baseline is given. Keys without a previous decision count as changed.
+        """
+        start = time.perf_counter()
+        n = len(self.keys)
+        everyone = (1 << n) - 1
+        conds = self._condition_masks(plan, n)
+
+        by_service: Dict[str, List[int]] = {}
+        by_env: Dict[str, List[int]] = {}
+        for i, (svc, env) in enumerate(self.keys):
+            by_service.setdefault(svc, []).append(i)
+            by_env.setdefault(env, []).append(i)
+        scope_cache: Dict[Tuple[str, str], int] = {}
+
+        def scope(kind: str, name: Optional[str]) -> int:
+            if not name:
+                return everyone
+            m = scope_cache.get((kind, name))
+            if m is None:
+                ids = (by_service if kind == "service" else by_env).get(name, ())
+                m = scope_cache[(kind, name)] = _mask(ids, n)
+            return m
+
+        rule_masks = []
+        for rule in plan.rules:
+            m = scope("service", rule.service) & scope("env", rule.environment)
+            for c in rule.conditions:
+                if not m:
+                    break
+                lt, le = conds[(c.ref, c.threshold)]
+                m &= {
+                    "<": lt,
+                    "<=": le,
+                    ">": everyone & ~le,
+                    ">=": everyone & ~lt,
+                    "==": le & ~lt,
+                    "!=": everyone & ~(le & ~lt),
+                }[c.op]
+            rule_masks.append(m)
+
+        default_level, default_rate, default_period = DEFAULT_ACTIONS
+        levels = array("H", [self._level_code(default_level)]) * n
+        rates = array("d", [default_rate]) * n
+        periods = array("l", [default_period]) * n
+        # Last writer wins: walk rules backwards and fill each key once per field
+        for field, column, convert in (
+            ("log_level", levels, self._level_code),
+            ("trace_sample_rate", rates, float),
+            ("metric_period_s", periods, int),
+        ):
+            remaining = everyone
+            for rule, m in zip(reversed(plan.rules), reversed(rule_masks)):
+                value = getattr(rule, field)
+                if value is None:
+                    continue
+                hit = m & remaining
+                if not hit:
+                    continue
+                v = convert(value)
+                for i in _iter_bits(hit):
+                    column[i] = v
+                remaining &= ~hit
+                if not remaining:
+                    break
+
+        if baseline is not None:
+            names = self._levels
+            changed = [
+                key
+                for i, key in enumerate(self.keys)
+                if baseline(key) != (names[levels[i]], rates[i], periods[i])
+            ]
+        else:
+            old = len(self.log_level)
+            changed = [
+                self.keys[i]
+                for i in range(n)
+                if i >= old
+                or levels[i] != self.log_level[i]
+                or rates[i] != self.trace_sample_rate[i]
+                or periods[i] != self.metric_period_s[i]
+            ]
+        self.log_level, self.trace_sample_rate, self.metric_period_s = levels, rates, periods
+        self.version = plan.version
+        return FleetResult(plan.version, n, changed, (time.perf_counter() - start) * 1000)
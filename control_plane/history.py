@@ -0,0 +1,443 @@
+import json
+import mmap
+import os
+import shutil
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from control_plane.aggregates import Bucket
+from control_plane.sketch import LatencySketch
+
+Key = Tuple[str, str]
+
+# (resolution_s, partition_s, retention_s): 10s rollups in hourly partitions
+# kept a day, 1m rollups in daily partitions kept 30 days, 1h rollups in
+# 30-day partitions kept two years.
+HISTORY_LEVELS: Tuple[Tuple[int, int, int], ...] = (
+    (10, 3_600, 86_400),
+    (60, 86_400, 30 * 86_400),
+    (3_600, 30 * 86_400, 730 * 86_400),
+)
+
+# One file per column per partition. Row i's sketch bins are entries
+# bins_end[i - 1]..bins_end[i] of the bin columns; ts is written last, so its
+# length is the number of complete rows.
+_COLUMNS = (("key", "I"), ("count", "q"), ("errors", "q"), ("zero", "q"), ("bins_end", "q"), ("ts", "q"))
+_BIN_COLUMNS = (("bin_index", "h"), ("bin_count", "I"))
+# Per-key row index, written when a partition is sealed: the rows of key
+# index_keys[j] are index_rows[index_ends[j - 1]..index_ends[j]], ascending.
+_INDEX_COLUMNS = (("index_keys", "I"), ("index_ends", "q"), ("index_rows", "I"))
+
+# ts, key id, count, errors, zero count, sketch bins
+Row = Tuple[int, int, int, int, int, Dict[int, int]]
+
+
+class _Mapped:
+    """Read-only ``mmap`` views of one partition's column files."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._maps: List[Tuple[mmap.mmap, List[memoryview]]] = []
+
+    def __enter__(self) -> "_Mapped":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for mm, views in reversed(self._maps):
+            for v in reversed(views):
+                v.release()
+            mm.close()
+
+    def column(self, name: str, typecode: str) -> memoryview:
+        itemsize = array(typecode).itemsize
+        with open(os.path.join(self.path, name), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < itemsize:
+                return memoryview(array(typecode))
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        raw = memoryview(mm)
+        whole = raw[: size - size % itemsize]
+        view = whole.cast(typecode)
+        self._maps.append((mm, [raw, whole, view]))
+        return view
+
+
+def _index_keys(keys: Sequence[int], into: Optional[Dict[int, array]] = None, offset: int = 0) -> Dict[int, array]:
+    # key id -> row numbers, for a key column whose first entry is row ``offset``
+    into = {} if into is None else into
+    for i, key_id in enumerate(keys, offset):
+        rows = into.get(key_id)
+        if rows is None:
+            rows = into[key_id] = array("I")
+        rows.append(i)
+    return into
+
+
+def _write_index(path: str, key_rows: Dict[int, array]) -> None:
+    cols = {name: array(typecode) for name, typecode in _INDEX_COLUMNS}
+    for key_id in sorted(key_rows):
+        cols["index_keys"].append(key_id)
+        cols["index_rows"].extend(key_rows[key_id])
+        cols["index_ends"].append(len(cols["index_rows"]))
+    for name, col in cols.items():
+        # Queries may run on other threads; they see the old file or the new one
+        tmp = os.path.join(path, f"{name}.{threading.get_ident()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(col.tobytes())
+        os.replace(tmp, os.path.join(path, name))
+
+
+class _Writer:
+    """Appends rows to the column files of one partition.
+
+    Keeps the partition's per-key row index in memory while it is written
+    and stores it with the columns on ``close``.
+    """
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.rows, self.bins = _repair(path)
+        # An index stored earlier would not cover the rows appended from now on
+        for name, _ in _INDEX_COLUMNS:
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+        self.key_rows: Dict[int, array] = {}
+        if self.rows:
+            with _Mapped(path) as m:
+                _index_keys(m.column("key", "I")[: self.rows], into=self.key_rows)
+        self._files = {name: open(os.path.join(path, name), "ab") for name, _ in _BIN_COLUMNS + _COLUMNS}
+
+    def append(self, rows: List[Row]) -> None:
+        cols = {name: array(typecode) for name, typecode in _BIN_COLUMNS + _COLUMNS}
+        for ts, key_id, count, errors, zero, bins in rows:
+            cols["bin_index"].extend(bins.keys())
+            cols["bin_count"].extend(bins.values())
+            self.bins += len(bins)
+            cols["bins_end"].append(self.bins)
+            cols["key"].append(key_id)
+            cols["count"].append(count)
+            cols["errors"].append(errors)
+            cols["zero"].append(zero)
+            cols["ts"].append(ts)
+        for name, col in cols.items():
+            f = self._files[name]
+            f.write(col.tobytes())
+            f.flush()
+        _index_keys(cols["key"], into=self.key_rows, offset=self.rows)
+        self.rows += len(rows)
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        _write_index(self.path, self.key_rows)
+
+
+def _repair(path: str) -> Tuple[int, int]:
+    # Cut every column back to the rows ts has, dropping a write torn by a crash
+    def size(name: str) -> int:
+        p = os.path.join(path, name)
+        return os.path.getsize(p) if os.path.exists(p) else 0
+
+    rows = size("ts") // 8
+    bins = 0
+    if rows:
+        with _Mapped(path) as m:
+            bins = m.column("bins_end", "q")[rows - 1]
+    for name, typecode in _COLUMNS + _BIN_COLUMNS:
+        keep = (rows if (name, typecode) in _COLUMNS else bins) * array(typecode).itemsize
+        if size(name) > keep:
+            os.truncate(os.path.join(path, name), keep)
+    return rows, bins
+
+
+class HistoryStore:
+    """Append-only columnar store of per-key rollups, one level per resolution.
+
+    The finest level is fed with finished time buckets (``record``), and
+    ``compact`` rolls finished intervals into each coarser level and drops
+    partitions past their retention once they have been rolled up. Each
+    level is split into time partitions, each a directory of column files
+    that are only ever appended to. Queries map the files of the partitions
+    in range and binary-search the ts column, so they touch only the pages
+    they read. A per-key row index, kept in memory for the partition being
+    written and stored with the columns once it is sealed, narrows a
+    query for one key to that key's rows.
+
+    Every level has a watermark: the end of the intervals it holds in full.
+    Queries at a coarse resolution read the finer levels above that
+    watermark, so intervals not compacted yet are still returned.
+    Timestamps are wall-clock seconds.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        levels: Tuple[Tuple[int, int, int], ...] = HISTORY_LEVELS,
+        relative_accuracy: float = 0.01,
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                relative_accuracy = json.load(f)["relative_accuracy"]
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"relative_accuracy": relative_accuracy}, f)
+        self.directory = directory
+        self.levels = levels
+        self.relative_accuracy = relative_accuracy
+        self._keys: List[Key] = []
+        self._key_ids: Dict[Key, int] = {}
+        self._keys_file = self._load_keys(os.path.join(directory, "keys.jsonl"))
+        self._writers: Dict[int, _Writer] = {}
+        self._compacting = threading.Lock()
+        self.complete: Dict[int, int] = {}
+        for res, _, _ in levels:
+            last = self._last_ts(res)
+            self.complete[res] = last + res if last is not None else 0
+        self.rows_written = 0
+        self.rows_read = 0
+        self.compactions = 0
+
+    def _load_keys(self, path: str):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            # A line torn by a crash never had rows written for it
+            whole = data[: data.rfind(b"\n") + 1]
+            if len(whole) < len(data):
+                os.truncate(path, len(whole))
+            for line in whole.splitlines():
+                service, env = json.loads(line)
+                self._key_ids[(service, env)] = len(self._keys)
+                self._keys.append((service, env))
+        return open(path, "ab")
+
+    def key_id(self, key: Key) -> int:
+        i = self._key_ids.get(key)
+        if i is None:
+            self._keys_file.write(json.dumps(list(key)).encode() + b"\n")
+            self._keys_file.flush()
+            i = self._key_ids[key] = len(self._keys)
+            self._keys.append(key)
+        return i
+
+    def keys(self) -> List[Key]:
+        return list(self._keys)
+
+    def close(self) -> None:
+        # Waits for a compaction still running on a worker thread
+        with self._compacting:
+            for w in self._writers.values():
+                w.close()
+            self._writers.clear()
+            self._keys_file.close()
+
+    # --- Partitions
+
+    def _level(self, res: int) -> Tuple[int, int, int]:
+        for level in self.levels:
+            if level[0] == res:
+                return level
+        raise ValueError(f"no history level with resolution {res}s")
+
+    def _level_dir(self, res: int) -> str:
+        return os.path.join(self.directory, f"{res}s")
+
+    def _partitions(self, res: int) -> List[int]:
+        try:
+            return sorted(int(n) for n in os.listdir(self._level_dir(res)) if n.isdigit())
+        except FileNotFoundError:
+            return []
+
+    def _last_ts(self, res: int) -> Optional[int]:
+        for start in reversed(self._partitions(res)):
+            with _Mapped(os.path.join(self._level_dir(res), str(start))) as m:
+                ts = m.column("ts", "q")
+                if len(ts):
+                    return ts[-1]
+        return None
+
+    def _append(self, res: int, rows: List[Row]) -> None:
+        # Rows in ts order; each goes to the partition containing its ts
+        _, partition_s, _ = self._level(res)
+        i = 0
+        while i < len(rows):
+            start = rows[i][0] - rows[i][0] % partition_s
+            j = i
+            while j < len(rows) and rows[j][0] < start + partition_s:
+                j += 1
+            path = os.path.join(self._level_dir(res), str(start))
+            w = self._writers.get(res)
+            if w is None or w.path != path:
+                if w is not None:
+                    w.close()
+                w = self._writers[res] = _Writer(path)
+            w.append(rows[i:j])
+            self.rows_written += j - i
+            i = j
+
+    def _scan(self, res: int, start_s: int, end_s: int, key_id: Optional[int] = None) -> Iterator[Row]:
+        """Rows of level ``res`` with ts in [start_s, end_s), for one key or all."""
+        _, partition_s, _ = self._level(res)
+        for p in self._partitions(res):
+            if p + partition_s <= start_s or p >= end_s:
+                continue
+            with _Mapped(os.path.join(self._level_dir(res), str(p))) as m:
+                try:
+                    ts = m.column("ts", "q")
+                    keys, bins_end = m.column("key", "I"), m.column("bins_end", "q")
+                    count, errors, zero = m.column("count", "q"), m.column("errors", "q"), m.column("zero", "q")
+                    index, counts = m.column("bin_index", "h"), m.column("bin_count", "I")
+                except FileNotFoundError:
+                    # Dropped by a concurrent compaction
+                    continue
+                lo, hi = bisect_left(ts, start_s), bisect_left(ts, end_s)
+                rows = range(lo, hi) if key_id is None else self._key_rows(res, m, keys, len(ts), key_id, lo, hi)
+                self.rows_read += len(rows)
+                for i in rows:
+                    a, b = bins_end[i - 1] if i else 0, bins_end[i]
+                    yield ts[i], keys[i], count[i], errors[i], zero[i], dict(zip(index[a:b], counts[a:b]))
+
+    def _key_rows(self, res: int, m: _Mapped, keys: memoryview, n: int, key_id: int, lo: int, hi: int) -> List[int]:
+        # Rows lo..hi of one key, from the partition's index instead of its key column
+        w = self._writers.get(res)
+        if w is not None and w.path == m.path:
+            own = w.key_rows.get(key_id, ())
+            return list(own[bisect_left(own, lo) : bisect_left(own, hi)])
+        try:
+            index_keys, ends, rows = (m.column(name, typecode) for name, typecode in _INDEX_COLUMNS)
+        except FileNotFoundError:
+            index_keys = None
+        if index_keys is None or len(rows) != n or len(ends) != len(index_keys):
+            # Not sealed, e.g. left open by a crash: index it now for later queries
+            key_rows = _index_keys(keys[:n])
+            try:
+                _write_index(m.path, key_rows)
+            except FileNotFoundError:
+                pass  # dropped by a concurrent compaction
+            own = key_rows.get(key_id, ())
+            return list(own[bisect_left(own, lo) : bisect_left(own, hi)])
+        j = bisect_left(index_keys, key_id)
+        if j == len(index_keys) or index_keys[j] != key_id:
+            return []
+        a, b = ends[j - 1] if j else 0, ends[j]
+        return rows[bisect_left(rows, lo, a, b) : bisect_left(rows, hi, a, b)].tolist()
+
+    # --- Writing
+
+    def _bins(self, sketch) -> Tuple[int, Dict[int, int]]:
+        # Zero count and bins at the store's accuracy, indices clamped to int16
+        if not isinstance(sketch, LatencySketch) or sketch.relative_accuracy != self.relative_accuracy:
+            converted = LatencySketch(self.relative_accuracy)
+            if isinstance(sketch, LatencySketch):
+                converted.add_bins(sketch.relative_accuracy, sketch.zero_count, sketch.bins)
+            else:
+                for v in sketch.values:
+                    converted.add(v)
+            sketch = converted
+        bins: Dict[int, int] = {}
+        for i, n in sketch.bins.items():
+            i = min(max(i, -32768), 32767)
+            bins[i] = bins.get(i, 0) + n
+        return sketch.zero_count, bins
+
+    def record(self, buckets: Iterable[Tuple[Key, int, Bucket]], complete_s: int) -> int:
+        """Append finished finest-level buckets as (key, wall start, bucket).
+
+        ``complete_s`` is the wall time up to which every bucket has been
+        passed. Buckets below the level's watermark are skipped, so the same
+        ones can be passed again; returns how many rows were appended.
+        """
+        res = self.levels[0][0]
+        done = self.complete[res]
+        rows = []
+        for key, ts, b in buckets:
+            if done <= ts < complete_s and b.count:
+                zero, bins = self._bins(b.latency)
+                rows.append((ts, self.key_id(key), b.count, b.errors, zero, bins))
+        rows.sort(key=lambda r: r[0])
+        self._append(res, rows)
+        self.complete[res] = max(done, complete_s)
+        return len(rows)
+
+    def compact(self, now_s: int) -> Dict[str, int]:
+        """Roll finished intervals into the coarser levels, then apply retention.
+
+        Safe to run on a worker thread while ``record`` and queries run on
+        the event loop: it reads only rows below the finer watermark and is
+        the only writer of the coarser levels.
+        """
+        out = {"rolled_up": 0, "partitions_dropped": 0}
+        with self._compacting:
+            for (fine, _, _), (coarse, _, _) in zip(self.levels, self.levels[1:]):
+                upto = self.complete[fine] - self.complete[fine] % coarse
+                start = self.complete[coarse]
+                if upto <= start:
+                    continue
+                merged: Dict[Tuple[int, int], Row] = {}
+                for ts, key_id, count, errors, zero, bins in self._scan(fine, start, upto):
+                    t = ts - ts % coarse
+                    row = merged.get((t, key_id))
+                    if row is None:
+                        merged[(t, key_id)] = (t, key_id, count, errors, zero, bins)
+                    else:
+                        acc = row[5]
+                        for i, n in bins.items():
+                            acc[i] = acc.get(i, 0) + n
+                        merged[(t, key_id)] = (t, key_id, row[2] + count, row[3] + errors, row[4] + zero, acc)
+                self._append(coarse, sorted(merged.values(), key=lambda r: (r[0], r[1])))
+                self.complete[coarse] = upto
+                out["rolled_up"] += len(merged)
+            for li, (res, partition_s, retention_s) in enumerate(self.levels):
+                # Never drop rows that have not been rolled into the next level
+                cutoff = now_s - retention_s
+                if li + 1 < len(self.levels):
+                    cutoff = min(cutoff, self.complete[self.levels[li + 1][0]])
+                current = self._writers.get(res)
+                for p in self._partitions(res):
+                    path = os.path.join(self._level_dir(res), str(p))
+                    if p + partition_s <= cutoff and (current is None or current.path != path):
+                        shutil.rmtree(path)
+                        out["partitions_dropped"] += 1
+            self.compactions += 1
+        return out
+
+    # --- Queries
+
+    def query(self, key: Key, start_s: int, end_s: int, res: int) -> List[Bucket]:
+        """Rollups of ``key`` at resolution ``res`` over [start_s, end_s), oldest first."""
+        li = self.levels.index(self._level(res))
+        key_id = self._key_ids.get(key)
+        out: Dict[int, Bucket] = {}
+        if key_id is not None:
+            self._collect(li, key_id, start_s, end_s, res, out)
+        return [out[t] for t in sorted(out)]
+
+    def _collect(self, li: int, key_id: int, start_s: int, end_s: int, res: int, out: Dict[int, Bucket]) -> None:
+        level_res = self.levels[li][0]
+        done = self.complete[level_res]
+        for ts, _, count, errors, zero, bins in self._scan(level_res, start_s, min(end_s, done), key_id):
+            t = ts - ts % res
+            b = out.get(t)
+            if b is None:
+                b = out[t] = Bucket(t, relative_accuracy=self.relative_accuracy)
+            b.count += count
+            b.errors += errors
+            b.latency.add_bins(self.relative_accuracy, zero, bins)
+        if li > 0 and end_s > done:
+            # Not rolled up to this level yet: merge from the finer one
+            self._collect(li - 1, key_id, max(start_s, done), end_s, res, out)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "history_keys": len(self._keys),
+            "history_rows_written": self.rows_written,
+            "history_rows_read": self.rows_read,
+            "history_compactions": self.compactions,
+        }
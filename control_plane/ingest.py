@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+from control_plane.models import SignalRecord
+
+logger = logging.getLogger(__name__)
+
+# What to do with incoming signals when the queue is full
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "block")
+
+
+class IngestQueue:
+    """Bounded queue of signals drained in batches by a background worker.
+
+    ``apply`` receives each drained batch on the event loop. The queue is
+    created in ``start`` so it binds to the loop that runs the app.
+    Overflow handling follows ``policy``:
+
+    - ``drop_newest``: signals that do not fit are dropped
+    - ``drop_oldest``: the oldest queued signals are evicted to make room
+    - ``block``: wait up to ``block_timeout_s`` for room, then drop
+    """
+
+    def __init__(
+        self,
+        apply: Callable[[List[SignalRecord]], None],
+        maxsize: int = 100_000,
+        policy: str = "drop_newest",
+        max_batch: int = 5_000,
+        block_timeout_s: float = 1.0,
+    ) -> None:
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {policy!r}")
+        self._apply = apply
+        self.maxsize = maxsize
+        self.policy = policy
+        self.max_batch = max_batch
+        self.block_timeout_s = block_timeout_s
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.applied = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(self.maxsize)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the worker, then apply what is still queued.
+
+        Queued signals were already acknowledged, so they are applied rather
+        than dropped; the caller can then persist them (e.g. in a snapshot).
+        """
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        q = self._queue
+        while not q.empty():
+            self._apply_batch([q.get_nowait() for _ in range(min(self.max_batch, q.qsize()))])
+
+    async def put(self, signals: List[SignalRecord]) -> int:
+        """Enqueue ``signals``; returns how many were accepted."""
+        if self._queue is None:
+            raise RuntimeError("ingest queue is not running")
+        q = self._queue
+        accepted = 0
+        for s in signals:
+            if q.full():
+                if self.policy == "drop_oldest":
+                    q.get_nowait()
+                    self.dropped += 1
+                elif self.policy == "block":
+                    try:
+                        await asyncio.wait_for(q.put(s), self.block_timeout_s)
+                    except asyncio.TimeoutError:
+                        self.dropped += len(signals) - accepted
+                        break
+                    accepted += 1
+                    continue
+                else:
+                    self.dropped += len(signals) - accepted
+                    break
+            q.put_nowait(s)
+            accepted += 1
+        self.enqueued += accepted
+        return accepted
+
+    async def _run(self) -> None:
+        q = self._queue
+        while True:
+            batch = [await q.get()]
+            while len(batch) < self.max_batch and not q.empty():
+                batch.append(q.get_nowait())
+            self._apply_batch(batch)
+            # Let request handlers run between batches
+            await asyncio.sleep(0)
+
+    def _apply_batch(self, batch: List[SignalRecord]) -> None:
+        try:
+            self._apply(batch)
+            self.applied += len(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("failed to apply ingest batch of %d signals", len(batch))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "ingest_queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "ingest_queue_max": self.maxsize,
+            "ingest_enqueued": self.enqueued,
+            "ingest_dropped": self.dropped,
+            "ingest_applied": self.applied,
+            "ingest_failed": self.failed,
+        }
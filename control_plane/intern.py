@@ -0,0 +1,144 @@
+from typing import Dict, FrozenSet, List, Mapping, Optional, Set, Tuple
+
+# Stand-ins for what the cardinality caps keep out of the table
+OVERFLOW_VALUE = "__other__"
+OVERFLOW_KEY = "__overflow__"
+
+Canon = Tuple[Tuple[str, str], ...]
+
+
+class AttrTable:
+    """Dictionary encoding for signal attributes.
+
+    Every distinct key and value string gets an integer code, and every
+    distinct attribute set gets an id pointing at a shared tuple of
+    ``(key_code, value_code)`` pairs. Windows then store one small integer
+    per signal, and filtering or grouping by an attribute compares integers
+    instead of strings. Set id 0 is the empty set.
+
+    Nothing is ever evicted, so cardinality is capped instead: past
+    ``max_values`` distinct values for a key, new values of it are encoded
+    as ``OVERFLOW_VALUE``, and past ``max_sets`` sets, new sets all share
+    the set ``{OVERFLOW_KEY: OVERFLOW_VALUE}``. Attributes such as request
+    ids then cost one overflow entry rather than one entry per request.
+    """
+
+    def __init__(self, max_values: int = 1000, max_sets: int = 100_000) -> None:
+        self.max_values = max_values
+        self.max_sets = max_sets
+        self._codes: Dict[str, int] = {}
+        self._strings: List[str] = []
+        self._set_ids: Dict[Canon, int] = {(): 0}
+        self._sets: List[Tuple[Tuple[int, int], ...]] = [()]
+        # (key_code, value_code) -> ids of the sets containing that pair
+        self._postings: Dict[Tuple[int, int], Set[int]] = {}
+        # key_code -> distinct values it has been seen with
+        self._values: Dict[int, int] = {}
+        # Encodes that hit a cap
+        self.overflowed = 0
+
+    def dump(self) -> Dict[str, list]:
+        """Strings and sets by code and id, for ``load``."""
+        return {"strings": self._strings, "sets": self._sets}
+
+    @classmethod
+    def load(cls, data: Mapping[str, list], max_values: int = 1000, max_sets: int = 100_000) -> "AttrTable":
+        """Table with the same codes and set ids as the one ``dump`` came from."""
+        table = cls(max_values, max_sets)
+        for s in data["strings"]:
+            table.code(s)
+        for pairs in data["sets"][1:]:
+            pairs = tuple((k, v) for k, v in pairs)
+            table._set_ids[tuple((table._strings[k], table._strings[v]) for k, v in pairs)] = table._insert(pairs)
+        return table
+
+    def __len__(self) -> int:
+        return len(self._sets)
+
+    def code(self, s: str) -> int:
+        c = self._codes.get(s)
+        if c is None:
+            c = self._codes[s] = len(self._strings)
+            self._strings.append(s)
+        return c
+
+    def lookup(self, s: str) -> Optional[int]:
+        """Code for ``s`` if it has been seen, without assigning one."""
+        return self._codes.get(s)
+
+    def string(self, code: int) -> str:
+        return self._strings[code]
+
+    def _insert(self, pairs: Tuple[Tuple[int, int], ...]) -> int:
+        set_id = len(self._sets)
+        self._sets.append(pairs)
+        for pair in pairs:
+            posting = self._postings.get(pair)
+            if posting is None:
+                posting = self._postings[pair] = set()
+                self._values[pair[0]] = self._values.get(pair[0], 0) + 1
+            posting.add(set_id)
+        return set_id
+
+    def _admits(self, key: str, value: str) -> bool:
+        k = self._codes.get(key)
+        if k is None or value == OVERFLOW_VALUE or self._values.get(k, 0) < self.max_values:
+            return True
+        v = self._codes.get(value)
+        return v is not None and (k, v) in self._postings
+
+    def encode(self, attrs: Optional[Mapping[str, str]]) -> int:
+        if not attrs:
+            return 0
+        canon = tuple(sorted(attrs.items()))
+        set_id = self._set_ids.get(canon)
+        if set_id is None:
+            set_id = self._encode_new(canon)
+        return set_id
+
+    def _encode_new(self, canon: Canon) -> int:
+        # Capped forms are looked up on every encode rather than remembered
+        # under the raw attributes, which would grow without bound
+        capped = tuple((k, v if self._admits(k, v) else OVERFLOW_VALUE) for k, v in canon)
+        if capped != canon:
+            self.overflowed += 1
+            set_id = self._set_ids.get(capped)
+            if set_id is not None:
+                return set_id
+        if len(self._sets) >= self.max_sets:
+            if capped == canon:
+                self.overflowed += 1
+            capped = ((OVERFLOW_KEY, OVERFLOW_VALUE),)
+            set_id = self._set_ids.get(capped)
+            if set_id is not None:
+                return set_id
+        set_id = self._set_ids[capped] = self._insert(tuple((self.code(k), self.code(v)) for k, v in capped))
+        return set_id
+
+    def decode(self, set_id: int) -> Dict[str, str]:
+        return {self._strings[k]: self._strings[v] for k, v in self._sets[set_id]}
+
+    def sets_with(self, key: str, value: str) -> FrozenSet[int]:
+        """Ids of the attribute sets that contain ``key=value``."""
+        k, v = self.lookup(key), self.lookup(value)
+        if k is None or v is None:
+            return frozenset()
+        return frozenset(self._postings.get((k, v), ()))
+
+    def value_code(self, set_id: int, key_code: int) -> Optional[int]:
+        for k, v in self._sets[set_id]:
+            if k == key_code:
+                return v
+        return None
+
+    def group(self, histogram: Mapping[int, int], key: str) -> Dict[str, int]:
+        """Fold per-set counts into counts per value of ``key``."""
+        key_code = self.lookup(key)
+        if key_code is None:
+            return {}
+        by_value: Dict[int, int] = {}
+        for set_id, n in histogram.items():
+            v = self.value_code(set_id, key_code)
+            if v is not None:
+                by_value[v] = by_value.get(v, 0) + n
+        return {self._strings[v]: n for v, n in by_value.items()}
@@ -0,0 +1,37 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop runs a timer that should fire every ``interval_s``.
+
+    The lag of each tick is how much longer than ``interval_s`` the sleep
+    took, i.e. how long some callback held the loop. The last ``history``
+    samples are kept for the max and p99.
+    """
+
+    def __init__(self, interval_s: float = 0.1, history: int = 600) -> None:
+        self.interval_s = interval_s
+        self._samples: Deque[float] = deque(maxlen=history)
+        self.last_ms = 0.0
+
+    def record(self, lag_ms: float) -> None:
+        self.last_ms = lag_ms
+        self._samples.append(lag_ms)
+
+    async def run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            self.record(max(0.0, (time.perf_counter() - start - self.interval_s) * 1000))
+
+    def stats(self) -> Dict[str, float]:
+        samples = sorted(self._samples)
+        p99 = samples[int(0.99 * (len(samples) - 1))] if samples else 0.0
+        return {
+            "loop_lag_ms": round(self.last_ms, 3),
+            "loop_lag_p99_ms": round(p99, 3),
+            "loop_lag_max_ms": round(samples[-1] if samples else 0.0, 3),
+        }
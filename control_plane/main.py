@@ -1,60 +1,125 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import struct
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, TypeVar, Union
+from urllib.parse import quote
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+import httpx
+from fastapi import FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import RedirectResponse, StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 
-app = FastAPI(title="Adaptive Observability Control Plane", version="0.1.0")
-
-
-# --- Models
-class Condition(BaseModel):
-    kind: str = Field(description="metric|error_rate|feature_flag|time|always")
-    op: str = Field(description=">|>=|<|<=|==|!=|in|contains|always")
-    key: Optional[str] = None
-    # For numeric comparisons we expect a float; keep simple for demo
-    value: Optional[float] = None
-    window_s: Optional[int] = Field(default=None, description="Rolling window seconds for aggregations")
-
-
-class Action(BaseModel):
-    log_level: Optional[str] = None  # DEBUG|INFO|WARN|ERROR
-    trace_sample_rate: Optional[float] = Field(default=None, ge=0.0, le=1.0)
-    metric_period_s: Optional[int] = Field(default=None, ge=1)
+from control_plane.aggregates import Bucket, WindowAggregates, merge_buckets, merge_cost, summarize
+from control_plane.clock import Clock, MonotonicClock
+from control_plane.cluster import FORWARDED_HEADER, Cluster
+from control_plane.fleet import FleetEvaluator, FleetResult
+from control_plane.history import HistoryStore
+from control_plane.ingest import IngestQueue
+from control_plane.intern import AttrTable
+from control_plane.looplag import LoopLagMonitor
+from control_plane.models import (
+    Action,
+    Condition,
+    EffectiveConfig,
+    Policy,
+    Rule,
+    SignalBatchResult,
+    SignalIn,
+    SignalRecord,
+    SummaryIn,
+    json_safe_errors,
+)
+from control_plane.persist import (
+    REC_POLICY,
+    REC_SIGNALS,
+    REC_SUMMARY,
+    WriteAheadLog,
+    decode_policy,
+    decode_signals,
+    decode_summary,
+    encode_snapshot,
+    load_snapshot,
+    read_log,
+    write_snapshot,
+)
+from control_plane.plan import AggregateRef, CompiledPolicy, compile_policy
+from control_plane.shared import SharedAggregates, SharedStore
+from control_plane.singleflight import SingleFlight
+from control_plane.watch import ConfigWatch, Published
+from control_plane.window import SignalWindow
 
+logger = logging.getLogger(__name__)
 
-class Rule(BaseModel):
-    id: str
-    description: Optional[str] = None
-    service: Optional[str] = None  # target service or *
-    environment: Optional[str] = None  # prod|staging|*
-    priority: int = 100  # lower runs first
-    conditions: List[Condition] = Field(default_factory=list)
-    actions: Action
-    enabled: bool = True
+T = TypeVar("T")
 
 
-class Policy(BaseModel):
-    id: str
-    description: Optional[str] = None
-    rules: List[Rule] = Field(default_factory=list)
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    global WAL
+    persisting = []
+    if DATA_DIR is not None and STORE is not None:
+        logger.warning("CP_DATA_DIR is ignored with CP_SHARED_STATE; the shared segment outlives the workers")
+    elif DATA_DIR is not None:
+        restored = restore(DATA_DIR)
+        logger.info("restored %s from %s", restored, DATA_DIR)
+        WAL = WriteAheadLog(DATA_DIR, WAL_FSYNC, CLOCK.wall_offset_ms, archive_dir=WAL_ARCHIVE_DIR)
+        persisting.append(asyncio.create_task(WAL.run(WAL_FLUSH_S)))
+        if SNAPSHOT_INTERVAL_S > 0:
+            persisting.append(asyncio.create_task(_snapshot_loop()))
+    global HISTORY
+    if HISTORY_DIR is not None and STORE is not None:
+        logger.warning("CP_HISTORY_DIR is ignored with CP_SHARED_STATE")
+    elif HISTORY_DIR is not None:
+        HISTORY = HistoryStore(HISTORY_DIR)
+        persisting += [asyncio.create_task(_history_flush_loop()), asyncio.create_task(_history_compact_loop())]
+    ticker = asyncio.create_task(CLOCK.run()) if isinstance(CLOCK, MonotonicClock) else None
+    INGEST_QUEUE.start()
+    refresher = asyncio.create_task(WATCH.run(_refresh_watched, WATCH_REFRESH_S))
+    lag = asyncio.create_task(LOOP_LAG.run())
+    if CLUSTER is not None:
+        CLUSTER.start()
+    yield
+    if CLUSTER is not None:
+        await CLUSTER.stop()
+    lag.cancel()
+    refresher.cancel()
+    # Applies the signals still queued, so they reach the WAL and the final snapshot
+    await INGEST_QUEUE.stop()
+    if ticker is not None:
+        ticker.cancel()
+    for task in persisting:
+        task.cancel()
+    await asyncio.gather(*persisting, return_exceptions=True)
+    if HISTORY is not None:
+        flush_history()
+        HISTORY.close()
+        HISTORY = None
+    if WAL is not None:
+        # A final snapshot, so a graceful restart replays almost nothing
+        seq, chunks = _snapshot()
+        write_snapshot(DATA_DIR, seq, chunks)
+        WAL.remove_before(seq)
+        WAL.close()
+        WAL = None
 
 
-class Signal(BaseModel):
-    service: str
-    environment: str
-    ts: datetime
-    latency_ms: Optional[float] = None
-    error: Optional[bool] = None
-    attrs: Dict[str, str] = Field(default_factory=dict)
+app = FastAPI(title="Adaptive Observability Control Plane", version="0.1.0", lifespan=lifespan)
 
 
-class EffectiveConfig(BaseModel):
-    service: str
-    environment: str
-    log_level: str = "INFO"
-    trace_sample_rate: float = 0.1
-    metric_period_s: int = 60
+@app.exception_handler(RequestValidationError)
+async def _validation_error(request: Request, exc: RequestValidationError):
+    return await request_validation_exception_handler(
+        request, RequestValidationError(json_safe_errors(exc.errors()), body=exc.body)
+    )
 
 
 # --- In-memory state (replace with DB in real usage)
@@ -94,99 +159,474 @@ POLICY = Policy(
 )
 
 # Rolling signals per (service, env)
-SIGNALS: Dict[tuple[str, str], List[Signal]] = {}
+SIGNALS: Dict[tuple[str, str], SignalWindow] = {}
+# Dictionary encoding shared by all windows for signal attrs, see intern.py;
+# values past CP_ATTR_MAX_VALUES per attribute and sets past CP_ATTR_MAX_SETS
+# are folded into overflow entries
+ATTRS = AttrTable(int(os.getenv("CP_ATTR_MAX_VALUES", "1000")), int(os.getenv("CP_ATTR_MAX_SETS", "100000")))
+# Time-bucketed aggregates per (service, env), see aggregates.py
+AGGREGATES: Dict[tuple[str, str], Union[WindowAggregates, SharedAggregates]] = {}
 WINDOW_MAX = 5 * 60  # seconds to keep raw events
+# Exact quantiles keep every latency; the default sketch is within 1% (see sketch.py)
+EXACT_QUANTILES = False
+# Engine time in integer monotonic ms; swap for a ManualClock to drive time in tests
+CLOCK: Clock = MonotonicClock()
+
+# With CP_SHARED_STATE set, aggregates and the policy live in the shared-memory
+# segment of that name, so every `uvicorn --workers N` process sees them. It
+# holds CP_SHARED_KEYS keys; signals for keys past that are rejected with 507
+STORE: Optional[SharedStore] = (
+    SharedStore(os.environ["CP_SHARED_STATE"], n_keys=int(os.getenv("CP_SHARED_KEYS", "256")))
+    if os.getenv("CP_SHARED_STATE")
+    else None
+)
+
+# Cluster mode: with CP_CLUSTER_SELF set to this node's base URL, every key is
+# owned by one of CP_CLUSTER_NODES on a consistent-hash ring, and requests for
+# other nodes' keys are forwarded or redirected (CP_CLUSTER_MODE)
+CLUSTER: Optional[Cluster] = (
+    Cluster(
+        os.environ["CP_CLUSTER_SELF"],
+        os.getenv("CP_CLUSTER_NODES", "").split(","),
+        os.getenv("CP_CLUSTER_MODE", "forward"),
+    )
+    if os.getenv("CP_CLUSTER_SELF")
+    else None
+)
+
+# With CP_DATA_DIR set, signals, summaries and policy updates are appended to
+# a write-ahead log there (fsync per CP_WAL_FSYNC, see persist.py), and the
+# windows and policy are snapshotted every CP_SNAPSHOT_INTERVAL_S seconds.
+# Startup loads the latest snapshot and replays the log after it.
+DATA_DIR: Optional[str] = os.getenv("CP_DATA_DIR") or None
+WAL_FSYNC = os.getenv("CP_WAL_FSYNC", "interval")
+WAL_FLUSH_S = float(os.getenv("CP_WAL_FLUSH_MS", "200")) / 1000
+# Log segments a snapshot covers are moved here instead of deleted, keeping a
+# recorded signal log for backtests (see backtest.py)
+WAL_ARCHIVE_DIR: Optional[str] = os.getenv("CP_WAL_ARCHIVE_DIR") or None
+SNAPSHOT_INTERVAL_S = float(os.getenv("CP_SNAPSHOT_INTERVAL_S", "60"))
+WAL: Optional[WriteAheadLog] = None
+
+# Rollups kept past WINDOW_MAX, in CP_HISTORY_DIR (default <CP_DATA_DIR>/history):
+# finished 10s buckets are appended every CP_HISTORY_FLUSH_S seconds and rolled
+# up into 1m and 1h levels every CP_HISTORY_COMPACT_S, see history.py
+HISTORY_DIR: Optional[str] = os.getenv("CP_HISTORY_DIR") or (os.path.join(DATA_DIR, "history") if DATA_DIR else None)
+HISTORY_FLUSH_S = float(os.getenv("CP_HISTORY_FLUSH_S", "10"))
+HISTORY_COMPACT_S = float(os.getenv("CP_HISTORY_COMPACT_S", "60"))
+# Longest series /history returns when no resolution is asked for
+HISTORY_MAX_POINTS = 1440
+HISTORY: Optional[HistoryStore] = None
+
+# Compiled evaluation plan for POLICY, replaced whole on every upsert
+PLAN: CompiledPolicy = compile_policy(POLICY, 1, WINDOW_MAX)
+
+
+class Decision(NamedTuple):
+    version: int  # plan version that produced the config
+    generation: int  # aggregates generation it was computed from
+    second: int  # clock second it was computed in
+    bands: Tuple[int, ...]  # threshold bands of the aggregates it read
+    matched: int  # bitmap of candidate rules that held
+    config: EffectiveConfig
+
+
+# Decision table for every key with signals, recomputed in one pass on policy change
+FLEET = FleetEvaluator()
+LAST_FLEET: Optional[FleetResult] = None
+
+# Last decision per (service, env), least recently evaluated first; reused while
+# the rule outcomes are unchanged. Capped at CP_DECISION_CACHE_MAX keys, since
+# polls for keys that never send signals would otherwise grow it forever
+DECISIONS: "OrderedDict[tuple[str, str], Decision]" = OrderedDict()
+DECISION_CACHE_MAX = int(os.getenv("CP_DECISION_CACHE_MAX", "100000"))
+STATS: Dict[str, int] = {
+    "decision_cache_hits": 0,
+    "decision_cache_misses": 0,
+    "config_not_modified": 0,
+    "evaluations_offloaded": 0,
+    "snapshots_written": 0,
+    "shared_keys_rejected": 0,
+}
+
+# Concurrent request-path evaluations of one key share a single run; the
+# leader waits CP_COALESCE_WINDOW_MS (one loop iteration when 0) for joiners
+EVAL_FLIGHT: SingleFlight[EffectiveConfig] = SingleFlight(float(os.getenv("CP_COALESCE_WINDOW_MS", "0")) / 1000)
+
+# Request-path evaluations whose merge walks at least this many entries (sketch
+# bins, or values with exact quantiles) across the selected buckets merge them
+# on a worker thread instead of the event loop (0: never)
+OFFLOAD_MIN_ENTRIES = int(os.getenv("CP_OFFLOAD_MIN_ENTRIES", "20000"))
+OFFLOAD_POOL = ThreadPoolExecutor(int(os.getenv("CP_OFFLOAD_WORKERS", "2")), thread_name_prefix="cp-eval")
+# How late the event loop runs its timers, reported in /stats
+LOOP_LAG = LoopLagMonitor()
+
+# Per-key config versions for /config/{service}/{environment}/watch
+WATCH = ConfigWatch()
+# Watched keys are re-evaluated this often so window expiry also reaches them
+WATCH_REFRESH_S = float(os.getenv("CP_WATCH_REFRESH_S", "1.0"))
 
 
 # --- Helpers
 
 def _now() -> datetime:
+    # Wall clock, for API responses only; the engine runs on CLOCK
     return datetime.utcnow()
 
 
-def _prune(key: tuple[str, str]):
-    cutoff = _now() - timedelta(seconds=WINDOW_MAX)
+def _record(s: SignalRecord) -> None:
+    _record_many((s.service, s.environment), (s,))
+    if WAL is not None:
+        WAL.commit()
+
+
+def _record_many(key: tuple[str, str], signals: Iterable[SignalRecord]) -> None:
+    # Checked before anything is logged, so the WAL only holds records that replay
+    signals = list(signals)
+    for s in signals:
+        if s.latency_ms is not None and not 0.0 <= s.latency_ms < math.inf:
+            raise ValueError(f"invalid latency_ms {s.latency_ms!r} for {key[0]}/{key[1]}")
+    agg = _aggregates_for(key)
+    if WAL is not None:
+        WAL.append_signals(key, signals)
+    buf = SIGNALS[key]
+    rows = []
+    for s in signals:
+        buf.append(s.ts_ms, s.latency_ms, s.error, ATTRS.encode(s.attrs))
+        rows.append((s.ts_ms, s.latency_ms, s.error))
+    agg.add_many(rows)
+
+
+def _track(key: tuple[str, str], agg: Union[WindowAggregates, SharedAggregates]) -> None:
+    SIGNALS[key] = SignalWindow()
+    AGGREGATES[key] = agg
+    FLEET.key_id(key)
+
+
+def _find_aggregates(key: tuple[str, str]) -> Optional[Union[WindowAggregates, SharedAggregates]]:
+    agg = AGGREGATES.get(key)
+    if agg is None and STORE is not None:
+        # Possibly ingested by another worker
+        agg = STORE.aggregates(key)
+        if agg is not None:
+            _track(key, agg)
+    return agg
+
+
+def _aggregates_for(key: tuple[str, str]) -> Union[WindowAggregates, SharedAggregates]:
+    agg = _find_aggregates(key)
+    if agg is None:
+        if STORE is not None:
+            agg = STORE.aggregates(key, create=True)
+            if agg is None:
+                # A worker-local window would split the key's signals between workers
+                STATS["shared_keys_rejected"] += 1
+                raise HTTPException(
+                    status_code=507,
+                    detail=f"shared state is full ({STORE.n_keys} keys, CP_SHARED_KEYS); {key[0]}/{key[1]} not stored",
+                )
+        else:
+            agg = WindowAggregates(exact=EXACT_QUANTILES)
+        _track(key, agg)
+    return agg
+
+
+def _known_keys() -> List[tuple[str, str]]:
+    return STORE.keys() if STORE is not None else list(AGGREGATES)
+
+
+def _plan() -> CompiledPolicy:
+    # Pick up a policy version published by another worker
+    global PLAN, POLICY
+    if STORE is not None and STORE.policy_version() > PLAN.version:
+        version, data = STORE.policy()
+        PLAN = compile_policy(Policy.model_validate_json(data), version, WINDOW_MAX)
+        POLICY = PLAN.policy
+    return PLAN
+
+
+def _ingest(signals: Iterable[SignalRecord]) -> Dict[tuple[str, str], EffectiveConfig]:
+    # Append per key, then evaluate each touched key once
+    by_key: Dict[tuple[str, str], List[SignalRecord]] = {}
+    for s in signals:
+        by_key.setdefault((s.service, s.environment), []).append(s)
+    # Every key gets its windows first, so a full shared state rejects the
+    # batch before any of it is applied
+    for key in by_key:
+        _aggregates_for(key)
+    for key, batch in by_key.items():
+        _record_many(key, batch)
+    if WAL is not None:
+        WAL.commit()
+    return {key: evaluate(*key) for key in by_key}
+
+
+def _prune(key: tuple[str, str], now_ms: int):
     buf = SIGNALS.get(key)
     if not buf:
         return
-    SIGNALS[key] = [s for s in buf if s.ts >= cutoff]
+    buf.prune(now_ms - WINDOW_MAX * 1000)
 
 
-def _calc_aggregates(buf: List[Signal]) -> Dict[str, float]:
-    # Simple aggregates p95 and error rate over the buffer
-    if not buf:
+def _calc_aggregates(key: tuple[str, str], window_s: Optional[int], now_ms: int) -> Dict[str, float]:
+    # p95 and error rate over the trailing window, merged from time buckets
+    agg = _find_aggregates(key)
+    if agg is None:
         return {"latency_p95_ms": 0.0, "error_rate": 0.0}
-    latencies = [s.latency_ms for s in buf if s.latency_ms is not None]
-    latencies.sort()
-    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
-    err = sum(1 for s in buf if s.error) / max(1, len(buf))
-    return {"latency_p95_ms": float(p95), "error_rate": float(err)}
-
-
-op_map = {
-    ">": lambda a, b: a > b,
-    ">=": lambda a, b: a >= b,
-    "<": lambda a, b: a < b,
-    "<=": lambda a, b: a <= b,
-    "==": lambda a, b: a == b,
-    "!=": lambda a, b: a != b,
-}
+    return summarize(agg.query(now_ms, min(window_s or WINDOW_MAX, WINDOW_MAX)))
 
 
 # --- Rule evaluation
 
-def evaluate(service: str, env: str) -> EffectiveConfig:
+def _fresh(last: Optional[Decision], plan: CompiledPolicy, generation: int, second: int) -> bool:
+    # Nothing ingested and no bucket boundary passed: aggregates are unchanged
+    return (
+        last is not None
+        and last.version == plan.version
+        and last.generation == generation
+        and last.second == second
+    )
+
+
+def _generation(key: tuple[str, str]) -> int:
+    agg = _find_aggregates(key)
+    return agg.generation if agg is not None else 0
+
+
+class Precomputed(NamedTuple):
+    now_ms: int
+    generation: int  # aggregates generation the buckets were selected at
+    aggregates: Dict[int, Dict[str, float]]  # window_s -> aggregates
+
+
+def evaluate(service: str, env: str, precomputed: Optional[Precomputed] = None) -> EffectiveConfig:
+    plan = _plan()
     key = (service, env)
-    _prune(key)
-    buf = SIGNALS.get(key, [])
-    aggs = _calc_aggregates(buf)
+    now_ms = CLOCK.now_ms() if precomputed is None else precomputed.now_ms
+    _prune(key, now_ms)
+    generation = _generation(key) if precomputed is None else precomputed.generation
+    second = now_ms // 1000
+    last = DECISIONS.get(key)
+    if _fresh(last, plan, generation, second):
+        STATS["decision_cache_hits"] += 1
+        return last.config
+    if last is not None and last.version != plan.version:
+        last = None
 
-    effective = EffectiveConfig(service=service, environment=env)
+    # Aggregates are computed once per distinct condition window
+    aggs_by_window: Dict[int, Dict[str, float]] = {} if precomputed is None else dict(precomputed.aggregates)
 
-    for rule in sorted((r for r in POLICY.rules if r.enabled), key=lambda r: r.priority):
-        # scope match
-        if rule.service and rule.service != service:
-            continue
-        if rule.environment and rule.environment != env:
-            continue
+    def value(ref: AggregateRef) -> float:
+        a = aggs_by_window.get(ref.window_s)
+        if a is None:
+            a = aggs_by_window[ref.window_s] = _calc_aggregates(key, ref.window_s, now_ms)
+        return a[ref.name]
 
-        matched = True
-        for c in rule.conditions:
-            if c.kind == "always" or c.op == "always":
-                continue
-            if c.kind == "error_rate":
-                v = aggs.get("error_rate", 0.0)
-                threshold = float(c.value) if c.value is not None else 0.0
-                if not op_map[c.op](v, threshold):
-                    matched = False
-                    break
-            elif c.kind == "metric":
-                v = aggs.get(c.key or "", 0.0)
-                threshold = float(c.value) if c.value is not None else 0.0
-                if not op_map[c.op](v, threshold):
-                    matched = False
-                    break
-            else:
-                matched = False
-                break
-        if not matched:
+    bands = plan.bands(service, env, value)
+    if last is not None and last.bands == bands:
+        matched = last.matched
+    else:
+        matched = plan.matched(service, env, value)
+    if last is not None and last.matched == matched:
+        STATS["decision_cache_hits"] += 1
+        config = last.config
+    else:
+        STATS["decision_cache_misses"] += 1
+        config = plan.apply(service, env, matched)
+    DECISIONS[key] = Decision(plan.version, generation, second, bands, matched, config)
+    DECISIONS.move_to_end(key)
+    if len(DECISIONS) > DECISION_CACHE_MAX:
+        # Its published config goes too, unless someone is watching the key
+        evicted, _ = DECISIONS.popitem(last=False)
+        WATCH.discard(evicted)
+    if last is None or config is not last.config:
+        WATCH.publish(key, config)
+    return config
+
+
+def _merge_selected(selected: Dict[int, Tuple[int, List[Bucket]]], exact: bool) -> Dict[int, Dict[str, float]]:
+    # Runs inline or on OFFLOAD_POOL; the selected buckets are no longer written to
+    return {w: summarize(merge_buckets(lo, buckets, exact)) for w, (lo, buckets) in selected.items()}
+
+
+async def evaluate_async(service: str, env: str) -> EffectiveConfig:
+    """``evaluate`` with bucket merging moved off the event loop for large windows.
+
+    Buckets are selected once on the loop (copying the ones still being
+    written). When merging them walks at least OFFLOAD_MIN_ENTRIES entries
+    they are merged and summarized on OFFLOAD_POOL, otherwise inline, and
+    the rules are applied back on the loop. Fresh decisions are returned as is.
+    """
+    key = (service, env)
+    agg = _find_aggregates(key)
+    now_ms = CLOCK.now_ms()
+    plan = _plan()
+    if agg is None or not OFFLOAD_MIN_ENTRIES or _fresh(DECISIONS.get(key), plan, agg.generation, now_ms // 1000):
+        return evaluate(service, env)
+    generation = agg.generation
+    windows = {ref.window_s for ref in plan.scopes.refs(service, env)}
+    selected = {w: agg.select(now_ms, min(w or WINDOW_MAX, WINDOW_MAX), copy_live=True) for w in windows}
+    if sum(merge_cost(buckets) for _, buckets in selected.values()) < OFFLOAD_MIN_ENTRIES:
+        aggregates = _merge_selected(selected, agg.exact)
+    else:
+        aggregates = await asyncio.get_running_loop().run_in_executor(
+            OFFLOAD_POOL, _merge_selected, selected, agg.exact
+        )
+        STATS["evaluations_offloaded"] += 1
+    return evaluate(service, env, Precomputed(now_ms, generation, aggregates))
+
+
+def _refresh_watched(key: tuple[str, str]) -> None:
+    # A watcher can outlive a rebalance by a moment; its key is no longer ours
+    if CLUSTER is None or CLUSTER.is_local(key):
+        evaluate(*key)
+
+
+# --- Persistence
+
+def restore(directory: str) -> Dict[str, int]:
+    """Load the latest snapshot in ``directory`` and replay the log after it.
+
+    Runs before the WAL is opened, so nothing replayed is logged again.
+    Log records too old to reach any window are skipped, and so are records
+    that do not decode or validate (e.g. written by an older version), which
+    are logged and counted in ``skipped_records``.
+    """
+    global ATTRS, PLAN, POLICY
+    restored = {"snapshot_keys": 0, "replayed_records": 0, "replayed_signals": 0, "skipped_records": 0}
+    snap = load_snapshot(directory)
+    from_seq = 0
+    if snap is not None:
+        # Continue the snapshot's time base so its buckets line up
+        CLOCK.rebase(snap.wall_offset_ms)
+        from_seq = snap.wal_seq
+        ATTRS = snap.attrs(ATTRS.max_values, ATTRS.max_sets)
+        for key, agg, window in snap.keys():
+            _track(key, agg)
+            SIGNALS[key] = window
+            restored["snapshot_keys"] += 1
+        if snap.policy_version > PLAN.version:
+            PLAN = compile_policy(Policy.model_validate_json(snap.policy), snap.policy_version, WINDOW_MAX)
+        snap.close()
+    rebased = snap is not None
+    cutoff_ms = None
+    for rec in read_log(directory, from_seq):
+        if not rebased:
+            CLOCK.rebase(rec.wall_offset_ms)
+            rebased = True
+        if cutoff_ms is None:
+            cutoff_ms = CLOCK.now_ms() - WINDOW_MAX * 1000 - 60_000
+        shift_ms = rec.wall_offset_ms - CLOCK.wall_offset_ms
+        try:
+            replayed = _replay(rec.rtype, rec.payload, shift_ms, cutoff_ms)
+        except (ValueError, ArithmeticError, struct.error) as e:
+            # One bad record must not keep the node from starting
+            logger.warning("skipping invalid log record in segment %d: %s", rec.seq, e)
+            restored["skipped_records"] += 1
             continue
+        restored["replayed_records"] += 1
+        restored["replayed_signals"] += replayed
+    POLICY = PLAN.policy
+    return restored
+
+
+def _replay(rtype: int, payload: memoryview, shift_ms: int, cutoff_ms: int) -> int:
+    # Applies one log record; returns how many signals it replayed
+    global PLAN
+    if rtype == REC_SIGNALS:
+        key, signals = decode_signals(payload, shift_ms)
+        signals = [s for s in signals if s.ts_ms >= cutoff_ms]
+        if signals:
+            _record_many(key, signals)
+        return len(signals)
+    if rtype == REC_SUMMARY:
+        ts_ms, sm = decode_summary(payload, shift_ms)
+        if ts_ms >= cutoff_ms:
+            agg = _aggregates_for((sm.service, sm.environment))
+            agg.add_summary(ts_ms, sm.count, min(sm.errors, sm.count), sm.latency)
+    elif rtype == REC_POLICY:
+        version, data = decode_policy(payload)
+        if version > PLAN.version:
+            PLAN = compile_policy(Policy.model_validate_json(data), version, WINDOW_MAX)
+    return 0
+
+
+def _snapshot() -> Tuple[int, List[bytes]]:
+    # Starts a new log segment and captures the state as of its start
+    now_ms = CLOCK.now_ms()
+    for key in SIGNALS:
+        _prune(key, now_ms)
+    seq = WAL.rotate()
+    keys = ((key, agg, SIGNALS[key]) for key, agg in AGGREGATES.items() if isinstance(agg, WindowAggregates))
+    chunks = encode_snapshot(
+        seq, CLOCK.wall_offset_ms, PLAN.version, PLAN.policy.model_dump_json().encode(), ATTRS, keys
+    )
+    STATS["snapshots_written"] += 1
+    return seq, chunks
+
+
+async def snapshot() -> str:
+    """Snapshot the windows and policy, then drop the log segments it covers."""
+    seq, chunks = _snapshot()
+    path = await asyncio.to_thread(write_snapshot, DATA_DIR, seq, chunks)
+    WAL.remove_before(seq)
+    return path
 
-        # Apply actions (last writer wins within ordered rules)
-        a = rule.actions
-        if a.log_level:
-            effective.log_level = a.log_level
-        if a.trace_sample_rate is not None:
-            effective.trace_sample_rate = a.trace_sample_rate
-        if a.metric_period_s is not None:
-            effective.metric_period_s = a.metric_period_s
 
-    return effective
+async def _snapshot_loop() -> None:
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL_S)
+        try:
+            await snapshot()
+        except OSError:
+            logger.exception("failed to write a snapshot to %s", DATA_DIR)
+
+
+# --- History
+
+def _wall_s(ms: int) -> int:
+    return (ms + CLOCK.wall_offset_ms) // 1000
+
+
+def flush_history() -> int:
+    """Append every key's finished finest-resolution buckets to HISTORY."""
+    res = HISTORY.levels[0][0]
+    now_s = CLOCK.now_ms() // 1000
+    complete = now_s - now_s % res
+    shift_s = CLOCK.wall_offset_ms // 1000
+    buckets = (
+        (key, b.start + shift_s, b)
+        for key, agg in AGGREGATES.items()
+        if isinstance(agg, WindowAggregates)
+        for r, b in agg.buckets()
+        if r == res and b.start < complete
+    )
+    return HISTORY.record(buckets, complete + shift_s)
+
+
+async def _history_flush_loop() -> None:
+    while True:
+        await asyncio.sleep(HISTORY_FLUSH_S)
+        try:
+            flush_history()
+        except OSError:
+            logger.exception("failed to append to history in %s", HISTORY_DIR)
+
+
+async def _history_compact_loop() -> None:
+    while True:
+        await asyncio.sleep(HISTORY_COMPACT_S)
+        try:
+            await asyncio.to_thread(HISTORY.compact, _wall_s(CLOCK.now_ms()))
+        except OSError:
+            logger.exception("failed to compact history in %s", HISTORY_DIR)
 
 
 # --- API
 class UpsertPolicy(BaseModel):
     policy: Policy
+    version: Optional[int] = Field(
+        None, description="Set when a cluster node pushes its policy to the others; older versions are ignored"
+    )
 
 
 @app.get("/healthz")
@@ -194,43 +634,785 @@ async def healthz():
     return {"ok": True, "ts": _now().isoformat()}
 
 
+@app.get("/stats")
+async def stats():
+    return {
+        **STATS,
+        "decision_cache_size": len(DECISIONS),
+        "attr_sets": len(ATTRS),
+        "attr_overflows": ATTRS.overflowed,
+        **EVAL_FLIGHT.stats(),
+        **LOOP_LAG.stats(),
+        **INGEST_QUEUE.stats(),
+        **WATCH.stats(),
+        **(STORE.stats() if STORE is not None else {}),
+        **(CLUSTER.stats() if CLUSTER is not None else {}),
+        **(WAL.stats() if WAL is not None else {}),
+        **(HISTORY.stats() if HISTORY is not None else {}),
+    }
+
+
 @app.get("/policy", response_model=Policy)
 async def get_policy():
-    return POLICY
+    return _plan().policy
+
+
+def _served(key: tuple[str, str]) -> Optional[Tuple[str, float, int]]:
+    # Actions the key's clients were last given, the baseline for fleet changes
+    published = WATCH.current(key)
+    if published is None:
+        return None
+    config = published.config
+    return config.log_level, config.trace_sample_rate, config.metric_period_s
+
+
+def _fleet_table(
+    keys: List[tuple[str, str]],
+    plan: CompiledPolicy,
+    selected: Dict[Tuple[tuple[str, str], int], Tuple[int, List[Bucket], bool]],
+    baseline: Dict[tuple[str, str], Optional[Tuple[str, float, int]]],
+) -> Tuple[FleetEvaluator, FleetResult]:
+    # Runs on OFFLOAD_POOL against a private table; the selected buckets are no
+    # longer written to
+    empty = {"latency_p95_ms": 0.0, "error_rate": 0.0}
+
+    def aggregates(key: tuple[str, str], window_s: int) -> Dict[str, float]:
+        picked = selected.get((key, window_s))
+        return empty if picked is None else summarize(merge_buckets(*picked))
+
+    fleet = FleetEvaluator()
+    for key in keys:
+        fleet.key_id(key)
+    fleet.load(plan.refs, aggregates)
+    return fleet, fleet.evaluate(plan, baseline.get)
+
+
+async def _evaluate_fleet(plan: CompiledPolicy) -> None:
+    """Recompute every known key's decision under ``plan`` and publish the changes.
+
+    Buckets are selected on the loop, merged and run through the fleet
+    evaluator on OFFLOAD_POOL, and the resulting table replaces FLEET back on
+    the loop. Changed configs are published straight from the table.
+    """
+    global FLEET, LAST_FLEET
+    now_ms = CLOCK.now_ms()
+    keys = list(FLEET.keys)
+    windows = {ref.window_s for ref in plan.refs}
+    selected = {}
+    for key in keys:
+        agg = _find_aggregates(key)
+        if agg is None:
+            continue
+        for w in windows:
+            selected[(key, w)] = (*agg.select(now_ms, min(w or WINDOW_MAX, WINDOW_MAX), copy_live=True), agg.exact)
+    baseline = {key: _served(key) for key in keys}
+    fleet, result = await asyncio.get_running_loop().run_in_executor(
+        OFFLOAD_POOL, _fleet_table, keys, plan, selected, baseline
+    )
+    if _plan() is not plan:
+        # A newer policy was applied meanwhile and evaluates the fleet itself
+        return
+    # Keys tracked or released while the table was computed
+    current = set(FLEET.keys)
+    fleet.drop([key for key in fleet.keys if key not in current])
+    for key in FLEET.keys:
+        fleet.key_id(key)
+    FLEET, LAST_FLEET = fleet, result
+    # Publish changed keys that have a config out or a watcher; a key
+    # evaluated meanwhile already carries a decision under this plan
+    watched = set(WATCH.watched())
+    for key in result.changed:
+        if key in current and _served(key) == baseline[key] and (baseline[key] is not None or key in watched):
+            log_level, rate, period = fleet.config(key)
+            config = EffectiveConfig(
+                service=key[0], environment=key[1], log_level=log_level, trace_sample_rate=rate, metric_period_s=period
+            )
+            WATCH.publish(key, config)
+    # Watched keys without signals are not tracked by the fleet
+    for key in watched:
+        if fleet.config(key) is None:
+            evaluate(*key)
 
 
 @app.post("/policy", response_model=Policy)
-async def set_policy(req: UpsertPolicy):
-    global POLICY
-    POLICY = req.policy
+async def set_policy(req: UpsertPolicy, request: Request):
+    """Compile and switch to a new policy.
+
+    In cluster mode the node that takes the upsert pushes it, with its
+    version, to every other node, so all of them evaluate the same plan.
+    """
+    global POLICY, PLAN
+    if req.version is not None and req.version <= _plan().version:
+        # A push this node has already applied, or one overtaken by a newer policy
+        return _plan().policy
+    try:
+        plan = compile_policy(req.policy, req.version or _plan().version + 1, WINDOW_MAX)
+        if STORE is not None:
+            # Other workers switch once they see the shared version move
+            version = STORE.publish_policy(plan.policy.model_dump_json().encode(), plan.version)
+            if version != plan.version:
+                plan = compile_policy(plan.policy, version, WINDOW_MAX)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if WAL is not None:
+        WAL.append_policy(plan.version, plan.policy.model_dump_json().encode())
+        WAL.commit()
+    # Single reference swap; evaluate reads PLAN once per call
+    PLAN = plan
+    POLICY = plan.policy
+    await _evaluate_fleet(plan)
+    if CLUSTER is not None and not request.headers.get(FORWARDED_HEADER):
+        await _push_policy(CLUSTER.ring.nodes)
     return POLICY
 
 
-class SignalIn(BaseModel):
+async def _push_policy(nodes: Iterable[str]) -> None:
+    payload = {"policy": PLAN.policy.model_dump(mode="json"), "version": PLAN.version}
+    await CLUSTER.broadcast("/policy", payload, nodes)
+
+
+class ConfigKey(BaseModel):
     service: str
     environment: str
-    latency_ms: Optional[float] = None
-    error: Optional[bool] = None
-    attrs: Dict[str, str] = Field(default_factory=dict)
+
+
+class FleetChanges(BaseModel):
+    version: int
+    keys: int
+    elapsed_ms: float
+    changed: List[ConfigKey] = Field(default_factory=list)
+
+
+@app.get("/fleet/changes", response_model=FleetChanges)
+async def fleet_changes():
+    # Keys whose decision changed with the last policy upsert
+    if LAST_FLEET is None:
+        return FleetChanges(version=PLAN.version, keys=0, elapsed_ms=0.0)
+    return FleetChanges(
+        version=LAST_FLEET.version,
+        keys=LAST_FLEET.keys,
+        elapsed_ms=LAST_FLEET.elapsed_ms,
+        changed=[ConfigKey(service=s, environment=e) for s, e in LAST_FLEET.changed],
+    )
+
+
+async def _route(request: Request, key: tuple[str, str]) -> Optional[Response]:
+    # The owner's response when another node owns the key, else None
+    if CLUSTER is None or CLUSTER.is_local(key) or request.headers.get(FORWARDED_HEADER):
+        return None
+    owner = CLUSTER.owner(key)
+    # The scope's path is decoded (and request.url, rebuilt from it, splits at
+    # a decoded "?"); re-quote each segment so names holding "?", "#", "%" or
+    # spaces reach the owner intact
+    path = "/".join(quote(segment, safe="") for segment in request.scope["path"].split("/"))
+    query = request.scope["query_string"].decode("latin-1")
+    # Watches are long-lived, so they always go to the owner directly
+    if CLUSTER.mode == "redirect" or path.endswith("/watch"):
+        CLUSTER.redirected += 1
+        return RedirectResponse(owner + path + (f"?{query}" if query else ""), status_code=307)
+    try:
+        resp = await CLUSTER.forward(owner, request.method, path, query, request.headers, await request.body())
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"owner {owner} is unreachable: {e}")
+    headers = {k: resp.headers[k] for k in ("content-type", "etag") if k in resp.headers}
+    return Response(resp.content, status_code=resp.status_code, headers=headers)
 
 
 @app.post("/signal", response_model=EffectiveConfig)
-async def ingest_signal(sig: SignalIn):
-    s = Signal(
-        service=sig.service,
-        environment=sig.environment,
-        ts=_now(),
-        latency_ms=sig.latency_ms,
-        error=sig.error,
-        attrs=sig.attrs,
+async def ingest_signal(sig: SignalIn, request: Request):
+    key = (sig.service, sig.environment)
+    routed = await _route(request, key)
+    if routed is not None:
+        return routed
+    _record(SignalRecord(sig.service, sig.environment, CLOCK.now_ms(), sig.latency_ms, sig.error, sig.attrs))
+    return await EVAL_FLIGHT.do(key, lambda: evaluate_async(*key))
+
+
+_signal_list = TypeAdapter(List[SignalIn])
+
+
+def _parse_signals(body: bytes, content_type: str) -> List[SignalIn]:
+    # JSON array by default, one object per line for NDJSON
+    try:
+        if "ndjson" in content_type:
+            return [SignalIn.model_validate_json(line) for line in body.splitlines() if line.strip()]
+        return _signal_list.validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json_safe_errors(e.errors(include_url=False)))
+
+
+_SIGNAL_BATCH_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": SignalIn.model_json_schema()}},
+            "application/x-ndjson": {"schema": SignalIn.model_json_schema()},
+        },
+    }
+}
+
+
+def _to_records(sigs: List[SignalIn]) -> List[SignalRecord]:
+    ts_ms = CLOCK.now_ms()
+    return [
+        SignalRecord(sig.service, sig.environment, ts_ms, sig.latency_ms, sig.error, sig.attrs)
+        for sig in sigs
+    ]
+
+
+def _split_by_owner(
+    request: Request, items: List[T], key_of: Callable[[T], tuple[str, str]]
+) -> Tuple[List[T], Dict[str, List[T]]]:
+    # This node's share and every other owner's; forwarded batches are all local
+    if CLUSTER is None or request.headers.get(FORWARDED_HEADER):
+        return items, {}
+    local: List[T] = []
+    remote: Dict[str, List[T]] = {}
+    for item in items:
+        owner = CLUSTER.owner(key_of(item))
+        (local if owner == CLUSTER.self_url else remote.setdefault(owner, [])).append(item)
+    return local, remote
+
+
+async def _forward_shares(path: str, shares: Dict[str, bytes]) -> Dict[str, Optional[bytes]]:
+    # Each owner's response body, or None when the owner could not take its share
+    async def send(owner: str, body: bytes) -> Optional[bytes]:
+        try:
+            resp = await CLUSTER.forward(owner, "POST", path, "", {"content-type": "application/json"}, body)
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning("owner %s did not take its share of %s: %s", owner, path, e)
+            return None
+        return resp.content
+
+    bodies = await asyncio.gather(*(send(owner, body) for owner, body in shares.items()))
+    return dict(zip(shares, bodies))
+
+
+def _unavailable(into: Dict[str, List[str]], keys: Iterable[tuple[str, str]]) -> None:
+    for service, env in keys:
+        envs = into.setdefault(service, [])
+        if env not in envs:
+            envs.append(env)
+
+
+def _merge_shares(
+    result: SignalBatchResult, remote: Dict[str, list], bodies: Dict[str, Optional[bytes]], key_of: Callable
+) -> None:
+    for owner, body in bodies.items():
+        if body is None:
+            _unavailable(result.unavailable, map(key_of, remote[owner]))
+            continue
+        sub = SignalBatchResult.model_validate_json(body)
+        result.accepted += sub.accepted
+        for service, envs in sub.configs.items():
+            result.configs.setdefault(service, {}).update(envs)
+
+
+def _signal_key(sig: SignalIn) -> tuple[str, str]:
+    return sig.service, sig.environment
+
+
+@app.post("/signals", response_model=SignalBatchResult, openapi_extra=_SIGNAL_BATCH_BODY)
+async def ingest_signals(request: Request):
+    """Ingest a batch; in cluster mode each owner's share is forwarded to it.
+
+    Shares are forwarded before the local one is applied. Keys whose owner
+    was unreachable are listed under ``unavailable`` and nothing for them was
+    applied, so a client can resend just those; the batch fails with 502 only
+    when no share was applied at all.
+    """
+    sigs = _parse_signals(await request.body(), request.headers.get("content-type", ""))
+    sigs, remote = _split_by_owner(request, sigs, _signal_key)
+    bodies = await _forward_shares("/signals", {o: _signal_list.dump_json(b) for o, b in remote.items()})
+    if remote and not sigs and not any(bodies.values()):
+        raise HTTPException(status_code=502, detail=f"owners {sorted(remote)} are unreachable")
+    result = SignalBatchResult(accepted=len(sigs))
+    for (service, env), cfg in _ingest(_to_records(sigs)).items():
+        result.configs.setdefault(service, {})[env] = cfg
+    _merge_shares(result, remote, bodies, _signal_key)
+    return result
+
+
+# Fire-and-forget ingest: signals are timestamped on arrival and applied by a
+# background worker; see ingest.py for the overflow policies.
+INGEST_QUEUE = IngestQueue(
+    apply=_ingest,
+    maxsize=int(os.getenv("CP_INGEST_QUEUE_MAX", "100000")),
+    policy=os.getenv("CP_INGEST_QUEUE_POLICY", "drop_newest"),
+)
+
+
+class IngestAccepted(BaseModel):
+    accepted: int
+    dropped: int
+    queue_depth: int
+    # As in SignalBatchResult: keys whose owner was unreachable, nothing queued
+    unavailable: Dict[str, List[str]] = Field(default_factory=dict)
+
+
+@app.post(
+    "/signals/async",
+    response_model=IngestAccepted,
+    status_code=status.HTTP_202_ACCEPTED,
+    openapi_extra=_SIGNAL_BATCH_BODY,
+)
+async def enqueue_signals(request: Request):
+    sigs = _parse_signals(await request.body(), request.headers.get("content-type", ""))
+    if not INGEST_QUEUE.running:
+        raise HTTPException(status_code=503, detail="ingest queue is not running")
+    sigs, remote = _split_by_owner(request, sigs, _signal_key)
+    bodies = await _forward_shares("/signals/async", {o: _signal_list.dump_json(b) for o, b in remote.items()})
+    if remote and not sigs and not any(bodies.values()):
+        raise HTTPException(status_code=502, detail=f"owners {sorted(remote)} are unreachable")
+    accepted = await INGEST_QUEUE.put(_to_records(sigs))
+    result = IngestAccepted(
+        accepted=accepted,
+        dropped=len(sigs) - accepted,
+        queue_depth=INGEST_QUEUE.stats()["ingest_queue_depth"],
+    )
+    for owner, body in bodies.items():
+        if body is None:
+            _unavailable(result.unavailable, map(_signal_key, remote[owner]))
+            continue
+        sub = IngestAccepted.model_validate_json(body)
+        result.accepted += sub.accepted
+        result.dropped += sub.dropped
+    return result
+
+
+_summary_list = TypeAdapter(List[SummaryIn])
+
+
+def _summary_key(sm: SummaryIn) -> tuple[str, str]:
+    return sm.service, sm.environment
+
+
+@app.post("/summaries", response_model=SignalBatchResult)
+async def ingest_summaries(summaries: List[SummaryIn], request: Request):
+    # Routed like /signals; merged straight into the current time buckets,
+    # raw windows are untouched
+    summaries, remote = _split_by_owner(request, summaries, _summary_key)
+    bodies = await _forward_shares("/summaries", {o: _summary_list.dump_json(b) for o, b in remote.items()})
+    if remote and not summaries and not any(bodies.values()):
+        raise HTTPException(status_code=502, detail=f"owners {sorted(remote)} are unreachable")
+    ts_ms = CLOCK.now_ms()
+    touched = {}
+    # As in _ingest, nothing is applied when a key does not fit the shared state
+    aggs = [_aggregates_for(_summary_key(sm)) for sm in summaries]
+    for sm, agg in zip(summaries, aggs):
+        key = (sm.service, sm.environment)
+        agg.add_summary(ts_ms, sm.count, min(sm.errors, sm.count), sm.latency)
+        if WAL is not None:
+            WAL.append_summary(ts_ms, sm)
+        touched[key] = None
+    if WAL is not None:
+        WAL.commit()
+    result = SignalBatchResult(accepted=len(summaries))
+    for service, env in touched:
+        result.configs.setdefault(service, {})[env] = evaluate(service, env)
+    _merge_shares(result, remote, bodies, _summary_key)
+    return result
+
+
+class AttrCounts(BaseModel):
+    key: str
+    counts: Dict[str, int] = Field(default_factory=dict)
+
+
+@app.get("/attrs/{service}/{environment}", response_model=AttrCounts)
+async def attr_counts(service: str, environment: str, key: str, request: Request):
+    # Retained raw signals per value of one attribute
+    routed = await _route(request, (service, environment))
+    if routed is not None:
+        return routed
+    _prune((service, environment), CLOCK.now_ms())
+    buf = SIGNALS.get((service, environment))
+    counts = ATTRS.group(buf.attr_histogram(), key) if buf else {}
+    return AttrCounts(key=key, counts=counts)
+
+
+class HistoryPoint(BaseModel):
+    ts: datetime  # start of the interval, UTC
+    count: int
+    errors: int
+    error_rate: float
+    latency_p50_ms: float
+    latency_p95_ms: float
+    latency_p99_ms: float
+
+
+class HistorySeries(BaseModel):
+    service: str
+    environment: str
+    resolution_s: int
+    points: List[HistoryPoint] = Field(default_factory=list)
+
+
+def _epoch_s(dt: datetime) -> int:
+    # Naive datetimes are UTC, like the ones the API returns
+    return int(dt.timestamp()) if dt.tzinfo else int((dt - datetime(1970, 1, 1)).total_seconds())
+
+
+def _history_resolution(start_s: int, end_s: int) -> int:
+    # Finest level still retaining start_s without exceeding HISTORY_MAX_POINTS
+    now_s = _wall_s(CLOCK.now_ms())
+    for res, _, retention_s in HISTORY.levels:
+        if start_s >= now_s - retention_s and (end_s - start_s) // res <= HISTORY_MAX_POINTS:
+            return res
+    return HISTORY.levels[-1][0]
+
+
+@app.get("/history/{service}/{environment}", response_model=HistorySeries)
+async def history(
+    request: Request,
+    service: str,
+    environment: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution_s: Optional[int] = None,
+):
+    # Rollups past WINDOW_MAX; the last hour by default
+    key = (service, environment)
+    routed = await _route(request, key)
+    if routed is not None:
+        return routed
+    if HISTORY is None:
+        raise HTTPException(status_code=404, detail="history is not enabled; set CP_HISTORY_DIR or CP_DATA_DIR")
+    end_s = _epoch_s(end) if end is not None else _wall_s(CLOCK.now_ms())
+    start_s = _epoch_s(start) if start is not None else end_s - 3600
+    if start_s >= end_s:
+        raise HTTPException(status_code=422, detail="start must be before end")
+    if resolution_s is None:
+        resolution_s = _history_resolution(start_s, end_s)
+    elif resolution_s not in [res for res, _, _ in HISTORY.levels]:
+        raise HTTPException(status_code=422, detail=f"resolution_s must be one of {[r for r, _, _ in HISTORY.levels]}")
+    buckets = await asyncio.get_running_loop().run_in_executor(
+        OFFLOAD_POOL, HISTORY.query, key, start_s, end_s, resolution_s
+    )
+    return HistorySeries(
+        service=service,
+        environment=environment,
+        resolution_s=resolution_s,
+        points=[
+            HistoryPoint(
+                ts=datetime(1970, 1, 1) + timedelta(seconds=b.start),
+                count=b.count,
+                errors=b.errors,
+                error_rate=b.error_rate,
+                latency_p50_ms=b.latency.quantile(0.5),
+                latency_p95_ms=b.latency.quantile(0.95),
+                latency_p99_ms=b.latency.quantile(0.99),
+            )
+            for b in buckets
+        ],
+    )
+
+
+def _fresh_published(key: tuple[str, str]) -> Optional[Published]:
+    # Published config if the decision behind it is still fresh
+    published = WATCH.current(key)
+    if published is None or not _fresh(DECISIONS.get(key), _plan(), _generation(key), CLOCK.now_ms() // 1000):
+        return None
+    return published
+
+
+def _published_for(key: tuple[str, str]) -> Published:
+    published = _fresh_published(key)
+    if published is None:
+        evaluate(*key)
+        published = WATCH.current(key)
+    return published
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    return any(t.strip() in (etag, f"W/{etag}", "*") for t in if_none_match.split(","))
+
+
+_CONFIG_PARAMS = {
+    "parameters": [
+        {"name": "service", "in": "path", "required": True, "schema": {"type": "string"}},
+        {"name": "environment", "in": "path", "required": True, "schema": {"type": "string"}},
+        {"name": "If-None-Match", "in": "header", "required": False, "schema": {"type": "string"}},
+    ]
+}
+
+
+@app.get(
+    "/config/{service}/{environment}",
+    response_model=EffectiveConfig,
+    responses={304: {"description": "Config unchanged since the ETag in If-None-Match"}},
+    openapi_extra=_CONFIG_PARAMS,
+)
+async def get_config(request: Request):
+    # Served from the published bytes: a still-fresh decision skips the
+    # engine, and neither path goes through response_model serialization.
+    # Path params and headers are read raw to skip per-request validation.
+    service, environment = request.path_params["service"], request.path_params["environment"]
+    if_none_match = request.headers.get("if-none-match")
+    key = (service, environment)
+    routed = await _route(request, key)
+    if routed is not None:
+        return routed
+    published = _fresh_published(key)
+    if published is None:
+        await EVAL_FLIGHT.do(key, lambda: evaluate_async(*key))
+        published = WATCH.current(key)
+    headers = {"ETag": published.etag}
+    if if_none_match and _etag_matches(if_none_match, published.etag):
+        STATS["config_not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    return Response(published.body, media_type="application/json", headers=headers)
+
+
+class ConfigVersion(BaseModel):
+    version: int
+    config: EffectiveConfig
+
+
+@app.get(
+    "/config/{service}/{environment}/watch",
+    response_model=ConfigVersion,
+    responses={304: {"description": "No change before the timeout"}},
+)
+async def watch_config(
+    service: str,
+    environment: str,
+    request: Request,
+    since_version: Optional[int] = None,
+    timeout_s: float = Query(30.0, gt=0, le=300),
+):
+    """Long-poll by default; an SSE stream with ``Accept: text/event-stream``.
+
+    Long-poll returns as soon as the key's config version differs from
+    ``since_version`` (immediately if it is omitted), or 304 after
+    ``timeout_s``. The stream sends the current config and then every new
+    version as a ``config`` event whose id is the version; ``timeout_s`` is
+    the keep-alive interval there.
+    """
+    key = (service, environment)
+    routed = await _route(request, key)
+    if routed is not None:
+        return routed
+    # Make sure the key has a published version to compare against
+    evaluate(service, environment)
+    if "text/event-stream" not in request.headers.get("accept", ""):
+        latest = await WATCH.wait(key, since_version, timeout_s)
+        if latest is None:
+            return Response(status_code=304)
+        return ConfigVersion(version=latest.version, config=latest.config)
+
+    last_event_id = request.headers.get("last-event-id")
+    if since_version is None and last_event_id and last_event_id.isdigit():
+        since_version = int(last_event_id)
+
+    async def events():
+        version = since_version
+        while not await request.is_disconnected():
+            if CLUSTER is not None and not CLUSTER.is_local(key):
+                # The key moved; the client reconnects and is sent to the new owner
+                break
+            latest = await WATCH.wait(key, version, timeout_s)
+            if latest is None:
+                yield ": keep-alive\n\n"
+                continue
+            version = latest.version
+            yield f"id: {version}\nevent: config\ndata: {latest.body.decode()}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+# Streamed bulk lookups yield to the event loop after this many entries
+BULK_STREAM_CHUNK = 500
+
+
+class ConfigQuery(BaseModel):
+    service: str
+    environment: str
+    version: Optional[int] = Field(
+        None, description="Version the caller already has; versions from another process never match"
     )
-    key = (s.service, s.environment)
-    buf = SIGNALS.setdefault(key, [])
-    buf.append(s)
-    _prune(key)
-    return evaluate(s.service, s.environment)
 
 
-@app.get("/config/{service}/{environment}", response_model=EffectiveConfig)
-async def get_config(service: str, environment: str):
-    return evaluate(service, environment)
+class BulkConfigRequest(BaseModel):
+    """Explicit keys and/or a selector over every key with signals."""
+
+    keys: List[ConfigQuery] = Field(default_factory=list)
+    service_prefix: Optional[str] = None
+    environment: Optional[str] = Field(None, description="Restricts the prefix selector to one environment")
+
+
+class ConfigEntry(BaseModel):
+    service: str
+    environment: str
+    version: int
+    modified: bool
+    config: Optional[EffectiveConfig] = Field(None, description="Omitted when the caller's version is current")
+
+
+class BulkConfigResult(BaseModel):
+    entries: List[ConfigEntry] = Field(default_factory=list)
+
+
+def _bulk_keys(
+    req: BulkConfigRequest, selected_elsewhere: Iterable[tuple[str, str]] = ()
+) -> Dict[tuple[str, str], Optional[int]]:
+    # key -> caller's version, explicit keys first, then selected keys in order
+    keys = {(q.service, q.environment): q.version for q in req.keys}
+    if req.service_prefix is not None:
+        selected = {key for key in _known_keys() if key[0].startswith(req.service_prefix)}
+        selected = {key for key in selected if req.environment in (None, key[1])}
+        for key in sorted(selected | set(selected_elsewhere)):
+            if key not in keys:
+                keys[key] = None
+    return keys
+
+
+async def _bulk_remote(req: BulkConfigRequest) -> Dict[tuple[str, str], bytes]:
+    # Entries from the other nodes: explicit keys go to their owners, and a
+    # prefix selector to every node, since each only holds the keys it owns
+    shares: Dict[str, BulkConfigRequest] = {}
+    for q in req.keys:
+        owner = CLUSTER.owner((q.service, q.environment))
+        if owner != CLUSTER.self_url:
+            shares.setdefault(owner, BulkConfigRequest()).keys.append(q)
+    if req.service_prefix is not None:
+        for node in CLUSTER.ring.nodes:
+            if node != CLUSTER.self_url:
+                share = shares.setdefault(node, BulkConfigRequest())
+                share.service_prefix, share.environment = req.service_prefix, req.environment
+
+    async def fetch(owner: str, share: BulkConfigRequest) -> List[dict]:
+        body = share.model_dump_json().encode()
+        try:
+            resp = await CLUSTER.forward(owner, "POST", "/configs", "", {"content-type": "application/json"}, body)
+            resp.raise_for_status()
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=502, detail=f"owner {owner} is unreachable: {e}")
+        return resp.json()["entries"]
+
+    entries = {}
+    for batch in await asyncio.gather(*(fetch(owner, share) for owner, share in shares.items())):
+        for e in batch:
+            entries[(e["service"], e["environment"])] = json.dumps(e, separators=(",", ":")).encode()
+    return entries
+
+
+def _entry_bytes(key: tuple[str, str], since_version: Optional[int]) -> bytes:
+    # Built around the published body so configs are never re-serialized. Versions
+    # are unique across processes (see ConfigWatch), so equality means same config
+    published = _published_for(key)
+    head = f'{{"service":{json.dumps(key[0])},"environment":{json.dumps(key[1])},"version":{published.version},'
+    if published.version == since_version:
+        return (head + '"modified":false,"config":null}').encode()
+    return (head + '"modified":true,"config":').encode() + published.body + b"}"
+
+
+@app.post(
+    "/configs",
+    response_model=BulkConfigResult,
+    responses={200: {"content": {"application/x-ndjson": {"schema": ConfigEntry.model_json_schema()}}}},
+)
+async def bulk_configs(req: BulkConfigRequest, request: Request):
+    """Effective configs for many keys in one call.
+
+    Entries whose ``version`` matches the caller's come back with
+    ``modified: false`` and no config. With ``Accept: application/x-ndjson``
+    the entries are streamed one per line as they are evaluated. In cluster
+    mode, other nodes' entries are fetched from them first.
+    """
+    remote: Dict[tuple[str, str], bytes] = {}
+    if CLUSTER is not None and not request.headers.get(FORWARDED_HEADER):
+        remote = await _bulk_remote(req)
+    keys = _bulk_keys(req, remote)
+
+    def entry(key: tuple[str, str], since: Optional[int]) -> bytes:
+        return remote[key] if key in remote else _entry_bytes(key, since)
+
+    if "ndjson" in request.headers.get("accept", ""):
+        async def lines():
+            for i, (key, since) in enumerate(keys.items()):
+                yield entry(key, since) + b"\n"
+                if i % BULK_STREAM_CHUNK == BULK_STREAM_CHUNK - 1:
+                    await asyncio.sleep(0)
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    body = b",".join(entry(key, since) for key, since in keys.items())
+    return Response(b'{"entries":[' + body + b"]}", media_type="application/json")
+
+
+class ClusterView(BaseModel):
+    node: str
+    mode: str
+    nodes: List[str]
+    released: int = Field(0, description="Keys dropped by this node because another node now owns them")
+
+
+class ClusterNode(BaseModel):
+    node: str
+
+
+class ClusterMembership(BaseModel):
+    nodes: List[str]
+
+
+def _cluster() -> Cluster:
+    if CLUSTER is None:
+        raise HTTPException(status_code=404, detail="cluster mode is off")
+    return CLUSTER
+
+
+def _rebalance() -> int:
+    # Keys that moved to another node start afresh there; their windows refill
+    # within WINDOW_MAX, so local state is dropped rather than handed over.
+    # Their watchers are woken and reconnect through the new owner.
+    known = {*AGGREGATES, *SIGNALS, *DECISIONS, *WATCH.keys(), *WATCH.watched(), *FLEET.keys}
+    moved = [key for key in known if not CLUSTER.is_local(key)]
+    for key in moved:
+        AGGREGATES.pop(key, None)
+        SIGNALS.pop(key, None)
+        DECISIONS.pop(key, None)
+        WATCH.release(key)
+    FLEET.drop(moved)
+    return len(moved)
+
+
+def _view(released: int = 0) -> ClusterView:
+    return ClusterView(node=CLUSTER.self_url, mode=CLUSTER.mode, nodes=CLUSTER.ring.nodes, released=released)
+
+
+@app.get("/cluster", response_model=ClusterView)
+async def cluster_view():
+    _cluster()
+    return _view()
+
+
+@app.post("/cluster/nodes", response_model=ClusterView)
+async def set_cluster_nodes(req: ClusterMembership):
+    # Membership pushed by the node that handled a join or leave
+    _cluster().set_nodes(req.nodes)
+    return _view(_rebalance())
+
+
+@app.post("/cluster/join", response_model=ClusterView)
+async def cluster_join(req: ClusterNode):
+    cluster = _cluster()
+    cluster.set_nodes([*cluster.ring.nodes, req.node])
+    released = _rebalance()
+    await cluster.broadcast("/cluster/nodes", {"nodes": cluster.ring.nodes}, cluster.ring.nodes)
+    # A joining node starts with whatever policy it had; bring it up to date
+    await _push_policy([req.node.rstrip("/")])
+    return _view(released)
+
+
+@app.post("/cluster/leave", response_model=ClusterView)
+async def cluster_leave(req: ClusterNode):
+    cluster = _cluster()
+    node = req.node.rstrip("/")
+    if node == cluster.self_url:
+        raise HTTPException(status_code=422, detail="ask another node to remove this one")
+    cluster.set_nodes([n for n in cluster.ring.nodes if n != node])
+    released = _rebalance()
+    # The removed node is told too, so it stops answering for keys it no longer owns
+    await cluster.broadcast("/cluster/nodes", {"nodes": cluster.ring.nodes}, [*cluster.ring.nodes, node])
+    return _view(released)
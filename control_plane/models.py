@@ -0,0 +1,137 @@
+import math
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from pydantic import BaseModel, Field, NonNegativeInt, model_validator
+
+from control_plane.sketch import index_range
+
+
+# --- Models
+class Condition(BaseModel):
+    kind: str = Field(description="metric|error_rate|feature_flag|time|always")
+    op: str = Field(description=">|>=|<|<=|==|!=|in|contains|always")
+    key: Optional[str] = None
+    # For numeric comparisons we expect a float; keep simple for demo
+    value: Optional[float] = None
+    window_s: Optional[int] = Field(default=None, description="Rolling window seconds for aggregations")
+
+
+class Action(BaseModel):
+    log_level: Optional[str] = None  # DEBUG|INFO|WARN|ERROR
+    trace_sample_rate: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    metric_period_s: Optional[int] = Field(default=None, ge=1)
+
+
+class Rule(BaseModel):
+    id: str
+    description: Optional[str] = None
+    service: Optional[str] = None  # target service or *
+    environment: Optional[str] = None  # prod|staging|*
+    priority: int = 100  # lower runs first
+    conditions: List[Condition] = Field(default_factory=list)
+    actions: Action
+    enabled: bool = True
+
+
+class Policy(BaseModel):
+    id: str
+    description: Optional[str] = None
+    rules: List[Rule] = Field(default_factory=list)
+
+
+class Signal(BaseModel):
+    """The original timestamped signal, stored whole in the window.
+
+    No longer used by the service, which keeps ``SignalRecord`` rows; the
+    window and memory benchmarks measure against it.
+    """
+
+    service: str
+    environment: str
+    ts: datetime
+    latency_ms: Optional[float] = Field(default=None, ge=0.0, allow_inf_nan=False)
+    error: Optional[bool] = None
+    attrs: Dict[str, str] = Field(default_factory=dict)
+
+
+class SignalIn(BaseModel):
+    """A signal as agents send it; the receiver timestamps it."""
+
+    service: str
+    environment: str
+    latency_ms: Optional[float] = Field(default=None, ge=0.0, allow_inf_nan=False)
+    error: Optional[bool] = None
+    attrs: Dict[str, str] = Field(default_factory=dict)
+
+
+class SignalRecord(NamedTuple):
+    """Internal form of a signal, timestamped with the engine clock (ms)."""
+
+    service: str
+    environment: str
+    ts_ms: int
+    latency_ms: Optional[float] = None
+    error: Optional[bool] = None
+    attrs: Optional[Dict[str, str]] = None
+
+
+class LatencyHistogram(BaseModel):
+    """Serialized latency sketch: log buckets as produced by sketch.LatencySketch.
+
+    Bucket ``i`` covers ``(gamma**(i-1), gamma**i]`` milliseconds with
+    ``gamma = (1 + relative_accuracy) / (1 - relative_accuracy)``. Indices
+    must lie in ``sketch.index_range(relative_accuracy)``, the buckets of
+    ``(MIN_VALUE, MAX_VALUE]``.
+    """
+
+    relative_accuracy: float = Field(default=0.01, ge=1e-4, le=0.5)
+    zero_count: int = Field(default=0, ge=0)
+    bins: Dict[int, NonNegativeInt] = Field(default_factory=dict)
+
+    @model_validator(mode="after")
+    def _bins_in_range(self) -> "LatencyHistogram":
+        lo, hi = index_range(self.relative_accuracy)
+        bad = sorted(i for i in self.bins if not lo <= i <= hi)
+        if bad:
+            raise ValueError(f"bin indices must be in [{lo}, {hi}] at this relative_accuracy, got {bad[:5]}")
+        return self
+
+
+class EffectiveConfig(BaseModel):
+    service: str
+    environment: str
+    log_level: str = "INFO"
+    trace_sample_rate: float = 0.1
+    metric_period_s: int = 60
+
+
+class SummaryIn(BaseModel):
+    """Pre-aggregated signals for one key over an agent or aggregator flush interval."""
+
+    service: str
+    environment: str
+    count: int = Field(ge=0, description="Requests in the interval")
+    errors: int = Field(default=0, ge=0, description="Failed requests in the interval")
+    latency: Optional[LatencyHistogram] = None
+
+
+class SignalBatchResult(BaseModel):
+    accepted: int
+    # service -> environment -> effective config, one entry per touched key
+    configs: Dict[str, Dict[str, EffectiveConfig]] = Field(default_factory=dict)
+    # service -> environments whose owning node was unreachable in cluster mode;
+    # nothing for these keys was applied, so they are safe to resend
+    unavailable: Dict[str, List[str]] = Field(default_factory=dict)
+
+
+def json_safe_errors(errors: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Validation errors with non-finite inputs echoed as strings.
+
+    Errors carry the offending input, and NaN or Infinity would make the 422
+    body itself invalid JSON.
+    """
+    return [
+        {**e, "input": str(e["input"])} if isinstance(e.get("input"), float) and not math.isfinite(e["input"]) else e
+        for e in errors
+    ]
@@ -0,0 +1,457 @@
+import asyncio
+import json
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import zlib
+from array import array
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from control_plane.aggregates import Bucket, WindowAggregates
+from control_plane.intern import AttrTable
+from control_plane.models import SignalRecord, SummaryIn
+from control_plane.window import SignalWindow
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str]
+
+# When appended records reach the disk: fsync on every commit, fsync every
+# flush interval, or write every flush interval and let the OS sync
+FSYNC_MODES = ("always", "interval", "never")
+
+# Log record types
+REC_SIGNALS = 1
+REC_SUMMARY = 2
+REC_POLICY = 3
+
+_WAL_MAGIC = b"CPWAL001"
+_SNAP_MAGIC = b"CPSNAP01"
+_SEGMENT_HEAD = struct.Struct("<8sq")  # magic, wall clock offset of the engine ms inside
+_FRAME = struct.Struct("<BII")  # record type, payload length, payload crc32
+# magic, first log segment not covered, wall clock offset, policy version, body crc32
+_SNAP_HEAD = struct.Struct("<8sqqqI")
+# resolution, start, count, errors, sketch accuracy (0.0: exact values), zero count, entries
+_BUCKET = struct.Struct("<IqqqdqI")
+_H = struct.Struct("<H")
+_I = struct.Struct("<I")
+_Q = struct.Struct("<q")
+
+
+def _segment_path(directory: str, seq: int) -> str:
+    return os.path.join(directory, f"wal-{seq:012d}.log")
+
+
+def _snapshot_path(directory: str, seq: int) -> str:
+    return os.path.join(directory, f"snapshot-{seq:012d}.bin")
+
+
+def _numbered(directory: str, prefix: str, suffix: str) -> List[int]:
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(
+        int(n[len(prefix) : -len(suffix)])
+        for n in names
+        if n.startswith(prefix) and n.endswith(suffix) and n[len(prefix) : -len(suffix)].isdigit()
+    )
+
+
+def segments(directory: str) -> List[int]:
+    """Sequence numbers of the log segments in ``directory``, oldest first."""
+    return _numbered(directory, "wal-", ".log")
+
+
+def snapshots(directory: str) -> List[int]:
+    """Log sequence numbers of the snapshots in ``directory``, oldest first."""
+    return _numbered(directory, "snapshot-", ".bin")
+
+
+def _fsync_dir(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# --- Record payloads
+
+def _pack_key(key: Key) -> bytes:
+    encoded = f"{key[0]}\0{key[1]}".encode()
+    return _H.pack(len(encoded)) + encoded
+
+
+def _unpack_key(buf, off: int) -> Tuple[Key, int]:
+    (n,) = _H.unpack_from(buf, off)
+    service, env = bytes(buf[off + 2 : off + 2 + n]).decode().split("\0", 1)
+    return (service, env), off + 2 + n
+
+
+def encode_signals(key: Key, signals: Sequence[SignalRecord]) -> bytes:
+    # Columns, so a batch decodes with a few array copies
+    ts = array("q", [s.ts_ms for s in signals])
+    latency = array("d", [math.nan if s.latency_ms is None else s.latency_ms for s in signals])
+    errors = bytes(1 if s.error else 0 for s in signals)
+    attrs = json.dumps([s.attrs or None for s in signals]).encode() if any(s.attrs for s in signals) else b""
+    return b"".join(
+        (_pack_key(key), _I.pack(len(signals)), ts.tobytes(), latency.tobytes(), errors, _I.pack(len(attrs)), attrs)
+    )
+
+
+def decode_signals(payload, shift_ms: int = 0) -> Tuple[Key, List[SignalRecord]]:
+    key, off = _unpack_key(payload, 0)
+    (n,) = _I.unpack_from(payload, off)
+    off += 4
+    ts = array("q")
+    ts.frombytes(payload[off : off + 8 * n])
+    off += 8 * n
+    latency = array("d")
+    latency.frombytes(payload[off : off + 8 * n])
+    off += 8 * n
+    errors = bytes(payload[off : off + n])
+    off += n
+    (n_attrs,) = _I.unpack_from(payload, off)
+    attrs = json.loads(bytes(payload[off + 4 : off + 4 + n_attrs])) if n_attrs else [None] * n
+    service, env = key
+    return key, [
+        SignalRecord(service, env, t + shift_ms, None if lat != lat else lat, bool(e), a)
+        for t, lat, e, a in zip(ts, latency, errors, attrs)
+    ]
+
+
+def encode_summary(ts_ms: int, summary: SummaryIn) -> bytes:
+    return _Q.pack(ts_ms) + summary.model_dump_json().encode()
+
+
+def decode_summary(payload, shift_ms: int = 0) -> Tuple[int, SummaryIn]:
+    return _Q.unpack_from(payload)[0] + shift_ms, SummaryIn.model_validate_json(bytes(payload[8:]))
+
+
+def encode_policy(version: int, policy_json: bytes) -> bytes:
+    return _Q.pack(version) + policy_json
+
+
+def decode_policy(payload) -> Tuple[int, bytes]:
+    return _Q.unpack_from(payload)[0], bytes(payload[8:])
+
+
+# --- Write-ahead log
+
+class WriteAheadLog:
+    """Append-only log of ingested signals, summaries and policy updates.
+
+    Records are framed with their length and CRC and collected in memory;
+    ``flush`` writes the collected batch with one ``write``. With
+    ``fsync="always"`` each ``commit`` also fsyncs, so an acknowledged
+    request survives a crash. ``interval`` leaves flushing and fsync to
+    ``run`` (a crash loses at most one interval), and ``never`` writes on the
+    same schedule without fsync.
+
+    The log is a sequence of segment files ``wal-<seq>.log``, each starting
+    with the wall clock offset of the engine timestamps it holds. Opening a
+    log always starts a new segment after the existing ones, so a torn tail
+    left by a crash is never appended to. ``rotate`` also starts one, so a
+    snapshot can record which segments it covers. Segments a snapshot
+    covers are deleted, or moved to ``archive_dir`` when one is given.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        fsync: str = "interval",
+        wall_offset_ms: int = 0,
+        max_buffer: int = 1 << 20,
+        archive_dir: Optional[str] = None,
+    ) -> None:
+        if fsync not in FSYNC_MODES:
+            raise ValueError(f"unknown fsync mode {fsync!r}")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fsync = fsync
+        self.wall_offset_ms = wall_offset_ms
+        self.max_buffer = max_buffer
+        self.archive_dir = archive_dir
+        self._buf = bytearray()
+        self.records = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        # After archived segments too, so their names never collide
+        self.seq = max(segments(directory) + (segments(archive_dir) if archive_dir else []), default=0) + 1
+        self._file = self._open(self.seq)
+
+    def _open(self, seq: int):
+        f = open(_segment_path(self.directory, seq), "ab")
+        self._buf += _SEGMENT_HEAD.pack(_WAL_MAGIC, self.wall_offset_ms)
+        return f
+
+    def append(self, rtype: int, payload: bytes) -> None:
+        self._buf += _FRAME.pack(rtype, len(payload), zlib.crc32(payload))
+        self._buf += payload
+        self.records += 1
+        if len(self._buf) >= self.max_buffer:
+            self.flush(sync=False)
+
+    def append_signals(self, key: Key, signals: Sequence[SignalRecord]) -> None:
+        self.append(REC_SIGNALS, encode_signals(key, signals))
+
+    def append_summary(self, ts_ms: int, summary: SummaryIn) -> None:
+        self.append(REC_SUMMARY, encode_summary(ts_ms, summary))
+
+    def append_policy(self, version: int, policy_json: bytes) -> None:
+        self.append(REC_POLICY, encode_policy(version, policy_json))
+
+    def commit(self) -> None:
+        """End of a request's records; durable on return with ``fsync="always"``."""
+        if self.fsync == "always":
+            self.flush(sync=True)
+
+    def flush(self, sync: bool = False) -> None:
+        if self._buf:
+            self._file.write(self._buf)
+            self.bytes_written += len(self._buf)
+            self._buf.clear()
+            self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+
+    async def run(self, interval_s: float) -> None:
+        while True:
+            await asyncio.sleep(interval_s)
+            self.flush()
+            if self.fsync == "interval":
+                # On a duplicate, so a concurrent rotate can close the segment
+                fd = os.dup(self._file.fileno())
+                try:
+                    await asyncio.to_thread(os.fsync, fd)
+                finally:
+                    os.close(fd)
+                self.fsyncs += 1
+
+    def rotate(self) -> int:
+        """Close the current segment and start the next; returns its sequence number."""
+        self.flush(sync=self.fsync != "never")
+        self._file.close()
+        self.seq += 1
+        self._file = self._open(self.seq)
+        self.flush(sync=self.fsync != "never")
+        return self.seq
+
+    def remove_before(self, seq: int) -> int:
+        """Delete or archive the segments older than ``seq``; returns how many."""
+        old = [s for s in segments(self.directory) if s < seq]
+        if old and self.archive_dir is not None:
+            os.makedirs(self.archive_dir, exist_ok=True)
+        for s in old:
+            if self.archive_dir is not None:
+                shutil.move(_segment_path(self.directory, s), _segment_path(self.archive_dir, s))
+            else:
+                os.unlink(_segment_path(self.directory, s))
+        return len(old)
+
+    def close(self) -> None:
+        self.flush(sync=self.fsync != "never")
+        self._file.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "wal_segment": self.seq,
+            "wal_records": self.records,
+            "wal_bytes": self.bytes_written,
+            "wal_buffered_bytes": len(self._buf),
+            "wal_fsyncs": self.fsyncs,
+        }
+
+
+class LogRecord(NamedTuple):
+    seq: int  # segment
+    wall_offset_ms: int  # of the segment's engine timestamps
+    rtype: int
+    payload: memoryview
+
+
+def read_log(directory: str, from_seq: int = 0) -> Iterator[LogRecord]:
+    """Records of the segments from ``from_seq`` on, in order.
+
+    A segment is read up to its first incomplete or corrupt record, which
+    can only be the tail of a write interrupted by a crash.
+    """
+    for seq in segments(directory):
+        if seq < from_seq:
+            continue
+        with open(_segment_path(directory, seq), "rb") as f:
+            data = memoryview(f.read())
+        if len(data) < _SEGMENT_HEAD.size:
+            continue
+        magic, offset = _SEGMENT_HEAD.unpack_from(data)
+        if magic != _WAL_MAGIC:
+            logger.warning("skipping %s: not a log segment", _segment_path(directory, seq))
+            continue
+        pos = _SEGMENT_HEAD.size
+        while pos < len(data):
+            if pos + _FRAME.size > len(data):
+                break
+            rtype, n, crc = _FRAME.unpack_from(data, pos)
+            payload = data[pos + _FRAME.size : pos + _FRAME.size + n]
+            if len(payload) < n or zlib.crc32(payload) != crc:
+                break
+            yield LogRecord(seq, offset, rtype, payload)
+            pos += _FRAME.size + n
+        if pos < len(data):
+            logger.warning("ignoring %d bytes of torn log tail in segment %d", len(data) - pos, seq)
+
+
+# --- Snapshots
+
+def encode_snapshot(
+    wal_seq: int,
+    wall_offset_ms: int,
+    policy_version: int,
+    policy_json: bytes,
+    attrs: AttrTable,
+    keys: Iterable[Tuple[Key, WindowAggregates, SignalWindow]],
+) -> List[bytes]:
+    """Snapshot file contents, as chunks to hand to ``write_snapshot``.
+
+    Captures the state as of the start of log segment ``wal_seq``; call it
+    between ``rotate`` and the next append. Windows are stored as their
+    columns and buckets as their sketch bins, so loading is mostly array
+    copies.
+    """
+    attrs_json = json.dumps(attrs.dump()).encode()
+    chunks = [_I.pack(len(policy_json)), policy_json, _I.pack(len(attrs_json)), attrs_json]
+    count = 0
+    body = []
+    for key, agg, window in keys:
+        count += 1
+        ts, latency, errors, set_ids = window.columns()
+        buckets = list(agg.buckets())
+        body += [
+            _pack_key(key),
+            bytes((agg.exact,)),
+            _I.pack(len(ts)),
+            ts.tobytes(),
+            latency.tobytes(),
+            errors,
+            set_ids.tobytes(),
+            _I.pack(len(buckets)),
+        ]
+        for res, b in buckets:
+            sketch = b.latency
+            if agg.exact:
+                values = array("d", sketch.values)
+                body += [_BUCKET.pack(res, b.start, b.count, b.errors, 0.0, 0, len(values)), values.tobytes()]
+            else:
+                index = array("i", sketch.bins.keys())
+                counts = array("q", sketch.bins.values())
+                body += [
+                    _BUCKET.pack(res, b.start, b.count, b.errors, sketch.relative_accuracy, sketch.zero_count, len(index)),
+                    index.tobytes(),
+                    counts.tobytes(),
+                ]
+    chunks += [_I.pack(count)] + body
+    crc = 0
+    for c in chunks:
+        crc = zlib.crc32(c, crc)
+    return [_SNAP_HEAD.pack(_SNAP_MAGIC, wal_seq, wall_offset_ms, policy_version, crc)] + chunks
+
+
+def write_snapshot(directory: str, wal_seq: int, chunks: Iterable[bytes]) -> str:
+    """Write a snapshot atomically and delete the ones it supersedes."""
+    path = _snapshot_path(directory, wal_seq)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        for c in chunks:
+            f.write(c)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(directory)
+    for seq in snapshots(directory):
+        if seq < wal_seq:
+            os.unlink(_snapshot_path(directory, seq))
+    return path
+
+
+class Snapshot:
+    """Read-only view of a snapshot file, mapped with ``mmap``."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mm)
+        if len(self._buf) < _SNAP_HEAD.size:
+            self.close()
+            raise ValueError(f"{path} is truncated")
+        magic, self.wal_seq, self.wall_offset_ms, self.policy_version, crc = _SNAP_HEAD.unpack_from(self._buf)
+        if magic != _SNAP_MAGIC or zlib.crc32(self._buf[_SNAP_HEAD.size :]) != crc:
+            self.close()
+            raise ValueError(f"{path} is not a valid snapshot")
+        off = _SNAP_HEAD.size
+        (n,) = _I.unpack_from(self._buf, off)
+        self.policy = bytes(self._buf[off + 4 : off + 4 + n])
+        off += 4 + n
+        (n,) = _I.unpack_from(self._buf, off)
+        self._attrs = json.loads(bytes(self._buf[off + 4 : off + 4 + n]))
+        self._keys_at = off + 4 + n
+
+    def close(self) -> None:
+        self._buf.release()
+        self._mm.close()
+
+    def attrs(self, max_values: int = 1000, max_sets: int = 100_000) -> AttrTable:
+        return AttrTable.load(self._attrs, max_values, max_sets)
+
+    def _array(self, typecode: str, off: int, n: int) -> Tuple[array, int]:
+        a = array(typecode)
+        end = off + n * a.itemsize
+        a.frombytes(self._buf[off:end])
+        return a, end
+
+    def keys(self) -> Iterator[Tuple[Key, WindowAggregates, SignalWindow]]:
+        buf = self._buf
+        (count,) = _I.unpack_from(buf, self._keys_at)
+        off = self._keys_at + 4
+        for _ in range(count):
+            key, off = _unpack_key(buf, off)
+            exact = bool(buf[off])
+            (n,) = _I.unpack_from(buf, off + 1)
+            ts, off = self._array("q", off + 5, n)
+            latency, off = self._array("f", off, n)
+            errors = bytes(buf[off : off + (n + 7) // 8])
+            set_ids, off = self._array("I", off + (n + 7) // 8, n)
+            window = SignalWindow.from_columns(ts, latency, errors, set_ids)
+
+            agg = WindowAggregates(exact=exact)
+            (n_buckets,) = _I.unpack_from(buf, off)
+            off += 4
+            for _ in range(n_buckets):
+                res, start, b_count, b_errors, accuracy, zero, n = _BUCKET.unpack_from(buf, off)
+                off += _BUCKET.size
+                if exact:
+                    b = Bucket(start, exact=True)
+                    values, off = self._array("d", off, n)
+                    b.latency.values = values.tolist()
+                else:
+                    b = Bucket(start, relative_accuracy=accuracy)
+                    index, off = self._array("i", off, n)
+                    counts, off = self._array("q", off, n)
+                    b.latency.add_bins(accuracy, zero, dict(zip(index, counts)))
+                b.count, b.errors = b_count, b_errors
+                agg.restore(res, b)
+            yield key, agg, window
+
+
+def load_snapshot(directory: str) -> Optional[Snapshot]:
+    """Newest valid snapshot in ``directory``, or None."""
+    for seq in reversed(snapshots(directory)):
+        try:
+            return Snapshot(_snapshot_path(directory, seq))
+        except (OSError, ValueError) as e:
+            logger.warning("skipping snapshot %d: %s", seq, e)
+    return None
@@ -0,0 +1,240 @@
+import heapq
+import operator
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+from control_plane.models import EffectiveConfig, Policy, Rule
+
+COMPARATORS: Dict[str, Callable[[float, float], bool]] = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
+# Aggregates the engine knows how to compute; other metric keys read as 0.0
+AGGREGATE_NAMES = ("latency_p95_ms", "error_rate")
+
+# (log_level, trace_sample_rate, metric_period_s) before any rule applies
+DEFAULT_ACTIONS = tuple(
+    EffectiveConfig.model_fields[f].default for f in ("log_level", "trace_sample_rate", "metric_period_s")
+)
+
+
+@dataclass(frozen=True)
+class AggregateRef:
+    """An aggregate resolved to its name and (clamped) window in seconds."""
+
+    name: str
+    window_s: int
+
+
+@dataclass(frozen=True)
+class CompiledCondition:
+    ref: AggregateRef
+    op: str
+    compare: Callable[[float, float], bool]
+    threshold: float
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    id: str
+    priority: int
+    service: Optional[str]
+    environment: Optional[str]
+    conditions: Tuple[CompiledCondition, ...]
+    log_level: Optional[str]
+    trace_sample_rate: Optional[float]
+    metric_period_s: Optional[int]
+
+    def in_scope(self, service: str, env: str) -> bool:
+        return (not self.service or self.service == service) and (
+            not self.environment or self.environment == env
+        )
+
+    def matches(self, value: Callable[[AggregateRef], float]) -> bool:
+        for c in self.conditions:
+            if not c.compare(value(c.ref), c.threshold):
+                return False
+        return True
+
+
+class ScopeIndex:
+    """Candidate rules per (service, env), built from a compiled rule list.
+
+    Rules are bucketed by exact (service, env), exact service, exact env and
+    wildcard scope. Lookups merge the four buckets back into priority order
+    once per key and cache the result; the cache lives as long as the plan,
+    so a new policy version starts with a fresh index.
+    """
+
+    MAX_CACHED = 100_000
+
+    def __init__(self, rules: Tuple[CompiledRule, ...]) -> None:
+        self._exact: Dict[Tuple[str, str], List[Tuple[int, CompiledRule]]] = {}
+        self._service: Dict[str, List[Tuple[int, CompiledRule]]] = {}
+        self._env: Dict[str, List[Tuple[int, CompiledRule]]] = {}
+        self._wildcard: List[Tuple[int, CompiledRule]] = []
+        for pos, r in enumerate(rules):
+            if r.service and r.environment:
+                self._exact.setdefault((r.service, r.environment), []).append((pos, r))
+            elif r.service:
+                self._service.setdefault(r.service, []).append((pos, r))
+            elif r.environment:
+                self._env.setdefault(r.environment, []).append((pos, r))
+            else:
+                self._wildcard.append((pos, r))
+        self._cache: Dict[Tuple[str, str], Tuple[Tuple[CompiledRule, ...], Tuple[AggregateRef, ...]]] = {}
+
+    def candidates(self, service: str, env: str) -> Tuple[CompiledRule, ...]:
+        return self._lookup(service, env)[0]
+
+    def refs(self, service: str, env: str) -> Tuple[AggregateRef, ...]:
+        """Aggregates read by the candidate rules of (service, env)."""
+        return self._lookup(service, env)[1]
+
+    def _lookup(self, service: str, env: str) -> Tuple[Tuple[CompiledRule, ...], Tuple[AggregateRef, ...]]:
+        key = (service, env)
+        hit = self._cache.get(key)
+        if hit is not None:
+            return hit
+        parts = [
+            self._exact.get(key, ()),
+            self._service.get(service, ()),
+            self._env.get(env, ()),
+            self._wildcard,
+        ]
+        merged = tuple(r for _, r in heapq.merge(*(p for p in parts if p), key=lambda e: e[0]))
+        refs = tuple(dict.fromkeys(c.ref for r in merged for c in r.conditions))
+        if len(self._cache) >= self.MAX_CACHED:
+            self._cache.clear()
+        hit = self._cache[key] = (merged, refs)
+        return hit
+
+
+@dataclass(frozen=True)
+class CompiledPolicy:
+    """Immutable evaluation plan for one policy version.
+
+    Rules are enabled-only and sorted by priority, conditions carry their
+    comparator and threshold, and every aggregate a condition reads is
+    resolved up front. Swapping plans is a single reference assignment.
+
+    ``thresholds`` holds the sorted thresholds compared against each
+    aggregate. Where a value falls among them (its band) fixes the truth of
+    every condition on that aggregate, so rules only need re-running when a
+    band changes.
+    """
+
+    version: int
+    policy: Policy
+    rules: Tuple[CompiledRule, ...]
+    refs: Tuple[AggregateRef, ...]
+    thresholds: Dict[AggregateRef, Tuple[float, ...]] = field(compare=False, repr=False)
+    scopes: ScopeIndex = field(compare=False, repr=False)
+
+    def band(self, ref: AggregateRef, value: float) -> int:
+        """Even ``2i`` between thresholds, odd ``2i + 1`` exactly on threshold ``i``."""
+        th = self.thresholds[ref]
+        return bisect_left(th, value) + bisect_right(th, value)
+
+    def bands(self, service: str, env: str, value: Callable[[AggregateRef], float]) -> Tuple[int, ...]:
+        """Band signature of every aggregate the (service, env) rules read."""
+        return tuple(self.band(ref, value(ref)) for ref in self.scopes.refs(service, env))
+
+    def matched(self, service: str, env: str, value: Callable[[AggregateRef], float]) -> int:
+        """Bitmap of the (service, env) candidate rules whose conditions hold."""
+        bits = 0
+        for i, rule in enumerate(self.scopes.candidates(service, env)):
+            if rule.matches(value):
+                bits |= 1 << i
+        return bits
+
+    def apply(self, service: str, env: str, matched: int) -> EffectiveConfig:
+        """Effective config from the actions of the rules set in ``matched``."""
+        log_level, rate, period = DEFAULT_ACTIONS
+        for i, rule in enumerate(self.scopes.candidates(service, env)):
+            if not matched >> i & 1:
+                continue
+            # Last writer wins within ordered rules
+            if rule.log_level:
+                log_level = rule.log_level
+            if rule.trace_sample_rate is not None:
+                rate = rule.trace_sample_rate
+            if rule.metric_period_s is not None:
+                period = rule.metric_period_s
+        return EffectiveConfig(
+            service=service,
+            environment=env,
+            log_level=log_level,
+            trace_sample_rate=rate,
+            metric_period_s=period,
+        )
+
+    def decide(self, service: str, env: str, value: Callable[[AggregateRef], float]) -> EffectiveConfig:
+        # Not on the serving path (evaluate caches bands and matched); kept as
+        # the per-key reference the fleet evaluator is tested and benchmarked against
+        return self.apply(service, env, self.matched(service, env, value))
+
+
+def _compile_rule(rule: Rule, max_window_s: int) -> Optional[CompiledRule]:
+    conditions: List[CompiledCondition] = []
+    for c in rule.conditions:
+        if c.kind == "always" or c.op == "always":
+            continue
+        if c.kind == "error_rate":
+            name = "error_rate"
+        elif c.kind == "metric":
+            name = c.key or ""
+        else:
+            # Unsupported kinds never match, so neither can the rule
+            return None
+        compare = COMPARATORS.get(c.op)
+        if compare is None:
+            raise ValueError(f"rule {rule.id!r}: unsupported op {c.op!r}")
+        threshold = float(c.value) if c.value is not None else 0.0
+        if name not in AGGREGATE_NAMES:
+            # Unknown metrics read as 0.0: fold the comparison now
+            if compare(0.0, threshold):
+                continue
+            return None
+        window = min(c.window_s or max_window_s, max_window_s)
+        conditions.append(CompiledCondition(AggregateRef(name, window), c.op, compare, threshold))
+
+    a = rule.actions
+    return CompiledRule(
+        id=rule.id,
+        priority=rule.priority,
+        service=rule.service or None,
+        environment=rule.environment or None,
+        conditions=tuple(conditions),
+        log_level=a.log_level or None,
+        trace_sample_rate=a.trace_sample_rate,
+        metric_period_s=a.metric_period_s,
+    )
+
+
+def compile_policy(policy: Policy, version: int, max_window_s: int) -> CompiledPolicy:
+    """Compile ``policy``; raises ``ValueError`` for conditions it cannot run."""
+    rules = []
+    for r in sorted((r for r in policy.rules if r.enabled), key=lambda r: r.priority):
+        compiled = _compile_rule(r, max_window_s)
+        if compiled is not None:
+            rules.append(compiled)
+    thresholds: Dict[AggregateRef, set] = {}
+    for r in rules:
+        for c in r.conditions:
+            thresholds.setdefault(c.ref, set()).add(c.threshold)
+    ordered = tuple(rules)
+    return CompiledPolicy(
+        version=version,
+        policy=policy,
+        rules=ordered,
+        refs=tuple(thresholds),
+        thresholds={ref: tuple(sorted(ts)) for ref, ts in thresholds.items()},
+        scopes=ScopeIndex(ordered),
+    )
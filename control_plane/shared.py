@@ -0,0 +1,302 @@
+import fcntl
+import math
+import os
+import struct
+import tempfile
+import time
+import zlib
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from control_plane.aggregates import LEVELS, Bucket, _Level, cover_window, merge_buckets
+from control_plane.models import LatencyHistogram
+from control_plane.sketch import MIN_VALUE, iter_bins
+
+Key = Tuple[str, str]
+
+_MAGIC = b"CPSHM001"
+# magic, then the layout: n_keys, n_bins, min_index, relative_accuracy, policy_max
+_HEADER = struct.Struct("<8sIIidI")
+_POLICY = struct.Struct("<qI")  # policy version, policy JSON length
+_HEADER_SIZE = 64
+_KEY_BYTES = 128  # uint16 length + "service\0environment" in UTF-8
+_SLOT_HEAD = struct.Struct("<qqqq")  # start, count, errors, zero_count
+_Q = struct.Struct("<q")
+_I = struct.Struct("<I")
+
+
+class SharedStore:
+    """Per-key aggregates and the active policy in one shared-memory segment.
+
+    Lets several worker processes on a host ingest into and evaluate from
+    the same windows. Each key gets the ``LEVELS`` ring of time buckets,
+    with latencies in a fixed log-bucketed histogram (``n_bins`` bins at
+    ``relative_accuracy``, clamped at both ends) instead of an open-ended
+    sketch. Keys live in an open-addressed table of ``n_keys`` slots.
+
+    Writers serialize with ``fcntl`` byte-range locks on a side file: one
+    byte per key, and byte 0 for the key table and the policy. These locks
+    are per process, so a store must only be touched from one thread per
+    process. The segment outlives the processes; ``unlink`` removes it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        n_keys: int = 256,
+        relative_accuracy: float = 0.02,
+        min_latency_ms: float = 0.01,
+        max_latency_ms: float = 600_000.0,
+        policy_max: int = 1 << 20,
+    ) -> None:
+        log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        min_index = math.ceil(math.log(min_latency_ms) / log_gamma)
+        n_bins = math.ceil(math.log(max_latency_ms) / log_gamma) - min_index + 1
+        self.levels = [_Level(res, span) for res, span in LEVELS]
+        self._slot_size = _SLOT_HEAD.size + 4 * n_bins
+        self._key_size = 8 + sum(len(level.slots) for level in self.levels) * self._slot_size
+        self._table = _HEADER_SIZE + policy_max
+        self._keys_at = self._table + n_keys * _KEY_BYTES
+        size = self._keys_at + n_keys * self._key_size
+
+        layout = (n_keys, n_bins, min_index, relative_accuracy, policy_max)
+        try:
+            self._shm = shared_memory.SharedMemory(name, create=True, size=size)
+            _HEADER.pack_into(self._shm.buf, 0, b"\0" * 8, *layout)
+            self._shm.buf[:8] = _MAGIC  # last, so attachers see a complete header
+        except FileExistsError:
+            self._shm = shared_memory.SharedMemory(name)
+            self._wait_ready()
+        # Attach and create alike: the tracker would unlink the segment when
+        # this process exits, under the other workers
+        resource_tracker.unregister(self._shm._name, "shared_memory")
+        if _HEADER.unpack_from(self._shm.buf)[1:] != layout or self._shm.size < size:
+            self._shm.close()
+            raise ValueError(f"shared state {name!r} was created with a different layout")
+        self.name = name
+        self.n_keys = n_keys
+        self.n_bins = n_bins
+        self.min_index = min_index
+        self.relative_accuracy = relative_accuracy
+        self._log_gamma = log_gamma
+        self._lock_fd = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        self._index: Dict[Key, int] = {}
+
+    def _wait_ready(self, timeout_s: float = 5.0) -> None:
+        deadline = time.monotonic() + timeout_s
+        while bytes(self._shm.buf[:8]) != _MAGIC:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"shared state {self._shm.name!r} was never initialized")
+            time.sleep(0.01)
+
+    def close(self) -> None:
+        os.close(self._lock_fd)
+        self._shm.close()
+
+    def unlink(self) -> None:
+        shared_memory.SharedMemory(self.name).unlink()
+        try:
+            os.unlink(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def _locked(self, byte: int, shared: bool = False) -> Iterator[None]:
+        fcntl.lockf(self._lock_fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX, 1, byte)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, byte)
+
+    # --- Key table
+
+    def _probe(self, encoded: bytes) -> Iterator[int]:
+        start = zlib.crc32(encoded) % self.n_keys
+        for k in range(self.n_keys):
+            yield (start + k) % self.n_keys
+
+    def _slot_key(self, i: int) -> bytes:
+        off = self._table + i * _KEY_BYTES
+        n = int.from_bytes(self._shm.buf[off : off + 2], "little")
+        return bytes(self._shm.buf[off + 2 : off + 2 + n])
+
+    def find(self, key: Key, create: bool = False) -> Optional[int]:
+        """Table index of ``key``; with ``create`` it is added if missing.
+
+        Returns None when the key is absent, or when the table is full.
+        """
+        i = self._index.get(key)
+        if i is not None:
+            return i
+        encoded = f"{key[0]}\0{key[1]}".encode()
+        if len(encoded) > _KEY_BYTES - 2:
+            raise ValueError("service and environment are too long for shared state")
+        with self._locked(0, shared=not create):
+            for i in self._probe(encoded):
+                found = self._slot_key(i)
+                if found == encoded:
+                    break
+                if not found:
+                    if not create:
+                        return None
+                    off = self._table + i * _KEY_BYTES
+                    self._shm.buf[off + 2 : off + 2 + len(encoded)] = encoded
+                    self._shm.buf[off : off + 2] = len(encoded).to_bytes(2, "little")
+                    break
+            else:
+                return None
+        self._index[key] = i
+        return i
+
+    def keys(self) -> List[Key]:
+        out = []
+        for i in range(self.n_keys):
+            encoded = self._slot_key(i)
+            if encoded:
+                service, env = encoded.decode().split("\0", 1)
+                out.append((service, env))
+        return out
+
+    def stats(self) -> Dict[str, int]:
+        return {"shared_keys": len(self.keys()), "shared_keys_max": self.n_keys}
+
+    def aggregates(self, key: Key, create: bool = False) -> Optional["SharedAggregates"]:
+        i = self.find(key, create)
+        return SharedAggregates(self, i) if i is not None else None
+
+    # --- Policy
+
+    def policy_version(self) -> int:
+        return _Q.unpack_from(self._shm.buf, _HEADER.size)[0]
+
+    def policy(self) -> Tuple[int, bytes]:
+        with self._locked(0, shared=True):
+            version, n = _POLICY.unpack_from(self._shm.buf, _HEADER.size)
+            return version, bytes(self._shm.buf[_HEADER_SIZE : _HEADER_SIZE + n])
+
+    def publish_policy(self, data: bytes, version: int) -> int:
+        """Store ``data`` as the next policy version, at least ``version``."""
+        if len(data) > self._table - _HEADER_SIZE:
+            raise ValueError("policy is too large for shared state")
+        with self._locked(0):
+            version = max(version, self.policy_version() + 1)
+            self._shm.buf[_HEADER_SIZE : _HEADER_SIZE + len(data)] = data
+            _POLICY.pack_into(self._shm.buf, _HEADER.size, version, len(data))
+        return version
+
+    # --- Buckets
+
+    def _bin(self, latency_ms: float) -> int:
+        i = math.ceil(math.log(latency_ms) / self._log_gamma) - self.min_index
+        return min(max(i, 0), self.n_bins - 1)
+
+
+class SharedAggregates:
+    """``WindowAggregates`` for one key whose buckets live in a ``SharedStore``."""
+
+    exact = False
+
+    def __init__(self, store: SharedStore, index: int) -> None:
+        self._store = store
+        self._index = index
+        self._base = store._keys_at + index * store._key_size
+        self._level_at = []
+        off = self._base + 8
+        for level in store.levels:
+            self._level_at.append(off)
+            off += len(level.slots) * store._slot_size
+
+    @property
+    def levels(self) -> List[_Level]:
+        return self._store.levels
+
+    @property
+    def generation(self) -> int:
+        return _Q.unpack_from(self._store._shm.buf, self._base)[0]
+
+    def _slot(self, li: int, start: int) -> int:
+        level = self.levels[li]
+        return self._level_at[li] + (start // level.res) % len(level.slots) * self._store._slot_size
+
+    def _write(self, ts_ms: int, count: int, errors: int, zero: int, bins: Dict[int, int]) -> None:
+        store = self._store
+        buf = store._shm.buf
+        sec = ts_ms // 1000
+        with store._locked(1 + self._index):
+            _Q.pack_into(buf, self._base, _Q.unpack_from(buf, self._base)[0] + 1)
+            for li, level in enumerate(self.levels):
+                start = sec - sec % level.res
+                off = self._slot(li, start)
+                s, c, e, z = _SLOT_HEAD.unpack_from(buf, off)
+                if s != start:
+                    # Stale slot from a previous lap of the ring
+                    buf[off : off + store._slot_size] = bytes(store._slot_size)
+                    c = e = z = 0
+                _SLOT_HEAD.pack_into(buf, off, start, c + count, e + errors, z + zero)
+                at = off + _SLOT_HEAD.size
+                for i, n in bins.items():
+                    _I.pack_into(buf, at + 4 * i, _I.unpack_from(buf, at + 4 * i)[0] + n)
+
+    def add(self, ts_ms: int, latency_ms: Optional[float], error: Optional[bool]) -> None:
+        self.add_many(((ts_ms, latency_ms, error),))
+
+    def add_many(self, signals: Iterable[Tuple[int, Optional[float], Optional[bool]]]) -> None:
+        # One locked write per second touched, not per signal
+        by_sec: Dict[int, List] = {}
+        for ts_ms, latency_ms, error in signals:
+            acc = by_sec.setdefault(ts_ms // 1000, [0, 0, 0, {}])
+            acc[0] += 1
+            if error:
+                acc[1] += 1
+            if latency_ms is not None:
+                if latency_ms <= MIN_VALUE:
+                    acc[2] += 1
+                else:
+                    i = self._store._bin(latency_ms)
+                    acc[3][i] = acc[3].get(i, 0) + 1
+        for sec, (count, errors, zero, bins) in by_sec.items():
+            self._write(sec * 1000, count, errors, zero, bins)
+
+    def add_summary(
+        self, ts_ms: int, count: int, errors: int, latency: Optional[LatencyHistogram] = None
+    ) -> None:
+        zero, bins = 0, {}
+        if latency is not None:
+            zero = latency.zero_count
+            for value, n in iter_bins(latency.relative_accuracy, latency.bins):
+                if value <= MIN_VALUE:
+                    zero += n
+                else:
+                    i = self._store._bin(value)
+                    bins[i] = bins.get(i, 0) + n
+        self._write(ts_ms, count, errors, zero, bins)
+
+    def select(self, now_ms: int, window_s: int, copy_live: bool = False) -> Tuple[int, List[Bucket]]:
+        """Like ``WindowAggregates.select``; buckets are always read out as copies."""
+        store = self._store
+        buf = store._shm.buf
+        now_s = now_ms // 1000
+        lo, cover = cover_window(self.levels, now_s, window_s)
+        picked: List[Bucket] = []
+        with store._locked(1 + self._index, shared=True):
+            for level, start in cover:
+                off = self._slot(self.levels.index(level), start)
+                s, count, errors, zero = _SLOT_HEAD.unpack_from(buf, off)
+                if s != start or not count:
+                    continue
+                b = Bucket(start, relative_accuracy=store.relative_accuracy)
+                b.count, b.errors = count, errors
+                counts = buf[off + _SLOT_HEAD.size : off + store._slot_size].cast("I")
+                b.latency.add_bins(
+                    store.relative_accuracy,
+                    zero,
+                    {i + store.min_index: n for i, n in enumerate(counts) if n},
+                )
+                counts.release()
+                picked.append(b)
+        return lo, picked
+
+    def query(self, now_ms: int, window_s: int) -> Bucket:
+        lo, picked = self.select(now_ms, window_s)
+        return merge_buckets(lo, picked)
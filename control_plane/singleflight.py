@@ -0,0 +1,60 @@
+import asyncio
+import inspect
+from typing import Awaitable, Callable, Dict, Generic, Hashable, TypeVar, Union
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Share one in-progress computation per key between concurrent callers.
+
+    The first caller for a key becomes the leader: it yields to the event
+    loop for ``window_s`` (one loop iteration when 0) so requests for the
+    same key that are already queued can join, then runs ``fn`` once
+    (awaiting it if it returns an awaitable) and hands the result to
+    everyone who joined. Callers that arrive after the result is set start
+    a new flight.
+    """
+
+    def __init__(self, window_s: float = 0.0) -> None:
+        self.window_s = window_s
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Union[T, Awaitable[T]]]) -> T:
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.shared += 1
+            try:
+                # Shielded so a cancelled follower does not cancel the flight
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise
+                # The leader was cancelled before finishing; try again
+                return await self.do(key, fn)
+
+        fut = self._inflight[key] = asyncio.get_running_loop().create_future()
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.window_s)
+            result = fn()
+            if inspect.isawaitable(result):
+                result = await result
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            # Followers get the exception; mark it retrieved for the leader's copy
+            fut.exception()
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"evaluations_run": self.calls, "evaluations_coalesced": self.shared}
@@ -0,0 +1,143 @@
+import math
+from bisect import insort
+from typing import Dict, Iterator, List, Tuple, Union
+
+# Values at or below this are counted in the zero bucket and reported as 0.0.
+MIN_VALUE = 1e-9
+# Values above this (ms, about 31 years) are counted in the top bucket, so
+# bucket indices, and the representative values they map back to, stay bounded.
+MAX_VALUE = 1e12
+
+
+class LatencySketch:
+    """Mergeable log-bucketed quantile sketch (DDSketch-style).
+
+    A value ``x`` lands in bucket ``ceil(log_gamma(x))`` with
+    ``gamma = (1 + a) / (1 - a)``, and a bucket is reported by a single
+    representative value. Any quantile is therefore returned with a relative
+    error of at most ``a`` (``relative_accuracy``, 1% by default) against the
+    exact order statistic. Memory and query time are O(buckets), which is
+    bounded by the dynamic range of the data rather than the number of values.
+
+    Two sketches with the same accuracy merge by adding bucket counts, which
+    is how windows are built from per-time-bucket sketches.
+    """
+
+    __slots__ = ("relative_accuracy", "_gamma", "_log_gamma", "bins", "zero_count", "count")
+
+    def __init__(self, relative_accuracy: float = 0.01) -> None:
+        if not 0.0 < relative_accuracy < 1.0:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(min(value, MAX_VALUE)) / self._log_gamma)
+
+    def add(self, value: float, count: int = 1) -> None:
+        if value <= MIN_VALUE:
+            self.zero_count += count
+        else:
+            i = self._index(value)
+            self.bins[i] = self.bins.get(i, 0) + count
+        self.count += count
+
+    def merge(self, other: "LatencySketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("cannot merge sketches with different relative_accuracy")
+        bins = self.bins
+        for i, n in other.bins.items():
+            bins[i] = bins.get(i, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def add_bins(self, relative_accuracy: float, zero_count: int, bins: Dict[int, int]) -> None:
+        """Merge serialized sketch state (see ``LatencyHistogram``).
+
+        State with a different accuracy is re-bucketed by its representative
+        values, which adds at most the coarser of the two errors.
+        """
+        if relative_accuracy == self.relative_accuracy:
+            own = self.bins
+            for i, n in bins.items():
+                own[i] = own.get(i, 0) + n
+            self.zero_count += zero_count
+            self.count += zero_count + sum(bins.values())
+            return
+        if zero_count:
+            self.add(0.0, zero_count)
+        for value, n in iter_bins(relative_accuracy, bins):
+            self.add(value, n)
+
+    def quantile(self, q: float) -> float:
+        """Value at rank ``int(q * (count - 1))``; 0.0 when empty."""
+        if self.count <= 0:
+            return 0.0
+        rank = int(q * (self.count - 1))
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > rank:
+                return 2.0 * self._gamma ** i / (self._gamma + 1)
+        return 0.0
+
+
+class ExactSketch:
+    """Drop-in replacement for ``LatencySketch`` that keeps every value.
+
+    Quantiles are exact, at the cost of O(n) memory and O(n) inserts; meant
+    for tests and for checking the error of the approximate sketch.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self) -> None:
+        self.values: List[float] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.values)
+
+    def add(self, value: float, count: int = 1) -> None:
+        for _ in range(count):
+            insort(self.values, value)
+
+    def merge(self, other: "ExactSketch") -> None:
+        self.values = sorted(self.values + other.values)
+
+    def add_bins(self, relative_accuracy: float, zero_count: int, bins: Dict[int, int]) -> None:
+        # Bucketed input can only be replayed at its representative values
+        self.add(0.0, zero_count)
+        for value, n in iter_bins(relative_accuracy, bins):
+            self.add(value, n)
+
+    def quantile(self, q: float) -> float:
+        if not self.values:
+            return 0.0
+        return float(self.values[int(q * (len(self.values) - 1))])
+
+
+Sketch = Union[LatencySketch, ExactSketch]
+
+
+def index_range(relative_accuracy: float) -> Tuple[int, int]:
+    """Lowest and highest bucket index a sketch at ``relative_accuracy`` produces."""
+    log_gamma = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+    return math.ceil(math.log(MIN_VALUE) / log_gamma), math.ceil(math.log(MAX_VALUE) / log_gamma)
+
+
+def iter_bins(relative_accuracy: float, bins: Dict[int, int]) -> Iterator[Tuple[float, int]]:
+    """(representative value, count) for each bucket of serialized state."""
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    for i, n in bins.items():
+        yield 2.0 * gamma ** i / (gamma + 1), n
+
+
+def new_sketch(exact: bool = False) -> Sketch:
+    return ExactSketch() if exact else LatencySketch()
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+import zlib
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from control_plane.models import EffectiveConfig
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str]
+
+
+class Published(NamedTuple):
+    version: int
+    config: EffectiveConfig
+    body: bytes  # config encoded once as the JSON response body
+    etag: str
+
+
+def _wall_us() -> int:
+    return time.time_ns() // 1000
+
+
+def _published(version: int, config: EffectiveConfig) -> Published:
+    body = config.model_dump_json().encode()
+    # The checksum keeps tags from a previous process from matching by version alone
+    return Published(version, config, body, f'"{version}-{zlib.crc32(body):08x}"')
+
+
+class ConfigWatch:
+    """Per-key config versions and the watchers waiting on them.
+
+    ``publish`` is called with every freshly computed config; the key's
+    version is bumped only when the config differs from the last one
+    published, and anyone waiting on the key is woken. Each version is
+    JSON-encoded once, with an ETag, when it is published.
+
+    Versions come from one counter per process that never falls behind the
+    wall clock in microseconds, so they rise per key, and a version handed
+    out by an earlier process (before a restart, or by the node that owned
+    the key before a rebalance) is never reused for a different config. A
+    watcher presenting one gets the current config straight away.
+
+    ``discard`` drops a key the caller no longer tracks, once nobody is
+    waiting on it, and ``release`` drops it straight away (e.g. when another
+    node takes it over).
+    """
+
+    def __init__(self, clock_us: Callable[[], int] = _wall_us) -> None:
+        self._latest: Dict[Key, Published] = {}
+        self._events: Dict[Key, asyncio.Event] = {}
+        self._watchers: Dict[Key, int] = {}
+        # Discarded while watched; dropped when the last watcher leaves
+        self._orphans: Set[Key] = set()
+        self._clock_us = clock_us
+        self._last_version = 0
+        self.published = 0
+
+    def current(self, key: Key) -> Optional[Published]:
+        return self._latest.get(key)
+
+    def publish(self, key: Key, config: EffectiveConfig) -> int:
+        self._orphans.discard(key)
+        latest = self._latest.get(key)
+        if latest is not None and latest.config == config:
+            return latest.version
+        self._last_version = version = max(self._last_version + 1, self._clock_us())
+        self._latest[key] = _published(version, config)
+        self.published += 1
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+        return version
+
+    def discard(self, key: Key) -> None:
+        if key in self._watchers:
+            self._orphans.add(key)
+            return
+        self._latest.pop(key, None)
+
+    def release(self, key: Key) -> None:
+        """Drop ``key`` now, even if watched; its watchers wake with nothing."""
+        self._orphans.discard(key)
+        self._latest.pop(key, None)
+        event = self._events.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def keys(self) -> List[Key]:
+        return list(self._latest)
+
+    def watched(self) -> List[Key]:
+        return list(self._watchers)
+
+    async def wait(
+        self, key: Key, since_version: Optional[int], timeout_s: float
+    ) -> Optional[Published]:
+        """Next config for ``key`` after ``since_version``, or None on timeout."""
+        latest = self._latest.get(key)
+        if latest is not None and latest.version != since_version:
+            return latest
+        event = self._events.get(key)
+        if event is None:
+            event = self._events[key] = asyncio.Event()
+        self._watchers[key] = self._watchers.get(key, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout_s)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            n = self._watchers[key] - 1
+            if n:
+                self._watchers[key] = n
+            else:
+                del self._watchers[key]
+                if self._events.get(key) is event:
+                    del self._events[key]
+                if key in self._orphans:
+                    self._orphans.discard(key)
+                    self.discard(key)
+        return self._latest.get(key)
+
+    async def run(self, refresh: Callable[[Key], object], interval_s: float = 1.0) -> None:
+        """Re-evaluate watched keys so time-driven changes reach watchers too."""
+        while True:
+            await asyncio.sleep(interval_s)
+            for key in self.watched():
+                try:
+                    refresh(key)
+                except Exception:
+                    logger.exception("failed to refresh watched key %s/%s", *key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "watch_keys": len(self._watchers),
+            "watch_published_keys": len(self._latest),
+            "watch_waiters": sum(self._watchers.values()),
+            "watch_published": self.published,
+        }
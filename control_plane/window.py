@@ -0,0 +1,149 @@
+import math
+from array import array
+from collections import Counter
+from typing import Container, Dict, Iterator, NamedTuple, Optional, Tuple
+
+_NAN = math.nan
+
+
+def _unwrap(col, head: int, size: int):
+    end = head + size
+    if end <= len(col):
+        return col[head:end]
+    return col[head:] + col[: end - len(col)]
+
+
+class WindowEntry(NamedTuple):
+    ts_ms: int
+    latency_ms: Optional[float]
+    error: bool
+    attrs_id: int  # AttrTable set id, 0 when empty
+
+
+class SignalWindow:
+    """Time-ordered buffer of raw signals for a single (service, env) key.
+
+    Signals are appended in arrival order, so expiry only ever has to look at
+    the head of the buffer: ingest and pruning are amortized O(1) instead of
+    rebuilding the whole list on every request.
+
+    Contents are stored as a growable ring of parallel columns rather than
+    one object per signal: int64 clock timestamps (ms), float32
+    latencies with NaN for "missing", a packed error bitmap and uint32
+    attribute set ids from an ``AttrTable``.
+    """
+
+    MIN_CAPACITY = 64
+
+    __slots__ = ("_ts", "_latency", "_errors", "_attrs", "_head", "_size")
+
+    def __init__(self, capacity: int = MIN_CAPACITY) -> None:
+        capacity = max(capacity, self.MIN_CAPACITY)
+        self._ts = array("q", bytes(8 * capacity))
+        self._latency = array("f", bytes(4 * capacity))
+        self._errors = bytearray((capacity + 7) // 8)
+        self._attrs = array("I", bytes(4 * capacity))
+        self._head = 0
+        self._size = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self._ts)
+
+    def append(
+        self,
+        ts_ms: int,
+        latency_ms: Optional[float],
+        error: Optional[bool],
+        attrs_id: int = 0,
+    ) -> None:
+        cap = len(self._ts)
+        if self._size == cap:
+            self._resize(cap * 2)
+            cap *= 2
+        i = (self._head + self._size) % cap
+        self._ts[i] = ts_ms
+        self._latency[i] = _NAN if latency_ms is None else latency_ms
+        if error:
+            self._errors[i >> 3] |= 1 << (i & 7)
+        else:
+            self._errors[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+        self._attrs[i] = attrs_id
+        self._size += 1
+
+    def prune(self, cutoff_ms: int) -> int:
+        """Drop signals older than ``cutoff_ms``; returns how many were dropped."""
+        ts = self._ts
+        cap = len(ts)
+        head, size = self._head, self._size
+        dropped = 0
+        while size and ts[head] < cutoff_ms:
+            head = (head + 1) % cap
+            size -= 1
+            dropped += 1
+        self._head, self._size = head, size
+        # Give memory back once a burst has drained
+        if cap > self.MIN_CAPACITY and size * 4 < cap:
+            self._resize(max(self.MIN_CAPACITY, cap // 2))
+        return dropped
+
+    def _resize(self, capacity: int) -> None:
+        # Rotate the ring so the head lands at index 0, then pad or trim
+        head, size, cap = self._head, self._size, len(self._ts)
+        pad = capacity - size
+        self._ts = _unwrap(self._ts, head, size) + array("q", bytes(8 * pad))
+        self._latency = _unwrap(self._latency, head, size) + array("f", bytes(4 * pad))
+        self._attrs = _unwrap(self._attrs, head, size) + array("I", bytes(4 * pad))
+        bits = int.from_bytes(self._errors, "little")
+        bits = (bits >> head) | (bits << (cap - head))
+        bits &= (1 << size) - 1
+        self._errors = bytearray(bits.to_bytes((capacity + 7) // 8, "little"))
+        self._head = 0
+
+    def columns(self) -> Tuple[array, array, bytes, array]:
+        """Timestamps, latencies, error bitmap and attribute set ids, oldest first."""
+        head, size, cap = self._head, self._size, len(self._ts)
+        bits = int.from_bytes(self._errors, "little")
+        bits = ((bits >> head) | (bits << (cap - head))) & ((1 << size) - 1)
+        return (
+            _unwrap(self._ts, head, size),
+            _unwrap(self._latency, head, size),
+            bits.to_bytes((size + 7) // 8, "little"),
+            _unwrap(self._attrs, head, size),
+        )
+
+    @classmethod
+    def from_columns(cls, ts: array, latency: array, errors: bytes, attrs: array) -> "SignalWindow":
+        """Window holding the output of ``columns``."""
+        size = len(ts)
+        w = cls(size)
+        pad = w.capacity - size
+        w._ts = ts + array("q", bytes(8 * pad))
+        w._latency = latency + array("f", bytes(4 * pad))
+        w._attrs = attrs + array("I", bytes(4 * pad))
+        w._errors[: len(errors)] = errors
+        w._size = size
+        return w
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[WindowEntry]:
+        cap = len(self._ts)
+        for k in range(self._size):
+            i = (self._head + k) % cap
+            lat = self._latency[i]
+            yield WindowEntry(
+                self._ts[i],
+                None if lat != lat else lat,
+                bool(self._errors[i >> 3] >> (i & 7) & 1),
+                self._attrs[i],
+            )
+
+    def attr_histogram(self) -> Dict[int, int]:
+        """Retained signals per attribute set id."""
+        return Counter(_unwrap(self._attrs, self._head, self._size))
+
+    def count_attrs(self, set_ids: Container[int]) -> int:
+        """Retained signals whose attribute set id is in ``set_ids``."""
+        return sum(n for set_id, n in self.attr_histogram().items() if set_id in set_ids)
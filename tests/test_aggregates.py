@@ -0,0 +1,56 @@
+from control_plane.aggregates import WindowAggregates
+
+
+def _fill(agg: WindowAggregates, start: int, seconds: int, error_every: int = 0) -> None:
+    for t in range(start, start + seconds):
+        agg.add(t * 1000 + 500, latency_ms=float(t - start + 1), error=bool(error_every) and t % error_every == 0)
+
+
+def test_query_matches_scan_for_aligned_windows():
+    agg = WindowAggregates(exact=True)
+    t0 = 1_000_000
+    _fill(agg, t0, 300, error_every=7)
+    now = (t0 + 299) * 1000 + 900
+
+    for window in (1, 7, 10, 45, 60, 120, 300):
+        b = agg.query(now, window)
+        secs = range(t0 + 300 - window, t0 + 300)
+        assert b.count == window
+        assert b.errors == sum(1 for t in secs if t % 7 == 0)
+        assert b.latency.quantile(1.0) == 300.0
+
+
+def test_query_ignores_expired_and_future_gaps():
+    agg = WindowAggregates(exact=True)
+    t0 = 2_000_000
+    _fill(agg, t0, 10)
+    # Nothing has been added for ten minutes
+    assert agg.query((t0 + 600) * 1000, 300).count == 0
+    # A window reaching back past the data still sees it
+    assert agg.query((t0 + 100) * 1000, 300).count == 10
+    assert agg.query((t0 + 100) * 1000, 60).count == 0
+
+
+def test_old_window_edge_overshoots_by_less_than_coarse_bucket():
+    agg = WindowAggregates(exact=True)
+    t0 = 3_000_000  # multiple of 60
+    _fill(agg, t0, 300)
+    now = (t0 + 299) * 1000
+    # 1s buckets only cover the last minute, so the left edge of a 95s window
+    # resolves at 10s granularity
+    b = agg.query(now, 95)
+    assert 95 <= b.count < 105
+
+
+def test_select_copies_live_buckets_only():
+    agg = WindowAggregates()
+    t0 = 3_000_000
+    _fill(agg, t0, 30)
+    now = (t0 + 29) * 1000 + 900
+    _, shared = agg.select(now, 30)
+    _, copied = agg.select(now, 30, copy_live=True)
+    assert [b.start for b in copied] == [b.start for b in shared]
+    # Only the bucket for the current second is still written to
+    assert [a is b for a, b in zip(shared, copied)].count(False) == 1
+    agg.add(now, 5.0, False)
+    assert sum(b.count for b in copied) == 30
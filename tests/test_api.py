@@ -0,0 +1,294 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from control_plane import main
+from control_plane.main import AGGREGATES, DECISIONS, SIGNALS, app
+
+client = TestClient(app)
+
+
+def setup_function(_):
+    SIGNALS.clear()
+    AGGREGATES.clear()
+    DECISIONS.clear()
+
+
+def test_signal_batch_json_array():
+    batch = [{"service": "a", "environment": "prod", "latency_ms": 50, "error": i % 5 == 0} for i in range(20)]
+    batch += [{"service": "b", "environment": "staging", "latency_ms": 10}]
+    resp = client.post("/signals", json=batch)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["accepted"] == 21
+    assert body["configs"]["a"]["prod"]["log_level"] == "DEBUG"
+    assert body["configs"]["b"]["staging"]["trace_sample_rate"] == 0.1
+    assert len(SIGNALS[("a", "prod")]) == 20
+
+
+def test_signal_batch_ndjson_and_validation():
+    lines = "\n".join(json.dumps({"service": "a", "environment": "prod", "latency_ms": 5}) for _ in range(3))
+    resp = client.post("/signals", content=lines + "\n", headers={"content-type": "application/x-ndjson"})
+    assert resp.status_code == 200
+    assert resp.json()["accepted"] == 3
+
+    resp = client.post("/signals", json=[{"service": "a"}])
+    assert resp.status_code == 422
+
+
+def test_non_finite_and_negative_latency_is_rejected():
+    from control_plane import edge
+
+    edge_client = TestClient(edge.app)
+    for latency in ("NaN", "Infinity", "-Infinity", "1e309", "-1"):
+        body = '{"service": "a", "environment": "prod", "latency_ms": %s}' % latency
+        headers = {"content-type": "application/json"}
+        assert client.post("/signal", content=body, headers=headers).status_code == 422
+        assert client.post("/signals", content=f"[{body}]", headers=headers).status_code == 422
+        assert edge_client.post("/signal", content=body, headers=headers).status_code == 422
+    assert ("a", "prod") not in SIGNALS
+
+
+def test_async_ingest_is_applied_in_background():
+    import time
+
+    with TestClient(app) as c:
+        batch = [{"service": "q", "environment": "prod", "latency_ms": 5} for _ in range(10)]
+        resp = c.post("/signals/async", json=batch)
+        assert resp.status_code == 202
+        assert resp.json()["accepted"] == 10
+
+        deadline = time.monotonic() + 2
+        while len(SIGNALS.get(("q", "prod"), ())) < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(SIGNALS[("q", "prod")]) == 10
+        assert ("q", "prod") in DECISIONS
+        assert c.get("/stats").json()["ingest_applied"] >= 10
+
+
+def test_summaries_merge_into_window_aggregates():
+    from control_plane.sketch import LatencySketch
+
+    sketch = LatencySketch()
+    for v in range(1, 1001):
+        sketch.add(float(v))
+    summary = {
+        "service": "agg",
+        "environment": "prod",
+        "count": 1000,
+        "errors": 50,
+        "latency": {"relative_accuracy": 0.01, "zero_count": 0, "bins": sketch.bins},
+    }
+    resp = client.post("/summaries", json=[summary])
+    assert resp.status_code == 200
+    cfg = resp.json()["configs"]["agg"]["prod"]
+    # 5% errors and p95 ~950ms trip both elevated rules
+    assert cfg["log_level"] == "DEBUG"
+    assert cfg["trace_sample_rate"] == 0.4
+
+    b = AGGREGATES[("agg", "prod")].query(main.CLOCK.now_ms(), 60)
+    assert (b.count, b.errors) == (1000, 50)
+    assert abs(b.latency.quantile(0.95) - 950) <= 0.01 * 950
+
+
+def test_out_of_range_summary_bins_are_rejected():
+    summary = {"service": "agg", "environment": "prod", "count": 1, "latency": {"bins": {"100000": 1}}}
+    assert client.post("/summaries", json=[summary]).status_code == 422
+    summary["latency"] = {"relative_accuracy": 1e-300, "bins": {"1": 1}}
+    assert client.post("/summaries", json=[summary]).status_code == 422
+    assert ("agg", "prod") not in AGGREGATES
+    assert client.get("/config/agg/prod").status_code == 200
+
+
+def test_attr_counts_endpoint():
+    batch = [{"service": "a", "environment": "prod", "attrs": {"host": f"h{i % 2}"}} for i in range(5)]
+    client.post("/signals", json=batch)
+    resp = client.get("/attrs/a/prod", params={"key": "host"})
+    assert resp.json() == {"key": "host", "counts": {"h0": 3, "h1": 2}}
+
+
+def test_policy_upsert_reports_fleet_changes():
+    client.post("/signals", json=[{"service": "f", "environment": env, "latency_ms": 1} for env in ("prod", "dev")])
+    original = client.get("/policy").json()
+    client.post("/policy", json={"policy": original})
+
+    loud = {"id": "loud", "rules": [{"id": "dev", "environment": "dev", "actions": {"log_level": "DEBUG"}}]}
+    try:
+        client.post("/policy", json={"policy": loud})
+        changes = client.get("/fleet/changes").json()
+        assert changes["version"] == main.PLAN.version
+        # prod loses its prod-defaults rule, dev gains DEBUG
+        assert {"service": "f", "environment": "dev"} in changes["changed"]
+        assert {"service": "f", "environment": "prod"} in changes["changed"]
+        assert main.FLEET.config(("f", "dev"))[0] == "DEBUG"
+    finally:
+        client.post("/policy", json={"policy": original})
+
+
+def test_noop_policy_upsert_reports_no_changes(monkeypatch):
+    from control_plane.clock import ManualClock
+
+    monkeypatch.setattr(main, "CLOCK", ManualClock(start_ms=5_000_000))
+    keys = [(f"noop-{i}", "prod") for i in range(5)]
+    client.post("/signals", json=[{"service": s, "environment": e, "latency_ms": 1} for s, e in keys])
+    client.post("/signals", json=[{"service": "noop-0", "environment": "prod", "error": True}] * 10)
+    policy = {"policy": client.get("/policy").json()}
+
+    client.post("/policy", json=policy)
+    changed = client.get("/fleet/changes").json()["changed"]
+    assert not [c for c in changed if c["service"].startswith("noop-")]
+
+    # Errors age out and the served config follows; the fleet diffs against that
+    main.CLOCK.advance(120_000)
+    assert client.get("/config/noop-0/prod").json()["log_level"] == "INFO"
+    client.post("/policy", json=policy)
+    changed = client.get("/fleet/changes").json()["changed"]
+    assert not [c for c in changed if c["service"].startswith("noop-")]
+
+
+def test_policy_upsert_publishes_the_fleet_table_off_the_loop(monkeypatch):
+    import threading
+
+    threads = []
+    fleet_table = main._fleet_table
+
+    def recording(*args):
+        threads.append(threading.current_thread().name)
+        return fleet_table(*args)
+
+    monkeypatch.setattr(main, "_fleet_table", recording)
+    client.post("/signals", json=[{"service": "pub", "environment": "dev", "latency_ms": 1}])
+    original = client.get("/policy").json()
+    first = client.get("/config/pub/dev").json()
+    assert first["log_level"] == "INFO"
+
+    loud = {"id": "loud", "rules": [{"id": "dev", "environment": "dev", "actions": {"log_level": "DEBUG"}}]}
+    try:
+        client.post("/policy", json={"policy": loud})
+        assert threads and all(name.startswith("cp-eval") for name in threads)
+        # Published from the table; the key itself was not re-evaluated
+        assert main.WATCH.current(("pub", "dev")).config.log_level == "DEBUG"
+        assert main.DECISIONS[("pub", "dev")].version < main.PLAN.version
+        assert client.get("/config/pub/dev").json()["log_level"] == "DEBUG"
+    finally:
+        client.post("/policy", json={"policy": original})
+
+
+def test_polls_for_unknown_keys_stay_bounded(monkeypatch):
+    from control_plane.watch import ConfigWatch
+
+    monkeypatch.setattr(main, "DECISION_CACHE_MAX", 50)
+    monkeypatch.setattr(main, "WATCH", ConfigWatch())
+    for i in range(200):
+        assert client.get(f"/config/random-{i}/prod").status_code == 200
+    stats = client.get("/stats").json()
+    assert stats["decision_cache_size"] == 50
+    assert stats["watch_published_keys"] == 50
+
+
+def test_config_watch_long_poll():
+    first = client.get("/config/w/prod/watch").json()
+    assert first["config"]["log_level"] == "INFO"
+    # Nothing changes before the timeout
+    resp = client.get(f"/config/w/prod/watch?since_version={first['version']}&timeout_s=0.01")
+    assert resp.status_code == 304
+
+    client.post("/signals", json=[{"service": "w", "environment": "prod", "error": True}] * 10)
+    resp = client.get(f"/config/w/prod/watch?since_version={first['version']}&timeout_s=0.01")
+    assert resp.status_code == 200
+    assert resp.json()["version"] > first["version"]
+    assert resp.json()["config"]["log_level"] == "DEBUG"
+
+
+def test_watch_after_restart_does_not_match_a_stale_version(monkeypatch):
+    from control_plane.watch import ConfigWatch
+
+    client.post("/signals", json=[{"service": "r", "environment": "prod", "error": True}] * 10)
+    held = client.get("/config/r/prod/watch").json()
+    assert held["config"]["log_level"] == "DEBUG"
+
+    # A restarted process: no windows, no decisions, a new version counter
+    monkeypatch.setattr(main, "WATCH", ConfigWatch())
+    setup_function(None)
+    resp = client.get(f"/config/r/prod/watch?since_version={held['version']}&timeout_s=0.01")
+    assert resp.status_code == 200
+    assert resp.json()["config"]["log_level"] == "INFO"
+
+
+def test_config_etag_and_not_modified():
+    resp = client.get("/config/e/prod")
+    assert resp.json()["trace_sample_rate"] == 0.2
+    etag = resp.headers["etag"]
+    resp = client.get("/config/e/prod", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+
+    client.post("/signals", json=[{"service": "e", "environment": "prod", "error": True}] * 10)
+    resp = client.get("/config/e/prod", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+    assert resp.json()["log_level"] == "DEBUG"
+
+
+def test_bulk_configs_versions_and_prefix():
+    client.post("/signals", json=[{"service": f"node-{i}", "environment": "prod", "latency_ms": 1} for i in range(3)])
+    v = client.get("/config/node-0/prod/watch").json()["version"]
+    req = {
+        "keys": [{"service": "node-0", "environment": "prod", "version": v}, {"service": "other", "environment": "dev"}],
+        "service_prefix": "node-",
+    }
+    entries = client.post("/configs", json=req).json()["entries"]
+    assert [(e["service"], e["modified"]) for e in entries] == [
+        ("node-0", False),
+        ("other", True),
+        ("node-1", True),
+        ("node-2", True),
+    ]
+    assert entries[0]["config"] is None
+    assert entries[1]["config"]["trace_sample_rate"] == 0.1
+
+    resp = client.post("/configs", json=req, headers={"Accept": "application/x-ndjson"})
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert lines == entries
+
+
+def test_bulk_configs_after_restart_report_changed_configs(monkeypatch):
+    from control_plane.watch import ConfigWatch
+
+    client.post("/signals", json=[{"service": "rb", "environment": "prod", "error": True}] * 10)
+    held = client.post("/configs", json={"keys": [{"service": "rb", "environment": "prod"}]}).json()["entries"][0]
+    assert held["config"]["log_level"] == "DEBUG"
+    bulk = {"keys": [{"service": "rb", "environment": "prod", "version": held["version"]}]}
+    assert client.post("/configs", json=bulk).json()["entries"][0]["modified"] is False
+
+    monkeypatch.setattr(main, "WATCH", ConfigWatch())
+    setup_function(None)
+    entry = client.post("/configs", json=bulk).json()["entries"][0]
+    assert entry["modified"] is True
+    assert entry["config"]["log_level"] == "INFO"
+
+
+def test_keys_past_shared_capacity_are_rejected(monkeypatch):
+    import os
+
+    from control_plane.shared import SharedStore
+
+    store = SharedStore(f"cp-api-test-{os.getpid()}", n_keys=2)
+    monkeypatch.setattr(main, "STORE", store)
+    try:
+        for svc in ("sh-0", "sh-1"):
+            assert client.post("/signal", json={"service": svc, "environment": "prod"}).status_code == 200
+        resp = client.post("/signal", json={"service": "sh-2", "environment": "prod"})
+        assert resp.status_code == 507
+        # Nothing in the batch is applied, including keys that fit
+        batch = [{"service": s, "environment": "prod", "error": True} for s in ("sh-0", "sh-3")]
+        assert client.post("/signals", json=batch).status_code == 507
+        assert store.aggregates(("sh-0", "prod")).query(main.CLOCK.now_ms(), 60).errors == 0
+        stats = client.get("/stats").json()
+        assert (stats["shared_keys"], stats["shared_keys_max"]) == (2, 2)
+        assert stats["shared_keys_rejected"] >= 2
+        assert ("sh-2", "prod") not in AGGREGATES
+    finally:
+        setup_function(None)
+        store.close()
+        store.unlink()
@@ -0,0 +1,63 @@
+import pytest
+
+from control_plane import main
+from control_plane.backtest import backtest, replay
+from control_plane.models import Policy, SignalRecord
+from control_plane.persist import WriteAheadLog
+
+START_MS = 1_000_000
+
+
+def _record(tmp_path):
+    """Ten minutes of two prod keys at 10 rps, with a minute of 10% errors on api."""
+    live, archive = str(tmp_path / "data"), str(tmp_path / "archive")
+    wal = WriteAheadLog(live, fsync="never", archive_dir=archive)
+    for second in range(600):
+        for service in ("api", "web"):
+            burst = service == "api" and 200 <= second < 260
+            ts = START_MS + second * 1000
+            wal.append_signals(
+                (service, "prod"),
+                [SignalRecord(service, "prod", ts + i * 100, 50.0, burst and i == 0, None) for i in range(10)],
+            )
+        if second == 300:
+            # As a snapshot would, so half the log is read from the archive
+            wal.remove_before(wal.rotate())
+    wal.close()
+    return [archive, live]
+
+
+def test_replay_counts_hits_flips_and_volume(tmp_path):
+    logs = _record(tmp_path)
+    r = replay(logs, main.POLICY)
+    assert r.keys == 2
+    assert r.signals == 2 * 600 * 10
+    assert 600 <= r.simulated_s <= 602
+    # Both keys evaluated every simulated second
+    assert r.evaluations == 2 * r.simulated_s
+    assert r.rule_hits["prod-defaults"] == r.evaluations
+    assert r.rule_hits["slow-requests"] == 0
+    # Up once the 1m error rate passes 2%, down a minute after the burst ends
+    assert r.rule_flips == {"elevate-on-errors": 2, "slow-requests": 0, "prod-defaults": 0}
+    assert 60 <= r.rule_hits["elevate-on-errors"] <= 120
+    assert r.config_flips == 2
+    # Sampled at 0.2 under prod-defaults and 0.5 while elevated
+    elevated = r.rule_hits["elevate-on-errors"] * 10
+    assert abs(r.traces - ((r.signals - elevated) * 0.2 + elevated * 0.5)) <= 0.5 * 20
+    assert r.log_lines > r.signals
+
+
+def test_shards_merge_to_the_whole(tmp_path):
+    logs = _record(tmp_path)
+    policies = [main.POLICY, Policy(id="quiet", rules=[])]
+    whole, quiet = backtest(logs, policies, workers=2)
+    sharded, _ = backtest(logs, policies, shards=2, workers=2)
+    assert whole == replay(logs, main.POLICY)._replace(elapsed_s=whole.elapsed_s)
+    # Shards sum the estimates in another order
+    estimates = ("traces", "log_lines", "metric_points")
+    for field in estimates:
+        assert getattr(sharded, field) == pytest.approx(getattr(whole, field))
+    exact = dict.fromkeys(estimates + ("elapsed_s",), 0)
+    assert sharded._replace(**exact) == whole._replace(**exact)
+    assert quiet.rule_hits == {} and quiet.config_flips == 0
+    assert quiet.traces == pytest.approx(quiet.signals * 0.1)
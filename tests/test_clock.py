@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime
+
+from control_plane.clock import ManualClock, MonotonicClock
+
+
+def test_manual_clock_is_deterministic():
+    clock = ManualClock(start_ms=5_000, wall_epoch_ms=1_700_000_000_000)
+    assert clock.now_ms() == 5_000
+    assert clock.advance(1_500) == 6_500
+    assert clock.to_wall(5_000) == datetime(2023, 11, 14, 22, 13, 20)
+    clock.set(0)
+    assert clock.now_ms() == 0
+
+
+def test_monotonic_clock_caches_while_ticking():
+    clock = MonotonicClock(resolution_ms=1000)
+
+    async def scenario():
+        ticker = asyncio.create_task(clock.run())
+        await asyncio.sleep(0)
+        first = clock.now_ms()
+        await asyncio.sleep(0.02)
+        # Still inside one tick, so the cached reading has not moved
+        assert clock.now_ms() == first
+        ticker.cancel()
+        await asyncio.gather(ticker, return_exceptions=True)
+
+    asyncio.run(scenario())
+    a = clock.now_ms()
+    b = clock.now_ms()
+    assert b >= a
+
+
+def test_rebase_keeps_wall_time():
+    earlier = MonotonicClock()
+    clock = MonotonicClock()
+    wall = clock.to_wall(clock.now_ms())
+    clock.rebase(earlier.wall_offset_ms - 3_600_000)
+    # An hour earlier time base: engine ms move forward, wall time stays
+    assert clock.now_ms() - earlier.now_ms() >= 3_600_000
+    assert abs((clock.to_wall(clock.now_ms()) - wall).total_seconds()) < 1
+
+    manual = ManualClock(start_ms=5_000, wall_epoch_ms=1_700_000_000_000)
+    manual.rebase(manual.wall_offset_ms - 1_000)
+    assert manual.now_ms() == 6_000
+    assert manual.to_wall(6_000) == datetime(2023, 11, 14, 22, 13, 20)
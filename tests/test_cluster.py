@@ -0,0 +1,182 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import quote
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from control_plane import main
+from control_plane.cluster import Cluster, HashRing
+
+KEYS = [(f"svc-{i}", ("prod", "dev")[i % 2]) for i in range(3000)]
+
+
+def _owned_by(ring, node):
+    return next(key for key in KEYS if ring.owner(key) == node)
+
+
+def _odd_owned_by(ring, node):
+    # A service name that only survives the hop when its path segment is quoted
+    return next(key for key in ((f"odd svc?{i}", "prod") for i in range(100)) if ring.owner(key) == node)
+
+
+def test_ring_spreads_keys_and_moves_few_on_join():
+    ring = HashRing(["a", "b", "c"])
+    before = {key: ring.owner(key) for key in KEYS}
+    shares = [list(before.values()).count(n) / len(KEYS) for n in "abc"]
+    assert all(0.2 < share < 0.47 for share in shares)
+
+    ring.add("d")
+    moved = [key for key in KEYS if ring.owner(key) != before[key]]
+    # Only keys taken over by the new node move
+    assert all(ring.owner(key) == "d" for key in moved)
+    assert 0.1 < len(moved) / len(KEYS) < 0.4
+
+
+def test_redirect_mode_points_at_owner(monkeypatch):
+    cluster = Cluster("http://testserver", ["http://peer:9"], mode="redirect")
+    monkeypatch.setattr(main, "CLUSTER", cluster)
+    service, env = _owned_by(cluster.ring, "http://peer:9")
+    client = TestClient(main.app)
+    resp = client.get(f"/config/{service}/{env}", follow_redirects=False)
+    assert resp.status_code == 307
+    assert resp.headers["location"] == f"http://peer:9/config/{service}/{env}"
+    odd, env = _odd_owned_by(cluster.ring, "http://peer:9")
+    resp = client.get(f"/config/{quote(odd, safe='')}/{env}", params={"x": "1"}, follow_redirects=False)
+    assert resp.headers["location"] == f"http://peer:9/config/{quote(odd, safe='')}/{env}?x=1"
+    local = _owned_by(cluster.ring, "http://testserver")
+    assert client.get(f"/config/{local[0]}/{local[1]}").status_code == 200
+
+
+def test_batches_report_unreachable_owners(monkeypatch):
+    cluster = Cluster("http://testserver", ["http://127.0.0.1:9"], timeout_s=1.0)
+    monkeypatch.setattr(main, "CLUSTER", cluster)
+    local = _owned_by(cluster.ring, "http://testserver")
+    remote = _owned_by(cluster.ring, "http://127.0.0.1:9")
+    with TestClient(main.app) as client:
+        batch = [{"service": s, "environment": e} for s, e in (local, remote, remote)]
+        body = client.post("/signals", json=batch).json()
+        assert body["accepted"] == 1
+        assert body["unavailable"] == {remote[0]: [remote[1]]}
+        # Nothing was applied when no owner could take its share
+        assert client.post("/signals", json=batch[1:]).status_code == 502
+        assert len(main.SIGNALS[local]) == 1
+
+
+def test_rebalance_drops_every_trace_of_moved_keys(monkeypatch):
+    from control_plane.fleet import FleetEvaluator
+    from control_plane.watch import ConfigWatch
+
+    cluster = Cluster("http://testserver")
+    monkeypatch.setattr(main, "CLUSTER", cluster)
+    monkeypatch.setattr(main, "WATCH", ConfigWatch())
+    monkeypatch.setattr(main, "FLEET", FleetEvaluator())
+    for state in (main.SIGNALS, main.AGGREGATES, main.DECISIONS):
+        state.clear()
+    client = TestClient(main.app)
+    keys = KEYS[:50]
+    client.post("/signals", json=[{"service": s, "environment": e, "error": True} for s, e in keys])
+    client.post("/policy", json={"policy": client.get("/policy").json()})
+    assert all(main.WATCH.current(key) for key in keys)
+
+    view = client.post("/cluster/nodes", json={"nodes": ["http://testserver", "http://peer:9"]}).json()
+    moved = [key for key in keys if not cluster.is_local(key)]
+    kept = [key for key in keys if cluster.is_local(key)]
+    assert view["released"] == len(moved) > 0
+    for key in moved:
+        assert key not in main.AGGREGATES and key not in main.DECISIONS
+        assert main.WATCH.current(key) is None and main.FLEET.config(key) is None
+    for key in kept:
+        assert main.WATCH.current(key) is not None
+        assert main.FLEET.config(key)[0] == "DEBUG"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def nodes():
+    urls = [f"http://127.0.0.1:{_free_port()}" for _ in range(2)]
+    procs = []
+    for url in urls:
+        env = {**os.environ, "CP_CLUSTER_SELF": url, "CP_CLUSTER_NODES": ",".join(urls)}
+        cmd = [sys.executable, "-m", "uvicorn", "control_plane.main:app", "--port", url.rsplit(":", 1)[1]]
+        procs.append(subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    try:
+        deadline = time.monotonic() + 15
+        for url in urls:
+            while True:
+                try:
+                    httpx.get(f"{url}/healthz")
+                    break
+                except httpx.HTTPError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.1)
+        yield urls
+    finally:
+        for p in procs:
+            p.terminate()
+            p.wait(10)
+
+
+def test_local_nodes_forward_to_owner(nodes):
+    a, b = nodes
+    service, env = _owned_by(HashRing(nodes), b)
+    sig = {"service": service, "environment": env, "latency_ms": 5, "error": True}
+    for _ in range(10):
+        assert httpx.post(f"{a}/signal", json=sig).status_code == 200
+    # Both nodes answer from the owner's window
+    assert httpx.get(f"{b}/config/{service}/{env}").json()["log_level"] == "DEBUG"
+    assert httpx.get(f"{a}/config/{service}/{env}").json()["log_level"] == "DEBUG"
+    assert httpx.get(f"{a}/stats").json()["cluster_forwarded"] == 11
+    odd, odd_env = _odd_owned_by(HashRing(nodes), b)
+    assert httpx.get(f"{a}/config/{quote(odd, safe='')}/{odd_env}").json()["service"] == odd
+
+    # Batches, summaries, attrs and bulk lookups reach the owner too
+    local = _owned_by(HashRing(nodes), a)
+    batch = [{"service": s, "environment": e, "attrs": {"host": "h1"}} for s, e in (local, (service, env))]
+    assert httpx.post(f"{a}/signals", json=batch).json()["accepted"] == 2
+    summary = {"service": service, "environment": env, "count": 5, "errors": 1}
+    assert httpx.post(f"{a}/summaries", json=[summary]).json()["configs"][service][env]["log_level"] == "DEBUG"
+    assert httpx.get(f"{a}/attrs/{service}/{env}?key=host").json()["counts"] == {"h1": 1}
+    assert httpx.get(f"{b}/attrs/{local[0]}/{local[1]}?key=host").json()["counts"] == {"h1": 1}
+    bulk = {"keys": [{"service": service, "environment": env}], "service_prefix": "svc-"}
+    entries = httpx.post(f"{a}/configs", json=bulk).json()["entries"]
+    assert [(e["service"], e["environment"]) for e in entries] == [(service, env), local]
+    assert entries[0]["config"]["log_level"] == "DEBUG"
+
+    # When b leaves, a owns every key again and starts afresh
+    view = httpx.post(f"{a}/cluster/leave", json={"node": b}).json()
+    assert view["nodes"] == [a]
+    assert httpx.get(f"{a}/config/{service}/{env}").json()["log_level"] == "INFO"
+    # b was told as well, dropped the key and now sends it to a
+    assert httpx.get(f"{b}/cluster").json()["nodes"] == [a]
+    assert httpx.get(f"{b}/config/{service}/{env}").json()["log_level"] == "INFO"
+    assert httpx.get(f"{b}/stats").json()["cluster_forwarded"] >= 1
+
+
+def test_policy_reaches_every_node(nodes):
+    a, b = nodes
+    service, env = _owned_by(HashRing(nodes), b)
+    policy = httpx.get(f"{a}/policy").json()
+    policy["rules"].append({"id": "quiet", "service": service, "actions": {"log_level": "ERROR"}})
+    assert httpx.post(f"{a}/policy", json={"policy": policy}).status_code == 200
+    assert httpx.get(f"{b}/policy").json() == httpx.get(f"{a}/policy").json()
+    assert httpx.get(f"{b}/config/{service}/{env}", headers={"x-cp-forwarded": "1"}).json()["log_level"] == "ERROR"
+
+    # A node that joins later is brought up to date by the node it joined through
+    httpx.post(f"{a}/cluster/leave", json={"node": b})
+    policy["rules"][-1]["actions"]["log_level"] = "WARN"
+    httpx.post(f"{a}/policy", json={"policy": policy})
+    assert httpx.get(f"{b}/policy").json()["rules"][-1]["actions"]["log_level"] == "ERROR"
+    assert httpx.post(f"{a}/cluster/join", json={"node": b}).json()["nodes"] == sorted(nodes)
+    assert httpx.get(f"{b}/policy").json() == httpx.get(f"{a}/policy").json()
+    assert httpx.get(f"{b}/config/{service}/{env}").json()["log_level"] == "WARN"
@@ -0,0 +1,99 @@
+import asyncio
+import random
+from urllib.parse import quote
+
+import httpx
+
+from control_plane import edge, main
+from control_plane.clock import ManualClock
+from control_plane.edge import EdgeBuffer, merge_summaries
+from control_plane.models import SignalIn, SignalRecord
+
+
+def _signals(service, n, seed):
+    rng = random.Random(seed)
+    return [
+        SignalIn(service=service, environment="prod", latency_ms=rng.lognormvariate(4, 1), error=rng.random() < 0.05)
+        for _ in range(n)
+    ]
+
+
+def _summaries(signals):
+    buf = EdgeBuffer()
+    for sig in signals:
+        buf.add_signal(sig)
+    return buf.drain()
+
+
+def test_merge_is_associative_and_commutative():
+    a, b, c = (_summaries(_signals("s", 200, seed)) for seed in range(3))
+    left = merge_summaries(merge_summaries(a + b) + c)
+    right = merge_summaries(a + merge_summaries(c + b))
+    assert left == right == merge_summaries(a + b + c)
+    assert left[0].count == 600
+
+
+def test_central_evaluate_matches_raw_ingest(monkeypatch):
+    monkeypatch.setattr(main, "CLOCK", ManualClock(start_ms=5_000_000))
+    raw = _signals("raw", 500, seed=7)
+    now = main.CLOCK.now_ms()
+    main._ingest([SignalRecord(s.service, s.environment, now, s.latency_ms, s.error) for s in raw])
+    # The same traffic through two tiers of edges
+    tier1 = [_summaries([s.model_copy(update={"service": "tiered"}) for s in raw[i::3]]) for i in range(3)]
+    tier2 = merge_summaries([sm for part in tier1 for sm in part])
+    from fastapi.testclient import TestClient
+
+    TestClient(main.app).post("/summaries", json=[sm.model_dump() for sm in tier2])
+
+    for window in (10, 60, 300):
+        assert main._calc_aggregates(("tiered", "prod"), window, now) == main._calc_aggregates(("raw", "prod"), window, now)
+    assert main.evaluate("tiered", "prod") == main.evaluate("raw", "prod").model_copy(update={"service": "tiered"})
+
+
+def test_flush_forwards_summaries_and_caches_configs(monkeypatch):
+    monkeypatch.setattr(edge, "UPSTREAM", "http://upstream")
+    monkeypatch.setattr(edge, "BUFFER", EdgeBuffer())
+    monkeypatch.setattr(edge, "CONFIGS", {})
+    for sig in _signals("edge-svc", 50, seed=1):
+        edge.BUFFER.add_signal(sig.model_copy(update={"error": True}))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await edge.flush(client)
+
+    assert asyncio.run(scenario()) == 1
+    assert len(edge.BUFFER) == 0
+    assert edge._config("edge-svc", "prod").log_level == "DEBUG"
+
+
+def test_unavailable_summaries_stay_buffered(monkeypatch):
+    monkeypatch.setattr(edge, "BUFFER", EdgeBuffer())
+    monkeypatch.setattr(edge, "CONFIGS", {})
+    for service in ("up", "down"):
+        for sig in _signals(service, 10, seed=2):
+            edge.BUFFER.add_signal(sig)
+
+    def upstream(request):
+        body = {"accepted": 1, "configs": {"up": {"prod": {"service": "up", "environment": "prod"}}}}
+        return httpx.Response(200, json={**body, "unavailable": {"down": ["prod"]}})
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(upstream)) as client:
+            return await edge.flush(client)
+
+    assert asyncio.run(scenario()) == 1
+    assert [(sm.service, sm.count) for sm in edge.BUFFER.drain()] == [("down", 10)]
+
+
+def test_config_fetch_quotes_path_segments(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(edge, "UPSTREAM", "http://upstream")
+    monkeypatch.setattr(edge, "CONFIGS", {})
+    monkeypatch.setattr(edge, "CLIENT", httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app)))
+    service = "odd svc?v=1#x"
+    resp = TestClient(edge.app).get(f"/config/{quote(service, safe='')}/prod")
+    # Answered by the upstream's prod defaults, not the edge's fallback
+    assert resp.json() == {**resp.json(), "service": service, "trace_sample_rate": 0.2}
+    assert (service, "prod") in edge.CONFIGS
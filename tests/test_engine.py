@@ -1,8 +1,23 @@
-from control_plane.main import evaluate, SIGNALS, Signal, _now
+from control_plane import main
+from control_plane.clock import ManualClock
+from control_plane.main import evaluate, AGGREGATES, DECISIONS, SIGNALS, SignalRecord, _record
+
+_real_clock = main.CLOCK
 
 
 def setup_function(_):
     SIGNALS.clear()
+    AGGREGATES.clear()
+    DECISIONS.clear()
+    main.CLOCK = ManualClock(start_ms=1_000_000)
+
+
+def teardown_function(_):
+    main.CLOCK = _real_clock
+
+
+def _sig(svc, env, latency_ms, error=False):
+    return SignalRecord(svc, env, main.CLOCK.now_ms(), latency_ms, error)
 
 
 def test_defaults_prod():
@@ -15,21 +30,107 @@ def test_defaults_prod():
 def test_elevate_on_errors():
     # Generate 100 signals with 10% errors over recent window
     svc, env = "svc", "prod"
-    key = (svc, env)
     import random
 
     for i in range(100):
-        SIGNALS.setdefault(key, []).append(
-            Signal(
-                service=svc,
-                environment=env,
-                ts=_now(),
-                latency_ms=100 + random.random() * 50,
-                error=(i % 10 == 0),
-                attrs={},
-            )
-        )
+        _record(_sig(svc, env, 100 + random.random() * 50, error=(i % 10 == 0)))
     cfg = evaluate(svc, env)
     assert cfg.log_level == "DEBUG"
     assert cfg.trace_sample_rate >= 0.4
     assert cfg.metric_period_s <= 20
+
+
+def test_condition_window_excludes_older_errors():
+    # Errors two minutes ago are outside the 60s window of elevate-on-errors
+    svc, env = "svc", "prod"
+    for _ in range(100):
+        _record(_sig(svc, env, 100.0, error=True))
+    main.CLOCK.advance(120_000)
+    for _ in range(100):
+        _record(_sig(svc, env, 100.0))
+    cfg = evaluate(svc, env)
+    assert cfg.log_level == "INFO"
+    assert abs(cfg.trace_sample_rate - 0.2) < 1e-9
+
+
+def test_decision_reused_until_threshold_crossed():
+    svc, env = "svc", "prod"
+    for _ in range(100):
+        _record(_sig(svc, env, 100.0, error=False))
+    first = evaluate(svc, env)
+    _record(_sig(svc, env, 120.0, error=False))
+    assert evaluate(svc, env) is first
+
+    for _ in range(10):
+        _record(_sig(svc, env, 100.0, error=True))
+    crossed = evaluate(svc, env)
+    assert crossed is not first
+    assert crossed.log_level == "DEBUG"
+
+
+def test_decision_cache_counts_hits_and_misses():
+    from control_plane.main import STATS
+
+    hits, misses = STATS["decision_cache_hits"], STATS["decision_cache_misses"]
+    first = evaluate("svc", "staging")
+    for _ in range(5):
+        assert evaluate("svc", "staging") is first
+    assert STATS["decision_cache_misses"] == misses + 1
+    assert STATS["decision_cache_hits"] == hits + 5
+
+
+def test_decision_cache_evicts_least_recently_evaluated(monkeypatch):
+    monkeypatch.setattr(main, "DECISION_CACHE_MAX", 10)
+    for _ in range(10):
+        _record(_sig("busy", "prod", 100.0, error=True))
+    evaluate("busy", "prod")
+    for i in range(100):
+        evaluate(f"random-{i}", "prod")
+    assert len(DECISIONS) == 10
+    assert ("busy", "prod") not in DECISIONS
+    # Evicted keys are recomputed from their aggregates
+    assert evaluate("busy", "prod").log_level == "DEBUG"
+    assert next(reversed(DECISIONS)) == ("busy", "prod")
+
+
+def test_policy_upsert_compiles_and_swaps_plan():
+    from fastapi.testclient import TestClient
+
+    from control_plane import main
+
+    client = TestClient(main.app)
+    original, version = main.POLICY, main.PLAN.version
+    bad = {"id": "bad", "rules": [{"id": "r", "conditions": [{"kind": "metric", "op": "in"}], "actions": {}}]}
+    assert client.post("/policy", json={"policy": bad}).status_code == 422
+    assert main.PLAN.version == version
+
+    quiet = {"id": "quiet", "rules": [{"id": "r", "actions": {"log_level": "ERROR"}}]}
+    try:
+        assert client.post("/policy", json={"policy": quiet}).status_code == 200
+        assert main.PLAN.version == version + 1
+        assert evaluate("svc", "prod").log_level == "ERROR"
+    finally:
+        client.post("/policy", json={"policy": original.model_dump()})
+
+
+def test_large_windows_are_merged_off_the_loop(monkeypatch):
+    import asyncio
+
+    from control_plane.main import STATS
+
+    monkeypatch.setattr(main, "OFFLOAD_MIN_ENTRIES", 100)
+    offloaded = STATS["evaluations_offloaded"]
+    # Many signals at one latency fill a single sketch bin: cheap to merge
+    for i in range(500):
+        _record(_sig("flat", "prod", 100.0, error=i % 10 == 0))
+    inline = evaluate("flat", "prod")
+    DECISIONS.clear()
+    assert asyncio.run(main.evaluate_async("flat", "prod")) == inline
+    assert STATS["evaluations_offloaded"] == offloaded
+
+    for i in range(200):
+        _record(_sig("svc", "prod", float(i + 1), error=i % 10 == 0))
+    inline = evaluate("svc", "prod")
+    DECISIONS.clear()
+    assert asyncio.run(main.evaluate_async("svc", "prod")) == inline
+    assert STATS["evaluations_offloaded"] == offloaded + 1
@@ -0,0 +1,68 @@
+import random
+
+from control_plane.fleet import FleetEvaluator
+from control_plane.models import Action, Condition, Policy, Rule
+from control_plane.plan import compile_policy
+
+OPS = (">", ">=", "<", "<=", "==", "!=")
+
+
+def _random_policy(rng, services):
+    rules = []
+    for i in range(40):
+        conds = [
+            Condition(kind="error_rate", op=rng.choice(OPS), value=rng.choice((0.0, 0.1, 0.2, 0.5)), window_s=60),
+            Condition(kind="metric", op=rng.choice(OPS), key="latency_p95_ms", value=rng.choice((100, 200, 400))),
+        ][: rng.randint(0, 2)]
+        rules.append(
+            Rule(
+                id=f"r{i}",
+                service=rng.choice(services + [None, None]),
+                environment=rng.choice(["prod", "staging", None]),
+                priority=rng.randint(0, 50),
+                conditions=conds,
+                actions=Action(
+                    log_level=rng.choice([None, "DEBUG", "WARN"]),
+                    trace_sample_rate=rng.choice([None, 0.3, 0.9]),
+                    metric_period_s=rng.choice([None, 10, 30]),
+                ),
+            )
+        )
+    return Policy(id="p", rules=rules)
+
+
+def test_fleet_matches_per_key_decide():
+    rng = random.Random(5)
+    services = [f"s{i}" for i in range(20)]
+    fleet = FleetEvaluator()
+    values = {}
+    for svc in services:
+        for env in ("prod", "staging"):
+            fleet.key_id((svc, env))
+            values[(svc, env)] = {
+                "error_rate": rng.choice((0.0, 0.1, 0.15, 0.2, 0.7)),
+                "latency_p95_ms": rng.choice((50.0, 100.0, 200.0, 999.0)),
+            }
+
+    for version in range(1, 6):
+        plan = compile_policy(_random_policy(rng, services), version, 300)
+        fleet.load(plan.refs, lambda key, window_s: values[key])
+        result = fleet.evaluate(plan)
+        assert result.keys == len(values)
+        for key, v in values.items():
+            want = plan.decide(*key, lambda ref: v[ref.name])
+            assert fleet.config(key) == (want.log_level, want.trace_sample_rate, want.metric_period_s)
+
+
+def test_fleet_reports_changed_keys():
+    fleet = FleetEvaluator()
+    for key in (("a", "prod"), ("b", "prod"), ("a", "staging")):
+        fleet.key_id(key)
+    quiet = compile_policy(Policy(id="q", rules=[]), 1, 300)
+    assert len(fleet.evaluate(quiet).changed) == 3
+    assert fleet.evaluate(quiet).changed == []
+
+    prod = Policy(id="p", rules=[Rule(id="r", environment="prod", actions=Action(log_level="WARN"))])
+    result = fleet.evaluate(compile_policy(prod, 2, 300))
+    assert result.version == 2
+    assert result.changed == [("a", "prod"), ("b", "prod")]
@@ -0,0 +1,108 @@
+import os
+
+from fastapi.testclient import TestClient
+
+from control_plane import main
+from control_plane.aggregates import Bucket
+from control_plane.clock import ManualClock
+from control_plane.history import HistoryStore
+from control_plane.models import SignalRecord
+
+BASE = 1_700_000_000 - 1_700_000_000 % 86_400
+LEVELS = ((10, 3_600, 7_200), (60, 86_400, 30 * 86_400), (3_600, 30 * 86_400, 730 * 86_400))
+
+
+def _buckets(start, end, keys=("a", "b")):
+    for t in range(start, end, 10):
+        for k in keys:
+            b = Bucket(t)
+            for v in range(1, 11):
+                b.add(v * 10.0 + t % 7, v == 10)
+            yield (k, "prod"), BASE + t, b
+
+
+def _series(buckets):
+    return [(b.start, b.count, b.errors, b.latency.quantile(0.95)) for b in buckets]
+
+
+def test_rollups_match_before_and_after_compaction(tmp_path):
+    store = HistoryStore(str(tmp_path), LEVELS)
+    assert store.record(_buckets(0, 3 * 3_600), BASE + 3 * 3_600) == 2 * 1_080
+    # Passing the same buckets again appends nothing
+    assert store.record(_buckets(0, 3 * 3_600), BASE + 3 * 3_600) == 0
+    key = ("a", "prod")
+    before = {res: _series(store.query(key, BASE, BASE + 3 * 3_600, res)) for res in (10, 60, 3_600)}
+    assert [p[1:3] for p in before[3_600]] == [(3_600, 360)] * 3
+
+    # The first hour of 10s rows is past retention once rolled up
+    out = store.compact(BASE + 3 * 3_600)
+    assert out == {"rolled_up": 2 * 180 + 2 * 3, "partitions_dropped": 1}
+    for res in (60, 3_600):
+        assert _series(store.query(key, BASE, BASE + 3 * 3_600, res)) == before[res]
+    store.close()
+
+    # Reopened: watermarks come back from the files, and a torn write is cut off
+    part = tmp_path / "10s" / str(BASE + 2 * 3_600)
+    with open(part / "key", "ab") as f:
+        f.write(b"\x01\x00")
+    store = HistoryStore(str(tmp_path), LEVELS)
+    assert store.complete == {10: BASE + 3 * 3_600, 60: BASE + 3 * 3_600, 3_600: BASE + 3 * 3_600}
+    store.record(_buckets(3 * 3_600, 4 * 3_600), BASE + 4 * 3_600)
+    assert len(store.query(("b", "prod"), BASE, BASE + 4 * 3_600, 10)) == 1_080
+
+    assert store.compact(BASE + 4 * 3_600)["partitions_dropped"] == 1
+    assert sorted(os.listdir(tmp_path / "10s")) == [str(BASE + 2 * 3_600), str(BASE + 3 * 3_600)]
+    assert _series(store.query(key, BASE, BASE + 3 * 3_600, 3_600)) == before[3_600]
+    store.close()
+
+
+def test_key_queries_read_only_that_keys_rows(tmp_path):
+    keys = [f"k{i}" for i in range(20)]
+    store = HistoryStore(str(tmp_path), LEVELS)
+    store.record(_buckets(0, 2 * 3_600, keys), BASE + 2 * 3_600)
+    expected = [(BASE + t, 10, 1) for t in range(0, 2 * 3_600, 10)]
+
+    def query(key):
+        read = store.rows_read
+        series = [(b.start, b.count, b.errors) for b in store.query((key, "prod"), BASE, BASE + 2 * 3_600, 10)]
+        return series, store.rows_read - read
+
+    # A sealed partition and the one still being written
+    assert os.path.exists(tmp_path / "10s" / str(BASE) / "index_rows")
+    assert query("k7") == (expected, 720)
+    store.close()
+
+    # Reopened, and with the sealed partition's index lost: rebuilt on first use
+    os.remove(tmp_path / "10s" / str(BASE) / "index_keys")
+    store = HistoryStore(str(tmp_path), LEVELS)
+    assert query("k0") == (expected, 720)
+    assert query("k19") == (expected, 720)
+    assert query("missing") == ([], 0)
+    store.record(_buckets(2 * 3_600, 2 * 3_600 + 60, keys), BASE + 2 * 3_600 + 60)
+    assert query("k3")[1] == 720
+    store.close()
+
+
+def test_history_endpoint(tmp_path, monkeypatch):
+    clock = ManualClock(start_ms=1_000_000, wall_epoch_ms=BASE * 1000)
+    monkeypatch.setattr(main, "CLOCK", clock)
+    monkeypatch.setattr(main, "HISTORY", HistoryStore(str(tmp_path)))
+    main.AGGREGATES.clear()
+    main.SIGNALS.clear()
+    client = TestClient(main.app)
+    assert client.get("/history/h/prod", params={"resolution_s": 7}).status_code == 422
+
+    # Ten minutes, longer than WINDOW_MAX, flushed as the windows roll
+    for i in range(600):
+        main._ingest([SignalRecord("h", "prod", clock.now_ms(), 100.0, i % 10 == 0)])
+        clock.advance(1_000)
+        if i % 60 == 59:
+            main.flush_history()
+    body = client.get("/history/h/prod", params={"resolution_s": 60}).json()
+    assert body["resolution_s"] == 60
+    assert [p["count"] for p in body["points"]] == [60] * 10
+    assert body["points"][0]["error_rate"] == 0.1
+    assert abs(body["points"][0]["latency_p95_ms"] - 100) <= 1
+    assert body["points"][0]["ts"] == "2023-11-14T00:00:00"
+    assert len(client.get("/history/h/prod").json()["points"]) == 60
+    main.HISTORY.close()
@@ -0,0 +1,61 @@
+import asyncio
+
+from control_plane.ingest import IngestQueue
+from control_plane.models import SignalRecord
+
+
+def _sigs(n):
+    return [SignalRecord("s", "e", 0, float(i)) for i in range(n)]
+
+
+def _run(policy, maxsize=3, n=5):
+    applied = []
+
+    async def scenario():
+        q = IngestQueue(applied.extend, maxsize=maxsize, policy=policy, block_timeout_s=0.01)
+        q.start()
+        # The worker has not run yet, so the queue fills up
+        accepted = await q.put(_sigs(n))
+        await asyncio.sleep(0.05)
+        await q.stop()
+        return q, accepted
+
+    q, accepted = asyncio.run(scenario())
+    return q, accepted, [s.latency_ms for s in applied]
+
+
+def test_drop_newest_keeps_head():
+    q, accepted, applied = _run("drop_newest")
+    assert accepted == 3
+    assert applied == [0.0, 1.0, 2.0]
+    assert q.stats()["ingest_dropped"] == 2
+
+
+def test_drop_oldest_keeps_tail():
+    q, accepted, applied = _run("drop_oldest")
+    assert accepted == 5
+    assert applied == [2.0, 3.0, 4.0]
+    assert q.dropped == 2
+
+
+def test_block_waits_for_worker():
+    q, accepted, applied = _run("block")
+    assert accepted == 5
+    assert applied == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert q.dropped == 0
+
+
+def test_stop_applies_what_is_still_queued():
+    applied = []
+
+    async def scenario():
+        q = IngestQueue(applied.extend, maxsize=2_000, max_batch=300)
+        q.start()
+        assert await q.put(_sigs(1_000)) == 1_000
+        # Stopped before the worker ever ran
+        await q.stop()
+        return q
+
+    q = asyncio.run(scenario())
+    assert len(applied) == 1_000
+    assert (q.applied, q.dropped, q.stats()["ingest_queue_depth"]) == (1_000, 0, 0)
@@ -0,0 +1,40 @@
+from control_plane.intern import OVERFLOW_KEY, OVERFLOW_VALUE, AttrTable
+
+
+def test_identical_attrs_share_one_set():
+    table = AttrTable()
+    a = table.encode({"host": "h1", "zone": "z"})
+    b = table.encode({"zone": "z", "host": "h1"})
+    assert a == b != 0
+    assert table.encode({}) == table.encode(None) == 0
+    assert table.decode(a) == {"host": "h1", "zone": "z"}
+    assert len(table) == 2
+
+
+def test_codes_are_shared_across_keys_and_values():
+    table = AttrTable()
+    table.encode({"host": "h1"})
+    table.encode({"host": "h2"})
+    assert table.lookup("host") is not None
+    assert table.lookup("nope") is None
+    assert table.string(table.lookup("h2")) == "h2"
+    assert table.sets_with("host", "h2") == {2}
+
+
+def test_cardinality_caps_fold_into_overflow():
+    table = AttrTable(max_values=3, max_sets=10)
+    ids = [table.encode({"route": "/a", "request_id": f"r{i}"}) for i in range(100)]
+    assert len(set(ids)) == 4
+    assert table.decode(ids[-1]) == {"route": "/a", "request_id": OVERFLOW_VALUE}
+    # Values already seen keep their own sets
+    assert table.encode({"route": "/a", "request_id": "r1"}) == ids[1]
+    assert table.overflowed == 97
+
+    sets = [table.encode({f"k{i}": "v"}) for i in range(50)]
+    assert len(table) <= table.max_sets + 1
+    assert table.decode(sets[-1]) == {OVERFLOW_KEY: OVERFLOW_VALUE}
+    assert table.group({ids[-1]: 5, sets[-1]: 2}, "request_id") == {OVERFLOW_VALUE: 5}
+
+    loaded = AttrTable.load(table.dump(), max_values=3, max_sets=10)
+    assert loaded.encode({"route": "/a", "request_id": "r99"}) == ids[-1]
+    assert loaded.encode({"k99": "v"}) == sets[-1]
@@ -0,0 +1,20 @@
+import asyncio
+import time
+
+from control_plane.looplag import LoopLagMonitor
+
+
+def test_blocking_callback_shows_up_as_lag():
+    mon = LoopLagMonitor(interval_s=0.01)
+
+    async def scenario():
+        task = asyncio.create_task(mon.run())
+        await asyncio.sleep(0.03)
+        time.sleep(0.1)  # hold the loop
+        await asyncio.sleep(0.03)
+        task.cancel()
+
+    asyncio.run(scenario())
+    stats = mon.stats()
+    assert stats["loop_lag_max_ms"] >= 50
+    assert stats["loop_lag_p99_ms"] <= stats["loop_lag_max_ms"]
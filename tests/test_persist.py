@@ -0,0 +1,186 @@
+import math
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+from control_plane import main
+from control_plane.aggregates import WindowAggregates
+from control_plane.clock import ManualClock, MonotonicClock
+from control_plane.intern import AttrTable
+from control_plane.models import LatencyHistogram, SignalRecord, SummaryIn
+from control_plane.persist import (
+    REC_POLICY,
+    REC_SIGNALS,
+    REC_SUMMARY,
+    WriteAheadLog,
+    decode_policy,
+    decode_signals,
+    decode_summary,
+    encode_policy,
+    encode_snapshot,
+    load_snapshot,
+    read_log,
+    segments,
+    write_snapshot,
+)
+from control_plane.window import SignalWindow
+
+
+def test_log_round_trip_stops_at_torn_tail(tmp_path):
+    with pytest.raises(ValueError):
+        WriteAheadLog(str(tmp_path), fsync="sometimes")
+    wal = WriteAheadLog(str(tmp_path), fsync="always", wall_offset_ms=42)
+    signals = [
+        SignalRecord("a", "prod", 1_000, 12.5, True, {"region": "eu"}),
+        SignalRecord("a", "prod", 1_001, None, False, None),
+    ]
+    wal.append_signals(("a", "prod"), signals)
+    summary = SummaryIn(service="a", environment="prod", count=3, errors=1, latency=LatencyHistogram(bins={5: 3}))
+    wal.append_summary(2_000, summary)
+    wal.append_policy(7, b'{"id": "p"}')
+    wal.commit()
+    wal.close()
+    # A crash mid-write: half of the last record made it to disk
+    path = tmp_path / f"wal-{segments(str(tmp_path))[-1]:012d}.log"
+    path.write_bytes(path.read_bytes()[:-5])
+
+    records = list(read_log(str(tmp_path)))
+    assert [r.rtype for r in records] == [REC_SIGNALS, REC_SUMMARY]
+    assert records[0].wall_offset_ms == 42
+    assert decode_signals(records[0].payload) == (("a", "prod"), signals)
+    assert decode_signals(records[0].payload, shift_ms=10)[1][0].ts_ms == 1_010
+    assert decode_summary(records[1].payload) == (2_000, summary)
+
+    # Reopening starts a new segment rather than appending after the torn tail
+    wal = WriteAheadLog(str(tmp_path))
+    wal.append_policy(8, b"{}")
+    wal.close()
+    assert decode_policy(list(read_log(str(tmp_path)))[-1].payload) == (8, b"{}")
+    assert len(segments(str(tmp_path))) == 2
+
+
+def test_snapshot_round_trip(tmp_path):
+    attrs = AttrTable()
+    agg = WindowAggregates()
+    window = SignalWindow()
+    for i in range(300):
+        ts = 1_000_000 + i * 700
+        window.append(ts, float(i % 50), i % 7 == 0, attrs.encode({"pod": f"p{i % 3}"}))
+        agg.add(ts, float(i % 50), i % 7 == 0)
+    window.prune(1_000_000 + 100 * 700)
+    chunks = encode_snapshot(3, 99, 5, b'{"id": "x"}', attrs, [(("s", "prod"), agg, window)])
+    write_snapshot(str(tmp_path), 3, chunks)
+
+    snap = load_snapshot(str(tmp_path))
+    assert (snap.wal_seq, snap.wall_offset_ms, snap.policy_version, snap.policy) == (3, 99, 5, b'{"id": "x"}')
+    loaded = snap.attrs()
+    [(key, agg2, window2)] = list(snap.keys())
+    snap.close()
+    assert key == ("s", "prod")
+    assert list(window2) == list(window)
+    assert loaded.group(window2.attr_histogram(), "pod") == attrs.group(window.attr_histogram(), "pod")
+    assert loaded.encode({"pod": "p1"}) == attrs.encode({"pod": "p1"})
+    now = 1_000_000 + 300 * 700
+    for w in (10, 60, 300):
+        a, b = agg.query(now, w), agg2.query(now, w)
+        assert (a.count, a.errors, a.latency.quantile(0.95)) == (b.count, b.errors, b.latency.quantile(0.95))
+
+    # A corrupt newer snapshot is skipped for the older one
+    (tmp_path / "snapshot-000000000009.bin").write_bytes(b"CPSNAP01" + bytes(40))
+    assert load_snapshot(str(tmp_path)).wal_seq == 3
+
+
+def _restart(monkeypatch, plan):
+    # What a fresh process starts with
+    main.SIGNALS.clear()
+    main.AGGREGATES.clear()
+    main.DECISIONS.clear()
+    monkeypatch.setattr(main, "ATTRS", AttrTable())
+    monkeypatch.setattr(main, "PLAN", plan)
+    monkeypatch.setattr(main, "POLICY", plan.policy)
+
+
+@pytest.mark.parametrize("graceful", [True, False])
+def test_restart_is_warm(tmp_path, monkeypatch, graceful):
+    clock = ManualClock(start_ms=10_000_000)
+    monkeypatch.setattr(main, "CLOCK", clock)
+    monkeypatch.setattr(main, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "SNAPSHOT_INTERVAL_S", 0)
+    default_plan = main.PLAN
+    _restart(monkeypatch, default_plan)
+
+    policy = main.POLICY.model_copy(deep=True)
+    policy.rules[0].actions.trace_sample_rate = 0.9
+    with TestClient(main.app) as c:
+        assert c.post("/policy", json={"policy": policy.model_dump()}).status_code == 200
+        for i in range(40):
+            sig = {"service": "w", "environment": "prod", "latency_ms": 10 + i, "error": i % 4 == 0}
+            c.post("/signals", json=[{**sig, "attrs": {"pod": str(i % 2)}}])
+            clock.advance(1_000)
+        c.post("/summaries", json=[{"service": "w", "environment": "prod", "count": 10, "errors": 0}])
+        before = c.get("/config/w/prod").json()
+        aggregates = main._calc_aggregates(("w", "prod"), 60, clock.now_ms())
+        if not graceful:
+            # Crash image: whatever the log had written when the process died
+            main.WAL.flush()
+            shutil.copytree(tmp_path, tmp_path / "crash")
+    if not graceful:
+        monkeypatch.setattr(main, "DATA_DIR", str(tmp_path / "crash"))
+    assert (load_snapshot(main.DATA_DIR) is not None) == graceful
+
+    _restart(monkeypatch, default_plan)
+    with TestClient(main.app) as c:
+        assert c.get("/config/w/prod").json() == before
+        assert before["trace_sample_rate"] == 0.9
+        assert c.get("/attrs/w/prod", params={"key": "pod"}).json()["counts"] == {"0": 20, "1": 20}
+        assert main._calc_aggregates(("w", "prod"), 60, clock.now_ms()) == aggregates
+
+
+# A node that is killed right after answering, with no shutdown snapshot
+_CRASHING_NODE = """
+import os
+from fastapi.testclient import TestClient
+from control_plane import main
+
+with TestClient(main.app) as c:
+    bad = '[{"service": "w", "environment": "prod", "latency_ms": Infinity}]'
+    codes = [c.post("/signals", content=bad, headers={"content-type": "application/json"}).status_code]
+    codes.append(c.post("/signals", json=[{"service": "w", "environment": "prod", "latency_ms": 5}]).status_code)
+    print(codes, flush=True)
+    os._exit(0)
+"""
+
+
+def test_restart_after_crash_skips_invalid_records(tmp_path, monkeypatch):
+    env = {**os.environ, "CP_DATA_DIR": str(tmp_path), "CP_WAL_FSYNC": "always", "CP_SNAPSHOT_INTERVAL_S": "0"}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.run([sys.executable, "-c", _CRASHING_NODE], env=env, cwd=root, capture_output=True, text=True)
+    assert out.stdout.strip() == "[422, 200]", out.stderr
+    rec = next(read_log(str(tmp_path)))
+    _, [good] = decode_signals(rec.payload)
+    assert good.latency_ms == 5.0
+
+    # Records an older version could have written: they must not stop a restart
+    wal = WriteAheadLog(str(tmp_path), fsync="always", wall_offset_ms=rec.wall_offset_ms)
+    wal.append_signals(("w", "prod"), [good._replace(latency_ms=math.inf)])
+    wal.append(REC_SUMMARY, bytes(8) + b"{not json")
+    wal.append(REC_POLICY, encode_policy(10**6, b'{"rules": 1}'))
+    wal.append_signals(("w", "prod"), [good])
+    wal.commit()
+    wal.close()
+
+    monkeypatch.setattr(main, "CLOCK", MonotonicClock())
+    monkeypatch.setattr(main, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "SNAPSHOT_INTERVAL_S", 0)
+    restored = []
+    monkeypatch.setattr(main, "restore", lambda d, restore=main.restore: restored.append(restore(d)) or restored[-1])
+    _restart(monkeypatch, main.PLAN)
+    with TestClient(main.app) as c:
+        assert c.get("/config/w/prod").status_code == 200
+        assert [s.latency_ms for s in main.SIGNALS[("w", "prod")]] == [5.0, 5.0]
+    assert restored[0]["skipped_records"] == 3
+    assert restored[0]["replayed_signals"] == 2
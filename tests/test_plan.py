@@ -0,0 +1,76 @@
+import pytest
+
+from control_plane.models import Action, Condition, Policy, Rule
+from control_plane.plan import AggregateRef, compile_policy
+
+
+def _rule(id, priority=100, conditions=(), **actions):
+    return Rule(id=id, priority=priority, conditions=list(conditions), actions=Action(**actions))
+
+
+def test_rules_sorted_and_disabled_or_unsupported_dropped():
+    policy = Policy(
+        id="p",
+        rules=[
+            _rule("late", 50, log_level="WARN"),
+            _rule("early", 5, log_level="DEBUG"),
+            Rule(id="off", enabled=False, actions=Action(log_level="ERROR")),
+            _rule("flag", 1, [Condition(kind="feature_flag", op="==", key="x")], log_level="ERROR"),
+        ],
+    )
+    plan = compile_policy(policy, 3, 300)
+    assert plan.version == 3
+    assert [r.id for r in plan.rules] == ["early", "late"]
+    assert plan.decide("svc", "prod", lambda ref: 0.0).log_level == "WARN"
+
+
+def test_conditions_resolve_refs_and_clamp_windows():
+    cond = [
+        Condition(kind="error_rate", op=">", value=0.1, window_s=60),
+        Condition(kind="metric", op=">=", key="latency_p95_ms", value=200, window_s=3600),
+    ]
+    plan = compile_policy(Policy(id="p", rules=[_rule("r", conditions=cond, trace_sample_rate=1.0)]), 1, 300)
+    assert plan.refs == (AggregateRef("error_rate", 60), AggregateRef("latency_p95_ms", 300))
+
+    values = {AggregateRef("error_rate", 60): 0.5, AggregateRef("latency_p95_ms", 300): 200.0}
+    assert plan.decide("svc", "prod", values.__getitem__).trace_sample_rate == 1.0
+    values[AggregateRef("error_rate", 60)] = 0.05
+    assert plan.decide("svc", "prod", values.__getitem__).trace_sample_rate == 0.1
+
+
+def test_unsupported_op_is_rejected():
+    cond = [Condition(kind="metric", op="in", key="latency_p95_ms", value=1)]
+    with pytest.raises(ValueError):
+        compile_policy(Policy(id="p", rules=[_rule("r", conditions=cond)]), 1, 300)
+
+
+def test_scope_index_merges_scopes_in_priority_order():
+    policy = Policy(
+        id="p",
+        rules=[
+            Rule(id="exact", service="a", environment="prod", priority=30, actions=Action()),
+            Rule(id="svc", service="a", priority=10, actions=Action()),
+            Rule(id="env", environment="prod", priority=20, actions=Action()),
+            Rule(id="all", priority=40, actions=Action()),
+            Rule(id="other", service="b", priority=0, actions=Action()),
+        ],
+    )
+    plan = compile_policy(policy, 1, 300)
+    ids = [r.id for r in plan.scopes.candidates("a", "prod")]
+    assert ids == ["svc", "env", "exact", "all"]
+    assert [r.id for r in plan.scopes.candidates("b", "staging")] == ["other", "all"]
+    assert plan.scopes.candidates("a", "prod") is plan.scopes.candidates("a", "prod")
+    for svc, env in (("a", "prod"), ("b", "staging"), ("c", "dev")):
+        assert list(plan.scopes.candidates(svc, env)) == [r for r in plan.rules if r.in_scope(svc, env)]
+
+
+def test_bands_capture_every_comparison_outcome():
+    ref = AggregateRef("error_rate", 60)
+    rules = [
+        _rule(f"r{t}", conditions=[Condition(kind="error_rate", op=">=", value=t, window_s=60)])
+        for t in (0.1, 0.05, 0.1)
+    ]
+    plan = compile_policy(Policy(id="p", rules=rules), 1, 300)
+    assert plan.thresholds[ref] == (0.05, 0.1)
+    assert [plan.band(ref, v) for v in (0.0, 0.05, 0.07, 0.1, 0.5)] == [0, 1, 2, 3, 4]
+    assert plan.bands("svc", "prod", lambda r: 0.07) == (2,)
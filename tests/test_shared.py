@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+
+import pytest
+
+from control_plane.aggregates import WindowAggregates
+from control_plane.shared import SharedStore
+
+
+@pytest.fixture
+def store():
+    s = SharedStore(f"cp-test-{os.getpid()}", n_keys=8)
+    yield s
+    s.close()
+    s.unlink()
+
+
+def _ingest(name, n):
+    s = SharedStore(name, n_keys=8)
+    agg = s.aggregates(("svc", "prod"), create=True)
+    for i in range(n):
+        agg.add(1_000_000 + i, float(i % 100 + 1), i % 10 == 0)
+    s.close()
+
+
+def test_attached_stores_see_the_same_windows(store):
+    other = SharedStore(store.name, n_keys=8)
+    try:
+        agg = store.aggregates(("svc", "prod"), create=True)
+        assert other.aggregates(("svc", "dev")) is None
+        local = WindowAggregates()
+        signals = [(1_000_000 + 10 * i, float(i % 500 + 1), i % 20 == 0) for i in range(3000)]
+        agg.add_many(signals)
+        local.add_many(signals)
+
+        seen = other.aggregates(("svc", "prod"))
+        assert seen.generation == agg.generation > 0
+        now = 1_000_000 + 30_000
+        for window in (10, 60, 300):
+            a, b = seen.query(now, window), local.query(now, window)
+            assert (a.count, a.errors) == (b.count, b.errors)
+            assert a.latency.quantile(0.95) == pytest.approx(b.latency.quantile(0.95), rel=0.05)
+        assert other.keys() == [("svc", "prod")]
+    finally:
+        other.close()
+
+
+def test_policy_version_is_shared(store):
+    other = SharedStore(store.name, n_keys=8)
+    try:
+        assert other.policy_version() == 0
+        assert store.publish_policy(b'{"id": "p"}', 2) == 2
+        assert other.publish_policy(b'{"id": "q"}', 2) == 3
+        assert store.policy() == (3, b'{"id": "q"}')
+    finally:
+        other.close()
+
+
+def test_workers_ingest_concurrently(store):
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_ingest, args=(store.name, 2000)) for _ in range(3)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(30)
+    b = store.aggregates(("svc", "prod")).query(1_002_000, 60)
+    assert (b.count, b.errors) == (6000, 600)
+
+
+def test_layout_mismatch_is_rejected(store):
+    with pytest.raises(ValueError):
+        SharedStore(store.name, n_keys=16)
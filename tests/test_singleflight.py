@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from control_plane.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    calls = []
+
+    async def scenario():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", lambda: calls.append(1) or len(calls)) for _ in range(5)))
+        # A later caller starts a new flight
+        again = await flight.do("k", lambda: calls.append(1) or len(calls))
+        return flight, results, again
+
+    flight, results, again = asyncio.run(scenario())
+    assert results == [1] * 5
+    assert again == 2
+    assert flight.stats() == {"evaluations_run": 2, "evaluations_coalesced": 4}
+
+
+def test_followers_see_leader_exception():
+    def boom():
+        raise RuntimeError("boom")
+
+    async def scenario():
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do("k", boom) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    with pytest.raises(RuntimeError):
+        asyncio.run(SingleFlight().do("k", boom))
@@ -0,0 +1,56 @@
+import random
+
+from control_plane.sketch import MAX_VALUE, MIN_VALUE, ExactSketch, LatencySketch, index_range
+
+
+def test_quantile_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5, 1) for _ in range(5000)]
+    approx, exact = LatencySketch(0.01), ExactSketch()
+    for v in values:
+        approx.add(v)
+        exact.add(v)
+
+    for q in (0.5, 0.9, 0.95, 0.99):
+        want = exact.quantile(q)
+        assert abs(approx.quantile(q) - want) <= 0.01 * want
+
+
+def test_merge():
+    a, b = LatencySketch(), LatencySketch()
+    for v in (10.0, 20.0, 30.0):
+        a.add(v)
+    b.add(1000.0)
+    a.merge(b)
+    assert a.count == 4
+    assert a.quantile(1.0) > 900
+
+
+def test_exact_matches_sorted_index():
+    s = ExactSketch()
+    for v in (5.0, 1.0, 3.0, 2.0, 4.0):
+        s.add(v)
+    assert s.quantile(0.95) == 4.0
+
+
+def test_add_bins_rebuckets_other_accuracy():
+    coarse = LatencySketch(0.05)
+    for v in (10.0, 100.0, 1000.0):
+        coarse.add(v)
+    fine = LatencySketch(0.01)
+    fine.add_bins(coarse.relative_accuracy, 2, coarse.bins)
+    assert fine.count == 5
+    assert fine.quantile(0.0) == 0.0
+    assert abs(fine.quantile(1.0) - 1000.0) <= 0.06 * 1000.0
+
+
+def test_huge_values_land_in_the_top_bucket():
+    s = LatencySketch()
+    s.add(1e300)
+    s.add(MAX_VALUE * 10)
+    lo, hi = index_range(s.relative_accuracy)
+    assert list(s.bins) == [hi]
+    assert abs(s.quantile(1.0) - MAX_VALUE) <= 0.01 * MAX_VALUE
+    assert s.bins == {hi: 2}
+    s.add(MIN_VALUE * 1.001)
+    assert min(s.bins) >= lo
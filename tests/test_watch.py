@@ -0,0 +1,81 @@
+import asyncio
+
+from control_plane.models import EffectiveConfig
+from control_plane.watch import ConfigWatch
+
+KEY = ("svc", "prod")
+
+
+def _cfg(level="INFO"):
+    return EffectiveConfig(service="svc", environment="prod", log_level=level)
+
+
+def test_version_bumps_only_on_change():
+    w = ConfigWatch(clock_us=lambda: 0)
+    assert w.publish(KEY, _cfg()) == 1
+    assert w.publish(KEY, _cfg()) == 1
+    assert w.publish(KEY, _cfg("DEBUG")) == 2
+    assert w.current(KEY).config.log_level == "DEBUG"
+    assert w.current(KEY).etag.startswith('"2-')
+
+
+def test_wait_wakes_on_publish_and_times_out():
+    w = ConfigWatch(clock_us=lambda: 0)
+    w.publish(KEY, _cfg())
+
+    async def scenario():
+        # A stale version returns straight away
+        assert (await w.wait(KEY, 7, 1.0))[0] == 1
+        assert await w.wait(KEY, 1, 0.01) is None
+        waiter = asyncio.create_task(w.wait(KEY, 1, 1.0))
+        await asyncio.sleep(0)
+        assert w.watched() == [KEY]
+        w.publish(KEY, _cfg("WARN"))
+        latest = await waiter
+        assert (latest.version, latest.config.log_level) == (2, "WARN")
+        assert w.watched() == []
+
+    asyncio.run(scenario())
+
+
+def test_discard_waits_for_watchers_and_keeps_versions_rising():
+    w = ConfigWatch(clock_us=lambda: 0)
+    w.publish(KEY, _cfg())
+    w.publish(KEY, _cfg("DEBUG"))
+    w.discard(KEY)
+    assert w.current(KEY) is None
+    assert w.publish(KEY, _cfg("DEBUG")) == 3
+
+    async def scenario():
+        waiter = asyncio.create_task(w.wait(KEY, 3, 0.01))
+        await asyncio.sleep(0)
+        w.discard(KEY)
+        assert w.current(KEY) is not None
+        assert await waiter is None
+        assert w.current(KEY) is None
+
+    asyncio.run(scenario())
+
+
+def test_release_wakes_watchers_with_nothing():
+    w = ConfigWatch(clock_us=lambda: 0)
+    w.publish(KEY, _cfg())
+
+    async def scenario():
+        waiter = asyncio.create_task(w.wait(KEY, 1, 1.0))
+        await asyncio.sleep(0)
+        w.release(KEY)
+        assert await waiter is None
+        assert w.current(KEY) is None and w.keys() == []
+        assert w.publish(KEY, _cfg()) == 2
+
+    asyncio.run(scenario())
+
+
+def test_versions_are_not_reused_by_a_restarted_process():
+    before = ConfigWatch()
+    held = before.publish(KEY, _cfg("DEBUG"))
+    # A fresh process publishing a different config never hands out the held version
+    after = ConfigWatch()
+    assert after.publish(KEY, _cfg()) > held
+    assert after.publish(("other", "prod"), _cfg()) > after.current(KEY).version
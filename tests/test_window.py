@@ -0,0 +1,61 @@
+from control_plane.window import SignalWindow
+
+
+def test_prune_drops_only_expired_head():
+    w = SignalWindow()
+    for i in range(10):
+        w.append(100 + i, 1.0, False)
+
+    assert w.prune(104) == 4
+    assert len(w) == 6
+    assert [e.ts_ms for e in w] == [104, 105, 106, 107, 108, 109]
+
+
+def test_prune_empty_and_fully_expired():
+    w = SignalWindow()
+    assert w.prune(100) == 0
+    w.append(100, None, None)
+    assert w.prune(101) == 1
+    assert len(w) == 0
+
+
+def test_columns_survive_wraparound_growth_and_shrink():
+    w = SignalWindow()
+    n = 0
+    # Interleave appends and prunes so the ring wraps before it grows
+    for _ in range(3):
+        for _ in range(50):
+            w.append(n, None if n % 3 == 0 else float(n), n % 7 == 0, n if n % 2 else 0)
+            n += 1
+        w.prune(n - 30)
+    for _ in range(200):
+        w.append(n, float(n), n % 7 == 0)
+        n += 1
+    assert w.capacity > SignalWindow.MIN_CAPACITY
+
+    entries = list(w)
+    assert [e.ts_ms for e in entries] == list(range(n - 230, n))
+    for e in entries:
+        t = e.ts_ms
+        assert e.error == (t % 7 == 0)
+        assert e.latency_ms == (None if t < 150 and t % 3 == 0 else float(t))
+        assert e.attrs_id == (t if t < 150 and t % 2 else 0)
+
+    w.prune(n - 10)
+    assert len(w) == 10
+    assert w.capacity < 256
+    assert [e.error for e in w] == [t % 7 == 0 for t in range(n - 10, n)]
+
+
+def test_attr_histogram_and_filter():
+    from control_plane.intern import AttrTable
+
+    table = AttrTable()
+    w = SignalWindow()
+    for i in range(30):
+        w.append(i, 1.0, False, table.encode({"host": f"h{i % 3}", "zone": "a"} if i % 5 else {}))
+
+    assert table.group(w.attr_histogram(), "host") == {"h0": 8, "h1": 8, "h2": 8}
+    assert w.count_attrs(table.sets_with("host", "h1")) == 8
+    assert w.count_attrs(table.sets_with("zone", "a")) == 24
+    assert w.count_attrs(table.sets_with("host", "missing")) == 0